@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from datetime import timedelta
+from decimal import Decimal
 import os
 import cloudinary
 from pathlib import Path
@@ -34,6 +35,27 @@ ALLOWED_HOSTS = []
 
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID') 
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
+RAZORPAY_WEBHOOK_SECRET = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+
+# "razorpay", or "local" for the offline stand-in used in load tests.
+PAYMENT_GATEWAY = os.getenv('PAYMENT_GATEWAY', 'razorpay')
+PAYMENT_GATEWAY_TIMEOUT = (3.05, 10)  # connect, read seconds
+PAYMENT_GATEWAY_RETRIES = 2
+
+# Seconds a POS Idempotency-Key (and its stored response) is honoured.
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+
+# Where prebuilt full-catalog snapshots for device downloads are written.
+CATALOG_SNAPSHOT_DIR = os.getenv('CATALOG_SNAPSHOT_DIR', BASE_DIR / 'var' / 'catalog')
+
+# Loyalty points earned per unit of currency paid, the currency a point is
+# worth when redeemed, and how many days earned points last.
+LOYALTY_EARN_RATE = Decimal(os.getenv('LOYALTY_EARN_RATE', '0.01'))
+LOYALTY_POINT_VALUE = Decimal(os.getenv('LOYALTY_POINT_VALUE', '1'))
+LOYALTY_EXPIRY_DAYS = int(os.getenv('LOYALTY_EXPIRY_DAYS', 365))
+
+# Country code assumed for customer phone numbers entered without one.
+DEFAULT_PHONE_COUNTRY_CODE = os.getenv('DEFAULT_PHONE_COUNTRY_CODE', '91')
 
 # Application definition
 
@@ -0,0 +1,247 @@
+"""
+Synthetic data generators used by the benchmark and load-testing commands.
+
+Every generator takes a ``random.Random`` instance so that a given seed
+always produces the same tenant layout, catalog and order history.
+"""
+import csv
+import io
+from decimal import Decimal
+
+from django.db import connection
+
+from business.models import Business, Branch
+from customer.contacts import normalize_phone
+from customer.models import Customer
+from features.models import Category, Brand, Item, Order, OrderItem
+from features.tax import apply_order_tax
+from users.models import User, Contact
+
+
+BENCH_PIN = "4321"
+
+
+def make_business(rng, index, branches=1):
+    """
+    Create an active business, its default branch (via ``Business.save``)
+    and ``branches - 1`` extra branches. Returns ``(business, [branches])``.
+    """
+    # Business.save derives the default branch code from the first three
+    # characters of the name, so keep that prefix unique per index.
+    business = Business.objects.create(
+        business_name=f"{index:03d} Bench Business",
+        brand_name=f"Bench Brand {index}",
+        business_type=rng.choice([choice for choice, _ in Business.BUSINESS_TYPES]),
+        account_number=f"AC{index:08d}",
+        is_active=True,
+    )
+    all_branches = [Branch.objects.get(business=business, is_default=True)]
+    for number in range(1, branches):
+        all_branches.append(Branch.objects.create(
+            branch_name=f"{business.business_name} - Branch {number}",
+            branch_code=f"BN{index:04d}{number:04d}",
+            business=business,
+            status='active',
+        ))
+    return business, all_branches
+
+
+def make_cashier(rng, business, branch, pin=BENCH_PIN):
+    """Create an active cashier with a registered device for ``branch``."""
+    contact = Contact.objects.create(email=f"cashier{branch.id}@bench.local")
+    return User.objects.create_user(
+        user_id=f"{branch.id}_bench_cashier",
+        pin=pin,
+        first_name="Bench",
+        last_name="Cashier",
+        role="cashier",
+        business=business,
+        branch=branch,
+        contact=contact,
+        device_key=f"DCB{branch.id:07d}",
+        device_label="Bench Till",
+        is_active=True,
+    )
+
+
+def make_items(rng, count, categories=10, brands=5):
+    """Create ``count`` catalog items spread over categories and brands."""
+    category_objs = Category.objects.bulk_create(
+        [Category(name=f"Category {n}") for n in range(categories)]
+    )
+    brand_objs = Brand.objects.bulk_create(
+        [Brand(name=f"Brand {n}") for n in range(brands)]
+    )
+    items = []
+    for n in range(count):
+        price = Decimal(rng.randint(1000, 50000)) / 100
+        items.append(Item(
+            item_name=f"Bench Item {n}",
+            short_name=f"BI{n}",
+            sku_code=f"SKU{n:06d}",
+            barcode=f"890{n:010d}",
+            tax_code="GST",
+            nature_of_item="Goods",
+            category=rng.choice(category_objs),
+            item_brand=rng.choice(brand_objs),
+            mrp=price,
+            selling_price=price,
+            includes_tax=True,
+            tax_rate=rng.choice([0, 5, 12, 18]),
+            not_eligible_for_discount=False,
+        ))
+    return Item.objects.bulk_create(items)
+
+
+def phone_number(serial):
+    """
+    A mobile number that differs for every ``serial`` below 999999937:
+    multiplying by a constant modulo a prime never maps two serials to the
+    same value. Customer phones must be unique per branch.
+    """
+    return f"9{(serial + 1) * 48271 % 999999937:09d}"
+
+
+def make_customers(rng, branch, count):
+    """Create ``count`` customers registered at ``branch``."""
+    customers = []
+    for n in range(count):
+        phone = phone_number(n)
+        customers.append(Customer(
+            id=f"C{branch.id}-{n:06d}",
+            branch=branch,
+            first_name=rng.choice(["Asha", "Ravi", "Meena", "Arjun", "Divya", "Karthik"]),
+            last_name=f"Bench{n}",
+            phone_number=phone,
+            phone_e164=normalize_phone(phone),
+        ))
+    return Customer.objects.bulk_create(customers)
+
+
+def make_orders(rng, customers, items, count, lines=(1, 5)):
+    """
+    Create ``count`` paid, closed orders with ``lines`` (min, max) order
+    lines each, drawn from ``customers`` and ``items``.
+    """
+    orders = []
+    for _ in range(count):
+        customer = rng.choice(customers)
+        orders.append(Order(
+            customer=customer,
+            branch_id=customer.branch_id,
+            status='closed',
+            is_paid=True,
+            payment_mode=rng.choice(['cash', 'card', 'upi']),
+        ))
+    orders = Order.objects.bulk_create(orders)
+    order_items = []
+    for order in orders:
+        for item in rng.sample(items, min(len(items), rng.randint(*lines))):
+            order_items.append(OrderItem(
+                order=order,
+                item=item,
+                quantity=rng.randint(1, 3),
+                price=item.selling_price,
+            ))
+    OrderItem.objects.bulk_create(order_items)
+    apply_order_tax([order.id for order in orders])
+    return orders
+
+
+# --- Bulk loading ----------------------------------------------------------
+#
+# The helpers below back the ``seed_load`` command. Rows are plain tuples in
+# the order of the ``columns`` passed alongside them, so the same generator
+# output can be streamed through COPY on PostgreSQL or fed to bulk_create on
+# other databases.
+
+# Relative order volume per hour of day (0-23): quiet mornings, lunch and
+# dinner peaks.
+HOURLY_PROFILE = [
+    1, 1, 1, 1, 1, 1, 2, 4, 6, 7, 8, 10,
+    14, 15, 11, 8, 7, 9, 12, 15, 14, 10, 5, 2,
+]
+
+
+def parse_range(value):
+    """Parse ``"min:max"`` (or a single ``"n"``) into an inclusive int pair."""
+    low, _, high = str(value).partition(':')
+    low = int(low)
+    high = int(high) if high else low
+    if low > high:
+        raise ValueError(f"Invalid range {value!r}")
+    return low, high
+
+
+def parse_mix(value):
+    """Parse ``"cash:50,card:30"`` into ``(choices, cumulative_weights)``."""
+    choices, weights = [], []
+    for part in value.split(','):
+        name, _, weight = part.partition(':')
+        choices.append(name.strip())
+        weights.append(float(weight or 1))
+    return choices, cumulative(weights)
+
+
+def zipf_weights(count, skew):
+    """Cumulative Zipf-like weights; ``skew=0`` is a uniform distribution."""
+    return cumulative([1 / (rank ** skew) for rank in range(1, count + 1)])
+
+
+def cumulative(weights):
+    total = 0
+    out = []
+    for weight in weights:
+        total += weight
+        out.append(total)
+    return out
+
+
+def reserve_ids(model, count):
+    """
+    Reserve ``count`` consecutive primary keys for ``model`` and return the
+    first one. On PostgreSQL the id sequence is advanced so rows inserted
+    with explicit ids never collide with later ORM inserts. Run the bulk
+    loader against a quiet database.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(
+                f"SELECT setval(%s, GREATEST(nextval(%s), (SELECT COALESCE(MAX(id), 0) + 1 FROM {table})) + %s - 1)",
+                [sequence, sequence, count],
+            )
+            return cursor.fetchone()[0] - count + 1
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        return cursor.fetchone()[0] + 1
+
+
+def write_rows(model, columns, rows, use_copy=True):
+    """
+    Insert ``rows`` (tuples ordered like ``columns``) into ``model``'s table,
+    with COPY on PostgreSQL and bulk_create elsewhere. ``columns`` are model
+    attnames (e.g. ``customer_id``). Returns the number of rows written.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    if use_copy and connection.vendor == 'postgresql':
+        fields = {field.attname: field.column for field in model._meta.concrete_fields}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if value is None else value for value in row])
+        buffer.seek(0)
+        column_sql = ', '.join(connection.ops.quote_name(fields[name]) for name in columns)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(model._meta.db_table)} ({column_sql}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+    else:
+        model.objects.bulk_create([model(**dict(zip(columns, row))) for row in rows], batch_size=5000)
+    return len(rows)
@@ -0,0 +1,148 @@
+"""
+Payment gateways.
+
+``get_gateway()`` returns the process-wide gateway selected by the
+``PAYMENT_GATEWAY`` setting: ``razorpay`` for the real service or ``local``
+for an in-process stand-in that needs no network access (load tests,
+offline development). Both verify payment signatures locally with HMAC;
+only creating a gateway order talks to the network.
+"""
+import functools
+import hashlib
+import hmac
+import uuid
+
+import razorpay
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+GATEWAYS = {
+    'razorpay': 'cashflow.gateways.RazorpayGateway',
+    'local': 'cashflow.gateways.LocalGateway',
+}
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or refused the request."""
+
+
+class SignatureError(GatewayError):
+    """A payment or webhook signature did not match."""
+
+
+def _signature(secret, message):
+    return hmac.new(secret.encode(), message.encode() if isinstance(message, str) else message, hashlib.sha256).hexdigest()
+
+
+def _check_signature(secret, message, signature):
+    if not secret or not signature or not hmac.compare_digest(_signature(secret, message), str(signature)):
+        raise SignatureError("Signature verification failed")
+
+
+class TimeoutSession(requests.Session):
+    """A requests session that applies a default timeout to every call."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class RazorpayGateway:
+    """
+    Razorpay with one pooled HTTP session per process. Connection failures
+    and 5xx responses on idempotent calls are retried with a short backoff;
+    a POST that reached the server is never replayed.
+    """
+    name = 'razorpay'
+
+    def __init__(self, key_id, key_secret, webhook_secret=None, timeout=(3.05, 10), retries=2, pool_size=10):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.webhook_secret = webhook_secret
+
+        session = TimeoutSession(timeout)
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                connect=retries,
+                read=0,
+                status=retries,
+                status_forcelist=(502, 503, 504),
+                allowed_methods={'GET'},
+                backoff_factor=0.2,
+                raise_on_status=False,
+            ),
+        )
+        session.mount('https://', adapter)
+        self.client = razorpay.Client(session=session, auth=(key_id, key_secret))
+
+    def create_order(self, amount, currency='INR', receipt=None):
+        """Create a gateway order for ``amount`` in the smallest currency unit."""
+        data = {'amount': amount, 'currency': currency, 'payment_capture': '1'}
+        if receipt:
+            data['receipt'] = str(receipt)
+        try:
+            return self.client.order.create(data)
+        except (requests.RequestException, razorpay.errors.BadRequestError,
+                razorpay.errors.GatewayError, razorpay.errors.ServerError) as e:
+            raise GatewayError(str(e)) from e
+
+    def verify_payment(self, order_id, payment_id, signature):
+        _check_signature(self.key_secret, f"{order_id}|{payment_id}", signature)
+
+    def verify_webhook(self, body, signature):
+        _check_signature(self.webhook_secret, body, signature)
+
+
+class LocalGateway(RazorpayGateway):
+    """
+    In-process stand-in with Razorpay's order and signature shapes. Orders
+    are created without any network call and clients (or load tests) sign
+    payments with ``sign_payment``.
+    """
+    name = 'local'
+
+    def __init__(self, key_id=None, key_secret=None, webhook_secret=None, **options):
+        self.key_id = key_id or 'local_key'
+        self.key_secret = key_secret or 'local_secret'
+        self.webhook_secret = webhook_secret or self.key_secret
+
+    def create_order(self, amount, currency='INR', receipt=None):
+        return {
+            'id': f"order_local_{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': amount,
+            'currency': currency,
+            'receipt': receipt,
+            'status': 'created',
+        }
+
+    def sign_payment(self, order_id, payment_id):
+        return _signature(self.key_secret, f"{order_id}|{payment_id}")
+
+    def sign_webhook(self, body):
+        return _signature(self.webhook_secret, body)
+
+
+@functools.lru_cache(maxsize=None)
+def get_gateway():
+    """The configured gateway, built once per process."""
+    name = getattr(settings, 'PAYMENT_GATEWAY', 'razorpay')
+    gateway_class = import_string(GATEWAYS.get(name, name))
+    return gateway_class(
+        key_id=settings.RAZORPAY_KEY_ID,
+        key_secret=settings.RAZORPAY_KEY_SECRET,
+        webhook_secret=getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', None),
+        timeout=getattr(settings, 'PAYMENT_GATEWAY_TIMEOUT', (3.05, 10)),
+        retries=getattr(settings, 'PAYMENT_GATEWAY_RETRIES', 2),
+    )
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cashflow.webhooks import process_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply pending payment webhook events from the inbox to orders and payments. "
+        "Runs once by default; --loop keeps polling. Several workers may run side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help="Events handled per pass")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new events")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the inbox is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            handled = process_pending(options['batch'])
+            if handled:
+                self.stdout.write(f"Handled {handled} webhook events")
+            if not options['loop']:
+                break
+            if handled < options['batch']:
+                time.sleep(options['sleep'])
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0003_branch_is_default'),
+        ('cashflow', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionPaymentTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='session',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='cashflow.session'),
+        ),
+        migrations.AddField(
+            model_name='returnorder',
+            name='session',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='returns', to='cashflow.session'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='business.branch'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='counted_cash',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='net_sales',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='opening_float',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='return_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='return_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='sales_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='tip_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['user', 'ended_at'], name='session_user_open_idx'),
+        ),
+        migrations.AddField(
+            model_name='sessionpaymenttotal',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_totals', to='cashflow.session'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sessionpaymenttotal',
+            unique_together={('session', 'mode')},
+        ),
+    ]
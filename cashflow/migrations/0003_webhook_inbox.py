@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashflow', '0002_session_running_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='reference',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='razorpay', max_length=20)),
+                ('event_id', models.CharField(max_length=100)),
+                ('event', models.CharField(max_length=50)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='webhook_pending_idx')],
+                'unique_together': {('provider', 'event_id')},
+            },
+        ),
+    ]
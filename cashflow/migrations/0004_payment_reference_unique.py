@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashflow', '0003_webhook_inbox'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('reference__isnull', False), models.Q(('reference', ''), _negated=True)), fields=('mode', 'reference'), name='payment_mode_reference_uniq'),
+        ),
+    ]
@@ -1,10 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 from users.models import User
 
 
 class Payment(models.Model):
     order = models.ForeignKey("features.Order", on_delete=models.CASCADE, related_name="payments")
+    # Till session that took the payment, if one was open.
+    session = models.ForeignKey("cashflow.Session", on_delete=models.SET_NULL, related_name="payments", null=True, blank=True)
     mode = models.CharField(max_length=20, choices=[
         ('cash', 'Cash'),
         ('card', 'Card'),
@@ -13,20 +16,134 @@ class Payment(models.Model):
         ('non_chargeable', 'Non-Chargeable'),
     ])
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Gateway payment id for online tenders; used to apply each capture once.
+    reference = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     received_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # A gateway payment id is recorded once per mode, however many
+            # times the capture is reported.
+            models.UniqueConstraint(
+                fields=['mode', 'reference'],
+                condition=models.Q(reference__isnull=False) & ~models.Q(reference=''),
+                name='payment_mode_reference_uniq',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding and self.session_id:
+            Session.add_payment(self.session_id, self.mode, self.amount)
+
 class Tip(models.Model):
     order = models.ForeignKey("features.Order", on_delete=models.CASCADE, related_name="tips")
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding and self.order.session_id:
+            Session.objects.filter(pk=self.order.session_id).update(tip_total=F('tip_total') + self.amount)
+
+class SessionClosed(Exception):
+    """A sale or payment was added to a till session that has been closed."""
+
+
 class Session(models.Model):
+    """
+    A till session (shift). Sales, tips, returns and payments taken while it
+    is open are added to the running totals below as they happen, so closing
+    the session reads one row plus its per-mode payment totals.
+    """
     name = models.CharField(max_length=100)
+    branch = models.ForeignKey("business.Branch", on_delete=models.CASCADE, related_name="sessions", null=True, blank=True)
     started_at = models.DateTimeField()
     ended_at = models.DateTimeField(null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    opening_float = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    counted_cash = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    sales_count = models.PositiveIntegerField(default=0)
+    net_sales = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tip_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    return_count = models.PositiveIntegerField(default=0)
+    return_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'ended_at'], name='session_user_open_idx'),
+        ]
+
+    @classmethod
+    def open_for(cls, user):
+        """The user's open session, or None."""
+        if not getattr(user, 'is_authenticated', False):
+            return None
+        return cls.objects.filter(user=user, ended_at__isnull=True).order_by('-started_at').first()
+
+    @classmethod
+    def add_sale(cls, session_id, net, count=1):
+        """Add to the session's sales; raises ``SessionClosed`` once the session has ended."""
+        added = cls.objects.filter(pk=session_id, ended_at__isnull=True).update(
+            sales_count=F('sales_count') + count, net_sales=F('net_sales') + net,
+        )
+        if not added:
+            raise SessionClosed(f"Session {session_id} is closed")
+
+    @classmethod
+    def add_payment(cls, session_id, mode, amount, count=1):
+        """Add to the session's per-mode payment totals; raises ``SessionClosed`` once the session has ended."""
+        with transaction.atomic():
+            # Lock the session row so a close cannot slip in between the
+            # check and the update.
+            if not cls.objects.select_for_update().filter(pk=session_id, ended_at__isnull=True).exists():
+                raise SessionClosed(f"Session {session_id} is closed")
+            totals, _ = SessionPaymentTotal.objects.get_or_create(session_id=session_id, mode=mode)
+            SessionPaymentTotal.objects.filter(pk=totals.pk).update(amount=F('amount') + amount, count=F('count') + count)
+
+class SessionPaymentTotal(models.Model):
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="payment_totals")
+    mode = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('session', 'mode')
 
 class ReturnOrder(models.Model):
     original_order = models.ForeignKey("features.Order", on_delete=models.CASCADE, related_name="returns")
+    # Session the return was processed in, which may differ from the sale's.
+    session = models.ForeignKey(Session, on_delete=models.SET_NULL, related_name="returns", null=True, blank=True)
     return_date = models.DateTimeField(auto_now_add=True)
     reason = models.TextField(blank=True)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding and self.session_id:
+            Session.objects.filter(pk=self.session_id).update(
+                return_count=F('return_count') + 1,
+                return_total=F('return_total') + self.original_order.total_price(),
+            )
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of verified gateway webhooks. The endpoint only inserts here; the
+    ``process_webhooks`` worker applies pending events in arrival order.
+    """
+    provider = models.CharField(max_length=20, default='razorpay')
+    event_id = models.CharField(max_length=100)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('provider', 'event_id')
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='webhook_pending_idx'),
+        ]
@@ -0,0 +1,488 @@
+"""
+Aggregations behind the cash summary report.
+
+Every breakdown is a single grouped query over the branch's orders in the
+requested window, so the cost of the report does not grow with the number
+of orders, lines or payments. Item sales also reuse per-month totals kept
+in the cache for months that are over.
+"""
+import operator
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from functools import reduce
+
+from django.core.cache import cache
+from django.db.models import (
+    BigIntegerField, Case, Count, DateField, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum,
+    Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, ExtractHour, ExtractIsoWeekDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.timezone import localtime, make_aware
+
+from features.models import Item, Order, OrderItem
+from features.sales import sales_signatures
+from cashflow.models import Payment, Tip, Session, ReturnOrder
+
+
+ZERO = Decimal('0')
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def line_total():
+    return ExpressionWrapper(F('price') * F('quantity'), output_field=MONEY)
+
+
+def order_gross(order_ref='pk'):
+    """Subquery: gross line total of the order referenced by ``order_ref``."""
+    totals = (
+        OrderItem.objects.filter(order=OuterRef(order_ref))
+        .values('order')
+        .annotate(total=Sum(line_total()))
+        .values('total')
+    )
+    return Coalesce(Subquery(totals, output_field=MONEY), Value(ZERO), output_field=MONEY)
+
+
+def _money(value):
+    return value if value is not None else ZERO
+
+
+def _average(total, count):
+    return (total / count).quantize(Decimal('0.01')) if count else ZERO
+
+
+def cash_summary(branch, start_date, end_date):
+    """
+    Build the full cash summary for ``branch`` between ``start_date`` and
+    ``end_date``, shaped like ``CashSummarySerializer``.
+    """
+    orders = Order.objects.filter(branch=branch, created_at__range=(start_date, end_date))
+    lines = OrderItem.objects.filter(order__branch=branch, order__created_at__range=(start_date, end_date))
+
+    totals = orders.aggregate(
+        sales=Count('id'),
+        discount=Sum('discount'),
+        people=Count('customer', distinct=True),
+    )
+    discount_total = _money(totals['discount'])
+
+    # Per-SKU totals, with each line's share of its order's discount as
+    # stored by features.tax.
+    line_discount = F('discount_amount')
+    item_rows = (
+        lines.values(
+            'item',
+            'item__sku_code',
+            'item__item_name',
+            'item__item_brand__name',
+            'item__account',
+            'item__category__name',
+            'item__nature_of_item',
+            'item__measuring_unit',
+        )
+        .annotate(
+            qty=Sum('quantity'),
+            gross=Sum(line_total()),
+            discount=Sum(line_discount),
+            tax=Sum('tax_amount'),
+        )
+        .order_by('-gross')
+    )
+
+    items = []
+    categories = {}
+    accounts = {}
+    gross_total = ZERO
+    for row in item_rows:
+        gross = _money(row['gross'])
+        discount = _money(row['discount']).quantize(Decimal('0.01'))
+        net = gross - discount
+        gross_total += gross
+        category = row['item__category__name'] or 'Uncategorized'
+        account = row['item__account'] or 'Default'
+        categories[category] = categories.get(category, ZERO) + net
+        accounts[account] = accounts.get(account, ZERO) + net
+        items.append({
+            'skuCode': row['item__sku_code'],
+            'itemName': row['item__item_name'],
+            'brandName': row['item__item_brand__name'] or '',
+            'accountName': account,
+            'categoryName': category,
+            'subCategory': '',
+            'itemNature': row['item__nature_of_item'],
+            'type': 'Item',
+            'measuringUnit': row['item__measuring_unit'],
+            'itemTotalDiscountAmount': discount,
+            'itemTotalNetAmount': net,
+            'itemTotalQty': row['qty'],
+            'itemTotalgrossAmount': gross,
+            'itemTotaltaxAmount': _money(row['tax']),
+        })
+
+    # Line tax is stored when orders are taxed (features.tax); group it by rate.
+    taxes = [
+        {'name': f"Tax {row['tax_rate'].normalize():f}%", 'amount': row['amount']}
+        for row in lines.filter(tax_amount__gt=0)
+        .values('tax_rate').annotate(amount=Sum('tax_amount')).order_by('tax_rate')
+    ]
+    tax_total = sum((t['amount'] for t in taxes), ZERO)
+
+    payments = [
+        {'mode': row['mode'], 'amount': row['amount']}
+        for row in Payment.objects.filter(order__in=orders)
+        .values('mode').annotate(amount=Sum('amount')).order_by('mode')
+    ]
+    payment_total = sum((p['amount'] for p in payments), ZERO)
+
+    tips = [
+        {'user': f"{row['user__first_name'] or ''} {row['user__last_name'] or ''}".strip() or 'Unassigned',
+         'amount': row['amount']}
+        for row in Tip.objects.filter(order__in=orders)
+        .values('user', 'user__first_name', 'user__last_name').annotate(amount=Sum('amount')).order_by('user')
+    ]
+    tip_total = sum((t['amount'] for t in tips), ZERO)
+
+    return_total = _money(
+        ReturnOrder.objects.filter(original_order__in=orders)
+        .annotate(order_total=order_gross('original_order') - F('original_order__discount'))
+        .aggregate(total=Sum('order_total'))['total']
+    )
+
+    channel_summary = []
+    for row in (
+        orders.annotate(gross=order_gross())
+        .values('channel__name')
+        .annotate(net=Sum('gross') - Sum('discount'), sales=Count('id'))
+        .order_by('channel__name')
+    ):
+        net = _money(row['net'])
+        channel_summary.append({
+            'name': row['channel__name'] or 'Default',
+            'netSaleAmount': net,
+            'noOfSales': row['sales'],
+            'avgSaleAmount': _average(net, row['sales']),
+        })
+
+    accounts_wise_channels = {}
+    for row in (
+        lines.values('item__account', 'order__channel__name')
+        .annotate(net=Sum(line_total() - line_discount), sales=Count('order', distinct=True))
+        .order_by('item__account', 'order__channel__name')
+    ):
+        net = _money(row['net']).quantize(Decimal('0.01'))
+        accounts_wise_channels.setdefault(row['item__account'] or 'Default', []).append({
+            'name': row['order__channel__name'] or 'Default',
+            'netSaleAmount': net,
+            'noOfSales': row['sales'],
+            'avgSaleAmount': _average(net, row['sales']),
+        })
+
+    session_summary = [
+        {
+            'name': session.name,
+            'netSaleAmount': session.net_sales,
+            'noOfSales': session.sales_count,
+            'avgSaleAmount': _average(session.net_sales, session.sales_count),
+        }
+        for session in _sessions(branch, start_date, end_date)
+    ]
+
+    net_sales = gross_total - discount_total
+    no_of_sales = totals['sales']
+    no_of_people = totals['people']
+    return {
+        'grossAmount': gross_total,
+        'returnAmount': return_total,
+        'discountTotal': discount_total,
+        'directChargeTotal': ZERO,
+        'netAmount': net_sales,
+        'chargeTotal': ZERO,
+        'taxTotal': tax_total,
+        'roundOffTotal': ZERO,
+        'tipTotal': tip_total,
+        'revenue': net_sales + tip_total,
+        'paymentTotal': payment_total,
+        'balanceAmount': max(ZERO, net_sales - payment_total),
+        'costOfGoodsSold': ZERO,
+        'marginOnNetSales': net_sales,
+        'discounts': [{'name': 'Order discount', 'amount': discount_total}] if discount_total else [],
+        'categories': [{'name': name, 'amount': amount} for name, amount in sorted(categories.items())],
+        'charges': [],
+        'taxes': taxes,
+        'tips': tips,
+        'payments': payments,
+        'noOfSales': no_of_sales,
+        'avgSaleAmount': _average(net_sales, no_of_sales),
+        'noOfPeople': no_of_people,
+        'avgSaleAmountPerPerson': _average(net_sales, no_of_people),
+        'asOfTime': datetime.now().isoformat(),
+        'sessionSummary': session_summary,
+        'channelSummary': channel_summary,
+        'costs': [],
+        'items': items,
+        'accounts': [{'name': name, 'amount': amount} for name, amount in sorted(accounts.items())],
+        'accountsWiseChannels': [
+            {'account': account, 'channel': channels}
+            for account, channels in accounts_wise_channels.items()
+        ],
+    }
+
+
+def _sessions(branch, start_date, end_date):
+    """
+    Till sessions at the branch overlapping the window. Their sales figures
+    are the running totals kept on the session as orders close.
+    """
+    return (
+        Session.objects
+        .filter(Q(branch=branch) | Q(branch__isnull=True, user__branch=branch), started_at__lte=end_date)
+        .filter(Q(ended_at__gte=start_date) | Q(ended_at__isnull=True))
+        .order_by('started_at')
+    )
+
+
+ABC_THRESHOLDS = (Decimal('80'), Decimal('95'))
+
+
+def item_sales(branch, start_date, end_date, previous_start, previous_end, thresholds=ABC_THRESHOLDS):
+    """
+    Per-SKU sales for ``branch`` in the current window with the matching
+    figures for the previous window, ranked by net amount and classified
+    A/B/C by cumulative share of net sales (``thresholds`` in percent).
+
+    Local months that a window covers whole and that ended before yesterday
+    are read from per-month item totals in the cache (``_monthly_item_sales``);
+    the rest of each window is summed from the lines. Amounts are carried in
+    paise until the rows are built.
+    """
+    today = timezone.localdate()
+    windows = {'current': (start_date, end_date), 'previous': (previous_start, previous_end)}
+    cached_months, live = {}, {}
+    for name, (start, end) in windows.items():
+        months, edges = _split_months(start, end)
+        # The day before today is left live as well, for orders still
+        # being closed or synced after midnight.
+        cached_months[name] = [month for month in months if _next_month(month) < today]
+        live[name] = edges + [_month_range(month) for month in months if month not in cached_months[name]]
+
+    totals = {name: {} for name in windows}
+    monthly = _monthly_item_sales(branch, sorted({*cached_months['current'], *cached_months['previous']}))
+    for name, months in cached_months.items():
+        for month in months:
+            _add_totals(totals[name], monthly[month])
+    for name, columns in _live_item_sales(branch, live).items():
+        _add_totals(totals[name], columns)
+
+    current, previous = totals['current'], totals['previous']
+    empty = [0] * len(ITEM_TOTALS)
+    details = Item.objects.filter(pk__in=current.keys() | previous.keys()).values(
+        'pk', 'sku_code', 'item_name', 'item_brand__name', 'account',
+        'category__name', 'nature_of_item', 'measuring_unit',
+    )
+
+    items = []
+    for detail in details:
+        qty, gross, discount, tax = current.get(detail['pk'], empty)
+        previous_qty, previous_gross, previous_discount, _ = previous.get(detail['pk'], empty)
+        net = _rupees(gross - discount)
+        previous_net = _rupees(previous_gross - previous_discount)
+        items.append({
+            'skuCode': detail['sku_code'],
+            'itemName': detail['item_name'],
+            'brandName': detail['item_brand__name'] or '',
+            'accountName': detail['account'] or 'Default',
+            'categoryName': detail['category__name'] or 'Uncategorized',
+            'subCategory': '',
+            'itemNature': detail['nature_of_item'],
+            'type': 'Item',
+            'measuringUnit': detail['measuring_unit'],
+            'itemTotalDiscountAmount': _rupees(discount),
+            'itemTotalNetAmount': net,
+            'itemTotalQty': qty,
+            'itemTotalgrossAmount': _rupees(gross),
+            'itemTotaltaxAmount': _rupees(tax),
+            'previousQty': previous_qty,
+            'previousNetAmount': previous_net,
+            'netAmountDelta': net - previous_net,
+            'netAmountDeltaPct': ((net - previous_net) * 100 / previous_net).quantize(Decimal('0.01')) if previous_net else None,
+        })
+
+    items.sort(key=lambda item: item['itemTotalNetAmount'], reverse=True)
+    total_net = sum((item['itemTotalNetAmount'] for item in items), ZERO)
+    running = ZERO
+    for rank, item in enumerate(items, start=1):
+        share = item['itemTotalNetAmount'] * 100 / total_net if total_net else ZERO
+        # Classify on the share before this item, so the item that crosses
+        # a threshold still belongs to the higher class.
+        item['rank'] = rank
+        item['abcClass'] = 'A' if running < thresholds[0] else 'B' if running < thresholds[1] else 'C'
+        item['netShare'] = share.quantize(Decimal('0.01'))
+        running += share
+    return items
+
+
+# Per-item totals carried between queries, the cache and item_sales:
+# quantity, then gross, discount and tax in paise.
+ITEM_TOTALS = ('qty', 'gross', 'discount', 'tax')
+ITEM_SALES_CACHE_TIMEOUT = 60 * 60 * 24 * 31
+
+
+def _rupees(paise):
+    return Decimal(paise).scaleb(-2)
+
+
+def _item_totals(prefix='', condition=None):
+    """Annotations for ``ITEM_TOTALS`` over the grouped lines, only counting lines matching ``condition``."""
+    def total(expression, scale):
+        if condition is not None:
+            expression = Case(When(condition, then=expression))
+        return Coalesce(Cast(Sum(expression) * scale, BigIntegerField()), Value(0))
+
+    return {
+        f'{prefix}qty': total(F('quantity'), 1),
+        f'{prefix}gross': total(line_total(), 100),
+        f'{prefix}discount': total(F('discount_amount'), 100),
+        f'{prefix}tax': total(F('tax_amount'), 100),
+    }
+
+
+def _columns(rows, prefix=''):
+    """Rows of ``ITEM_TOTALS`` as columns: ``{'item': [ids], 'qty': [...], ...}``."""
+    columns = {'item': [], **{name: [] for name in ITEM_TOTALS}}
+    for row in rows:
+        columns['item'].append(row['item'])
+        for name in ITEM_TOTALS:
+            columns[name].append(row[prefix + name])
+    return columns
+
+
+def _add_totals(totals, columns):
+    """Add ``columns`` (see ``_columns``) into ``totals``, ``{item_id: [qty, gross, discount, tax]}``."""
+    for item, *values in zip(columns['item'], *(columns[name] for name in ITEM_TOTALS)):
+        row = totals.get(item)
+        if row is None:
+            totals[item] = values
+        else:
+            for index, value in enumerate(values):
+                row[index] += value
+
+
+def _local_midnight(day):
+    return make_aware(datetime.combine(day, time.min))
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _month_range(month):
+    return _local_midnight(month), _local_midnight(_next_month(month)) - timedelta(microseconds=1)
+
+
+def _split_months(start, end):
+    """
+    Split the window ``start``..``end`` into the local months it covers
+    whole (their first days) and the ranges left over at either end. A
+    window ending in the last second of a month covers that month.
+    """
+    month = localtime(start).date().replace(day=1)
+    if _local_midnight(month) < start:
+        month = _next_month(month)
+    months = []
+    while _local_midnight(_next_month(month)) - timedelta(seconds=1) <= end:
+        months.append(month)
+        month = _next_month(month)
+    if not months:
+        return [], [(start, end)]
+    first, after = _local_midnight(months[0]), _local_midnight(month)
+    edges = []
+    if start < first:
+        edges.append((start, first - timedelta(microseconds=1)))
+    if after <= end:
+        edges.append((after, end))
+    return months, edges
+
+
+def _monthly_item_sales(branch, months):
+    """
+    ``{month: columns}`` of per-item totals (see ``_columns``) for each
+    local month in ``months``. Each month is cached under its sales
+    signature (``features.sales``), so a change to one of its days, such as
+    an offline upload or a re-taxed order, makes it be summed again.
+    """
+    if not months:
+        return {}
+    signatures = sales_signatures(branch, [(month, _next_month(month) - timedelta(days=1)) for month in months])
+    keys = {
+        month: f'item-sales:{branch.id}:{month:%Y-%m}:{signature}'
+        for month, signature in zip(months, signatures)
+    }
+    cached = cache.get_many(keys.values())
+    monthly = {month: cached[key] for month, key in keys.items() if key in cached}
+
+    missing = [month for month in months if month not in monthly]
+    if missing:
+        within = Q()
+        for month in missing:
+            within |= Q(order__created_at__range=_month_range(month))
+        rows = {month: [] for month in missing}
+        for row in (
+            OrderItem.objects.filter(within, order__branch=branch)
+            .values('item', month=TruncMonth('order__created_at', output_field=DateField()))
+            .annotate(**_item_totals())
+            .order_by()
+        ):
+            rows[row['month']].append(row)
+        fresh = {month: _columns(month_rows) for month, month_rows in rows.items()}
+        cache.set_many({keys[month]: columns for month, columns in fresh.items()}, ITEM_SALES_CACHE_TIMEOUT)
+        monthly.update(fresh)
+    return monthly
+
+
+def _live_item_sales(branch, ranges):
+    """
+    Per-item totals summed from the lines for each named window in
+    ``ranges`` (``{name: [(start, end), ...]}``), as ``{name: columns}``.
+    """
+    conditions = {}
+    for name, window in ranges.items():
+        if window:
+            conditions[name] = Q()
+            for start, end in window:
+                conditions[name] |= Q(order__created_at__range=(start, end))
+    if not conditions:
+        return {}
+    annotations = {}
+    for name, condition in conditions.items():
+        annotations.update(_item_totals(f'{name}_', condition))
+    rows = list(
+        OrderItem.objects.filter(reduce(operator.or_, conditions.values()), order__branch=branch)
+        .values('item').annotate(**annotations).order_by()
+    )
+    return {name: _columns(rows, f'{name}_') for name in conditions}
+
+
+def hourly_sales(branch, start_date, end_date):
+    """
+    Orders and net sales for ``branch`` bucketed by ISO week, weekday and
+    hour of day. Returns ``{week_monday: grid}`` where ``grid[weekday - 1][hour]``
+    is ``[orders, net]``; weeks without orders are absent.
+    """
+    rows = (
+        Order.objects
+        .filter(branch=branch, created_at__range=(start_date, end_date))
+        .annotate(gross=order_gross())
+        .values(
+            week=TruncWeek('created_at'),
+            weekday=ExtractIsoWeekDay('created_at'),
+            hour=ExtractHour('created_at'),
+        )
+        .annotate(orders=Count('id'), net=Sum('gross') - Sum('discount'))
+        .order_by()
+    )
+    weeks = {}
+    for row in rows:
+        grid = weeks.setdefault(row['week'].date(), [[[0, ZERO] for _ in range(24)] for _ in range(7)])
+        grid[row['weekday'] - 1][row['hour']] = [row['orders'], _money(row['net'])]
+    return weeks
@@ -1,5 +1,9 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 
+from cashflow.models import Session
+
 class NamedAmountSerializer(serializers.Serializer):
     name = serializers.CharField()
     amount = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -28,6 +32,15 @@ class ItemSummarySerializer(serializers.Serializer):
     itemTotalgrossAmount = serializers.DecimalField(max_digits=10, decimal_places=2)
     itemTotaltaxAmount = serializers.DecimalField(max_digits=10, decimal_places=2)
 
+class ItemSalesSerializer(ItemSummarySerializer):
+    rank = serializers.IntegerField()
+    abcClass = serializers.CharField()
+    netShare = serializers.DecimalField(max_digits=5, decimal_places=2)
+    previousQty = serializers.IntegerField()
+    previousNetAmount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    netAmountDelta = serializers.DecimalField(max_digits=12, decimal_places=2)
+    netAmountDeltaPct = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+
 class SessionSummarySerializer(serializers.Serializer):
     name = serializers.CharField()
     netSaleAmount = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -79,3 +92,40 @@ class CashSummarySerializer(serializers.Serializer):
     items = ItemSummarySerializer(many=True)
     accounts = NamedAmountSerializer(many=True)
     accountsWiseChannels = AccountChannelSerializer(many=True)
+
+
+class SessionOpenSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100, required=False)
+    opening_float = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+
+class SessionCloseSerializer(serializers.Serializer):
+    counted_cash = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+
+class SessionPaymentTotalSerializer(serializers.Serializer):
+    mode = serializers.CharField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    count = serializers.IntegerField()
+
+class TillSessionSerializer(serializers.ModelSerializer):
+    """Close-out view of a till session, built from its running totals."""
+    payments = serializers.SerializerMethodField()
+    expected_cash = serializers.SerializerMethodField()
+    cash_variance = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Session
+        fields = ['id', 'name', 'branch', 'user', 'started_at', 'ended_at', 'opening_float',
+                  'sales_count', 'net_sales', 'tip_total', 'return_count', 'return_total',
+                  'payments', 'expected_cash', 'counted_cash', 'cash_variance']
+
+    def get_payments(self, obj):
+        return SessionPaymentTotalSerializer(obj.payment_totals.all(), many=True).data
+
+    def get_expected_cash(self, obj):
+        cash = sum(total.amount for total in obj.payment_totals.all() if total.mode == 'cash')
+        return str(obj.opening_float + cash)
+
+    def get_cash_variance(self, obj):
+        if obj.counted_cash is None:
+            return None
+        return str(obj.counted_cash - Decimal(self.get_expected_cash(obj)))
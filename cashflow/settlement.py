@@ -0,0 +1,122 @@
+"""
+Settlement of orders against one or more tenders.
+
+Every tender is stored as a ``Payment`` row. The order row is locked while
+tenders are applied, so concurrent tenders on the same order (a card
+terminal and the cash drawer, or a client retry) see each other's effect on
+the outstanding balance instead of overwriting it.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from customer.loyalty import accrue_points
+from features.models import Order
+from cashflow.models import Payment, Session, SessionClosed
+
+
+ZERO = Decimal('0.00')
+
+# Only cash can be over-tendered; the excess is returned as change.
+CHANGE_GIVING_MODES = {'cash'}
+
+
+class SettlementError(Exception):
+    """A tender could not be applied to the order."""
+
+
+class TenderAlreadyRecorded(SettlementError):
+    """A tender's gateway reference is already recorded as a payment."""
+    def __init__(self, mode, reference, order):
+        super().__init__(f"{mode.capitalize()} payment already recorded")
+        self.reference = reference
+        self.order = order
+
+
+def settle(order_id, tenders, user=None):
+    """
+    Apply ``tenders`` (dicts with ``mode``, ``amount`` and optional
+    ``reference``; an ``amount`` of None means the outstanding balance) to
+    the order, in order. The order is marked paid once the tenders cover
+    its total.
+
+    Returns ``(order, result)`` where ``result`` holds the applied
+    payments, the outstanding balance and the change due. Raises
+    ``Order.DoesNotExist`` for unknown or already paid orders,
+    ``TenderAlreadyRecorded`` when a tender's reference is already stored
+    for its mode (a gateway capture applied twice) and ``SettlementError``
+    when a tender cannot be applied otherwise.
+    """
+    session = Session.open_for(user)
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        # Checked under the order lock, so a capture reported by both the
+        # client and the gateway webhook is applied once.
+        for tender in tenders:
+            reference = tender.get('reference')
+            if reference and Payment.objects.filter(mode=tender['mode'], reference=reference).exists():
+                raise TenderAlreadyRecorded(tender['mode'], reference, order)
+        if order.is_paid:
+            raise Order.DoesNotExist(f"Order {order_id} is already paid")
+        total = order.total_price()
+        paid = order.amount_paid or ZERO
+        received = ZERO
+        change = ZERO
+        payments = []
+
+        for tender in tenders:
+            outstanding = total - paid
+            if outstanding <= 0:
+                raise SettlementError("Order is already fully covered by earlier tenders")
+            amount = outstanding if tender.get('amount') is None else tender['amount']
+            if amount <= 0:
+                raise SettlementError("Tender amount must be positive")
+            if amount > outstanding and tender['mode'] not in CHANGE_GIVING_MODES:
+                raise SettlementError(
+                    f"{tender['mode']} tender of {amount} exceeds the outstanding balance of {outstanding}"
+                )
+            applied = min(amount, outstanding)
+            payments.append(Payment(
+                order=order, session=session, mode=tender['mode'], amount=applied, reference=tender.get('reference') or None,
+            ))
+            paid += applied
+            received += amount
+            change += amount - applied
+            if tender.get('reference'):
+                order.payment_reference = tender['reference']
+
+        try:
+            for payment in payments:
+                payment.save()
+        except SessionClosed:
+            raise SettlementError("The till session was closed while paying; try again")
+
+        modes = set(order.payments.values_list('mode', flat=True))
+        order.amount_paid = paid
+        order.payment_received += received
+        order.change_due = change
+        order.payment_mode = modes.pop() if len(modes) == 1 else 'split'
+        if paid >= total:
+            order.is_paid = True
+            order.payment_date = timezone.now()
+        order.save(update_fields=[
+            'amount_paid', 'payment_received', 'change_due', 'payment_mode',
+            'payment_reference', 'is_paid', 'payment_date',
+        ])
+        if order.is_paid:
+            accrue_points([order.id])
+
+    return order, {
+        'payments': [{'id': p.id, 'mode': p.mode, 'amount': str(p.amount)} for p in payments],
+        'total': str(total),
+        'amount_paid': str(paid),
+        'outstanding': str(max(ZERO, total - paid)),
+        'change_due': str(change),
+        'is_paid': order.is_paid,
+    }
+
+
+def outstanding_balance(order):
+    """What is still owed on ``order`` after the tenders applied so far."""
+    return max(ZERO, order.total_price() - (order.amount_paid or ZERO))
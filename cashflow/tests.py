@@ -1,3 +1,657 @@
-from django.test import TestCase
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from backend import synthetic
+from cashflow.gateways import LocalGateway, SignatureError, get_gateway
+from cashflow.models import Payment, Session, SessionClosed, SessionPaymentTotal, Tip, WebhookEvent
+from cashflow.settlement import TenderAlreadyRecorded, settle
+from cashflow.webhooks import MAX_ATTEMPTS, process_pending
+from features.models import Order, OrderItem
+from features.offline_sync import apply_bundle
+from features.tax import apply_order_tax
+from users.models import Contact, User
+
+
+class CashSummaryQueryBudgetTest(TestCase):
+    # Session + user lookups for the request plus one query per breakdown.
+    QUERY_BUDGET = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rng = random.Random(7)
+        business, branches = synthetic.make_business(cls.rng, 1)
+        cls.branch = branches[0]
+        cls.cashier = synthetic.make_cashier(cls.rng, business, cls.branch)
+        cls.items = synthetic.make_items(cls.rng, 30)
+        cls.customers = synthetic.make_customers(cls.rng, cls.branch, 10)
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def add_orders(self, count):
+        orders = synthetic.make_orders(self.rng, self.customers, self.items, count)
+        Payment.objects.bulk_create([Payment(order=order, mode='cash', amount=Decimal('10.00')) for order in orders])
+        Tip.objects.bulk_create([Tip(order=order, user=self.cashier, amount=Decimal('1.00')) for order in orders])
+
+    def count_queries(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/cashsummary/?period=today{query}')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_full_report_costs_the_same_as_flat_report(self):
+        self.add_orders(5)
+        self.assertEqual(self.count_queries('&report=full'), self.count_queries())
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.add_orders(5)
+        small = self.count_queries('&report=full')
+        self.add_orders(50)
+        self.assertEqual(self.count_queries('&report=full'), small)
+        self.assertLessEqual(small, self.QUERY_BUDGET)
+
+    def test_breakdowns_add_up(self):
+        self.add_orders(20)
+        first = Order.objects.order_by('pk').first().pk
+        Order.objects.filter(pk=first).update(discount=Decimal('5.00'))
+        apply_order_tax([first])
+        report = self.client.get('/api/cashsummary/?period=today&report=full').json()
+
+        gross = sum(line.price * line.quantity for line in OrderItem.objects.all())
+        self.assertEqual(Decimal(report['grossAmount']), gross)
+        self.assertEqual(Decimal(report['netAmount']), gross - Decimal('5.00'))
+        self.assertEqual(sum(Decimal(c['amount']) for c in report['categories']), gross - Decimal('5.00'))
+        self.assertEqual(sum(Decimal(i['itemTotalgrossAmount']) for i in report['items']), gross)
+        self.assertEqual(report['payments'], [{'mode': 'cash', 'amount': '200.00'}])
+        self.assertEqual(Decimal(report['tipTotal']), Decimal('20.00'))
+        self.assertEqual(report['noOfSales'], 20)
+
+
+class ItemSalesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(11)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.branch = branches[0]
+        cls.cashier = synthetic.make_cashier(rng, business, cls.branch)
+        cls.items = synthetic.make_items(rng, 4)
+        cls.customer = synthetic.make_customers(rng, cls.branch, 1)[0]
+        now = timezone.now()
+        # Today: net 800, 100, 52.50 and 37.50; the last two share a discount
+        # of 30 by line amount.
+        cls.add_order(now, [(0, '400.00', 2)])
+        cls.add_order(now, [(1, '60.00', 2)], discount='20.00')
+        cls.add_order(now, [(2, '70.00', 1), (3, '50.00', 1)], discount='30.00')
+        # Yesterday: only the first item sold.
+        cls.add_order(now - timedelta(days=1), [(0, '400.00', 1)])
+
+    @classmethod
+    def add_order(cls, created_at, lines, discount='0'):
+        order = Order.objects.create(
+            customer=cls.customer, branch=cls.branch, status='closed', is_paid=True, discount=Decimal(discount),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, item=cls.items[index], price=Decimal(price), quantity=quantity)
+            for index, price, quantity in lines
+        ])
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        apply_order_tax([order.pk])
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def report(self, query=''):
+        response = self.client.get(f'/api/ordermanagement/item-sales/?period=today&compare=yesterday{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_items_are_ranked_and_classified_by_net_share(self):
+        report = self.report()
+        rows = [
+            (item['skuCode'], item['rank'], item['abcClass'], item['itemTotalNetAmount'], item['itemTotalDiscountAmount'])
+            for item in report['items']
+        ]
+        skus = [item.sku_code for item in self.items]
+        self.assertEqual(rows, [
+            (skus[0], 1, 'A', '800.00', '0.00'),
+            # 800 of 990 is 80.81%: the next item starts past the A threshold.
+            (skus[1], 2, 'B', '100.00', '20.00'),
+            (skus[2], 3, 'B', '52.50', '17.50'),
+            (skus[3], 4, 'C', '37.50', '12.50'),
+        ])
+        self.assertEqual(report['items'][0]['netShare'], '80.81')
+        self.assertEqual(report['classes'], {
+            'A': {'items': 1, 'netAmount': '800.00'},
+            'B': {'items': 2, 'netAmount': '152.50'},
+            'C': {'items': 1, 'netAmount': '37.50'},
+        })
+
+    def test_top_limits_items_but_not_classes(self):
+        report = self.report('&top=2')
+        self.assertEqual([item['rank'] for item in report['items']], [1, 2])
+        self.assertEqual(sum(c['items'] for c in report['classes'].values()), 4)
+
+    def test_deltas_against_the_comparison_window(self):
+        first, second = self.report()['items'][:2]
+        self.assertEqual(
+            (first['previousQty'], first['previousNetAmount'], first['netAmountDelta'], first['netAmountDeltaPct']),
+            (1, '400.00', '400.00', '100.00'),
+        )
+        self.assertEqual(
+            (second['previousQty'], second['previousNetAmount'], second['netAmountDelta'], second['netAmountDeltaPct']),
+            (0, '0.00', '100.00', None),
+        )
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/ordermanagement/item-sales/?top=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/ordermanagement/item-sales/?abc=80').status_code, 400)
+
+
+class MonthlyItemSalesTest(TestCase):
+    URL = '/api/ordermanagement/item-sales/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(13)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.branch = branches[0]
+        cls.cashier = synthetic.make_cashier(rng, business, cls.branch)
+        cls.items = synthetic.make_items(rng, 2)
+        cls.customer = synthetic.make_customers(rng, cls.branch, 1)[0]
+        cls.add_order('2024-12-05', [(0, '10.00', 1)])
+        cls.add_order('2025-01-15', [(0, '100.00', 2)], discount='20.00')
+        cls.add_order('2025-01-05', [(1, '30.00', 1)])
+        cls.add_order('2025-02-10', [(1, '50.00', 3)])
+
+    @classmethod
+    def add_order(cls, day, lines, discount='0'):
+        order = Order.objects.create(
+            customer=cls.customer, branch=cls.branch, status='closed', is_paid=True, discount=Decimal(discount),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, item=cls.items[index], price=Decimal(price), quantity=quantity)
+            for index, price, quantity in lines
+        ])
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime.fromisoformat(f'{day} 12:00')))
+        apply_order_tax([order.pk])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.cashier)
+
+    def report(self, period='2025-01-01:2025-02-28', compare='2024-11-01:2024-12-31'):
+        response = self.client.get(self.URL, {'period': period, 'compare': compare})
+        self.assertEqual(response.status_code, 200)
+        return {
+            item['skuCode']: (item['itemTotalQty'], item['itemTotalNetAmount'], item['previousNetAmount'])
+            for item in response.json()['items']
+        }
+
+    def line_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            self.report(**params)
+        return [query['sql'] for query in queries if 'features_orderitem' in query['sql']]
+
+    def test_whole_months_match_the_lines(self):
+        first, second = (item.sku_code for item in self.items)
+        self.assertEqual(self.report(), {first: (2, '180.00', '10.00'), second: (4, '180.00', '0.00')})
+        # Partial months at either end are summed from the lines.
+        self.assertEqual(
+            self.report('2025-01-10:2025-02-10', '2024-12-06:2025-01-09'),
+            {first: (2, '180.00', '0.00'), second: (3, '150.00', '30.00')},
+        )
+
+    def test_closed_months_are_served_from_the_cache(self):
+        self.assertEqual(len(self.line_queries()), 1)
+        self.assertEqual(self.line_queries(), [])
+
+    def test_back_dated_orders_are_picked_up(self):
+        self.report()
+        self.add_order('2025-02-20', [(0, '5.00', 1)])
+        self.assertEqual(len(self.line_queries()), 1)
+        self.assertEqual(self.report()[self.items[0].sku_code], (3, '185.00', '10.00'))
+
+    def test_deleted_orders_are_dropped(self):
+        self.report()
+        Order.objects.get(created_at__date='2025-02-10').delete()
+        self.assertEqual(self.report('2025-02-01:2025-02-28'), {self.items[0].sku_code: (0, '0.00', '10.00')})
+
+
+class HourlyHeatmapTest(TestCase):
+    URL = '/api/ordermanagement/hourly-heatmap/'
+    WEEK = '2026-W10'  # Monday 2 March 2026
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(19)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+        cls.upload('2026-03-03T09:30:00+00:00')
+
+    @classmethod
+    def upload(cls, created_at):
+        order = {
+            'client_id': str(uuid.uuid4()),
+            'customer': cls.customer.pk,
+            'created_at': created_at,
+            'lines': [[cls.item.pk, 2, '20.00']],
+            'payments': [],
+        }
+        apply_bundle(cls.cashier, {'orders': [order]})
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.cashier)
+
+    def heatmap(self, **params):
+        response = self.client.get(self.URL, {'week': self.WEEK, 'weeks': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_orders_land_on_their_weekday_and_hour(self):
+        report = self.heatmap()
+        self.assertEqual(report['weeks'], [self.WEEK])
+        self.assertEqual(report['heatmap'][1][9], [1, 40.0])
+        self.assertEqual(report['peakHours'], [{'weekday': 2, 'hour': 9, 'orders': 1, 'avgOrders': 1.0, 'netSales': 40.0}])
+
+    def test_offline_uploads_into_a_cached_week_are_counted(self):
+        self.heatmap()
+        self.upload('2026-03-04T18:15:00+00:00')
+        self.assertEqual(self.heatmap()['heatmap'][2][18], [1, 40.0])
+
+    def test_future_weeks_are_refused(self):
+        next_week = (timezone.localdate() + timedelta(weeks=1)).strftime('%G-W%V')
+        self.assertEqual(self.client.get(self.URL, {'week': next_week}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
+
+
+class TillSessionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(23)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.branch = branches[0]
+        cls.cashier = synthetic.make_cashier(rng, business, cls.branch)
+        cls.colleague = cls.make_user(business, 'cashier')
+        cls.manager = cls.make_user(business, 'manager')
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, cls.branch, 1)[0]
+
+    @classmethod
+    def make_user(cls, business, role):
+        return User.objects.create_user(
+            user_id=f'{cls.branch.id}_{role}_{User.objects.count()}',
+            pin=synthetic.BENCH_PIN,
+            first_name='Test',
+            last_name=role.title(),
+            role=role,
+            business=business,
+            branch=cls.branch,
+            contact=Contact.objects.create(email=f'{role}{User.objects.count()}@test.local'),
+            is_active=True,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def open_session(self, opening_float='100.00'):
+        response = self.client.post('/api/sessions/open/', {'opening_float': opening_float}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return Session.objects.get(pk=response.json()['id'])
+
+    def ring_up(self, price='50.00', quantity=2):
+        order = Order.objects.create(customer=self.customer, branch=self.branch, status='open', session=Session.open_for(self.cashier))
+        OrderItem.objects.create(order=order, item=self.item, price=Decimal(price), quantity=quantity)
+        return order
+
+    def close_order(self, order):
+        return self.client.post(f'/api/POS/orders/interaction/{order.pk}/close/')
+
+    def test_only_one_session_is_open_per_user(self):
+        self.open_session()
+        response = self.client.post('/api/sessions/open/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_running_totals_and_close_out(self):
+        session = self.open_session()
+        order = self.ring_up()
+        self.assertEqual(self.close_order(order).status_code, 200)
+        total = Order.objects.get(pk=order.pk).total_price()
+        settle(order.pk, [{'mode': 'cash', 'amount': None}], user=self.cashier)
+
+        response = self.client.post('/api/sessions/current/close/', {'counted_cash': '90.00'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['sales_count'], Decimal(report['net_sales'])), (1, total))
+        self.assertEqual(report['payments'], [{'mode': 'cash', 'amount': str(total), 'count': 1}])
+        self.assertEqual(Decimal(report['expected_cash']), Decimal('100.00') + total)
+        session.refresh_from_db()
+        self.assertIsNotNone(session.ended_at)
+        response = self.client.post(f'/api/sessions/{session.pk}/close/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_closed_sessions_take_no_sales_or_payments(self):
+        session = self.open_session()
+        Session.objects.filter(pk=session.pk).update(ended_at=timezone.now())
+        with self.assertRaises(SessionClosed):
+            Session.add_sale(session.pk, Decimal('10.00'))
+        with self.assertRaises(SessionClosed):
+            Session.add_payment(session.pk, 'cash', Decimal('10.00'))
+        session.refresh_from_db()
+        self.assertEqual((session.sales_count, session.payment_totals.count()), (0, 0))
+
+    def test_orders_from_a_closed_session_count_towards_the_next_one(self):
+        first = self.open_session()
+        order = self.ring_up()
+        self.client.post('/api/sessions/current/close/', {}, content_type='application/json')
+        second = self.open_session()
+        self.assertEqual(self.close_order(order).status_code, 200)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.sales_count, second.sales_count), (0, 1))
+        self.assertEqual(Order.objects.get(pk=order.pk).session_id, second.pk)
+
+    def test_only_the_owner_or_a_manager_can_close(self):
+        session = self.open_session()
+        url = f'/api/sessions/{session.pk}/close/'
+        self.client.force_login(self.colleague)
+        self.assertEqual(self.client.post(url, {}, content_type='application/json').status_code, 403)
+        session.refresh_from_db()
+        self.assertIsNone(session.ended_at)
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.post(url, {}, content_type='application/json').status_code, 200)
+
+
+class SettlementTest(TestCase):
+    URL = '/api/POS/payment/manual-payment/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(3)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.branch = branches[0]
+        cls.cashier = synthetic.make_cashier(rng, business, cls.branch)
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, cls.branch, 1)[0]
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+        self.session = Session.objects.create(name='Till 1', branch=self.branch, user=self.cashier, started_at=timezone.now())
+        self.order = Order.objects.create(customer=self.customer, branch=self.branch, status='open')
+        OrderItem.objects.create(order=self.order, item=self.item, price=Decimal('50.00'), quantity=2)
+
+    def pay(self, mode, amount):
+        return self.client.post(
+            self.URL, {'order_id': self.order.pk, 'mode': mode, 'amount_received': amount}, content_type='application/json',
+        )
+
+    def test_partial_tenders_then_final_tender(self):
+        response = self.pay('cash', '30.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['outstanding'], response.json()['is_paid']), ('70.00', False))
+
+        response = self.pay('card', '70.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['outstanding'], response.json()['is_paid']), ('0.00', True))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.amount_paid, self.order.payment_mode), (Decimal('100.00'), 'split'))
+
+    def test_cash_overpay_gives_change(self):
+        response = self.pay('cash', '150.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['change_due'], '50.00')
+        self.assertEqual(list(self.order.payments.values_list('amount', flat=True)), [Decimal('100.00')])
+
+    def test_non_cash_overpay_is_rejected(self):
+        response = self.pay('card', '150.00')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.order.payments.exists())
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
+
+    def test_razorpay_without_amount_covers_the_balance(self):
+        self.pay('cash', '40.00')
+        order, result = settle(self.order.pk, [{'mode': 'razorpay', 'amount': None, 'reference': 'pay_1'}])
+        self.assertTrue(order.is_paid)
+        self.assertEqual(result['payments'][0]['amount'], '60.00')
+        self.assertTrue(Payment.objects.filter(order=order, mode='razorpay', reference='pay_1').exists())
+
+    def test_payments_are_recorded_against_the_open_session(self):
+        self.pay('cash', '30.00')
+        self.pay('upi', '70.00')
+        self.assertEqual(
+            sorted(self.session.payments.values_list('mode', 'amount')),
+            [('cash', Decimal('30.00')), ('upi', Decimal('70.00'))],
+        )
+        self.assertEqual(
+            sorted(SessionPaymentTotal.objects.filter(session=self.session).values_list('mode', 'amount', 'count')),
+            [('cash', Decimal('30.00'), 1), ('upi', Decimal('70.00'), 1)],
+        )
+
+    def test_tender_on_a_paid_order_is_not_found(self):
+        self.assertEqual(self.pay('cash', '100.00').status_code, 200)
+        self.assertEqual(self.pay('cash', '10.00').status_code, 404)
+        self.assertEqual(self.order.payments.count(), 1)
+
+
+@override_settings(PAYMENT_GATEWAY='local')
+class LocalGatewayTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(9)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+
+    def setUp(self):
+        get_gateway.cache_clear()
+        self.addCleanup(get_gateway.cache_clear)
+        self.client.force_login(self.cashier)
+
+    def test_create_and_verify(self):
+        gateway = LocalGateway()
+        order = gateway.create_order(5000, receipt=7)
+        self.assertEqual((order['amount'], order['currency'], order['receipt']), (5000, 'INR', 7))
+        self.assertTrue(order['id'].startswith('order_local_'))
+
+        gateway.verify_payment(order['id'], 'pay_1', gateway.sign_payment(order['id'], 'pay_1'))
+        with self.assertRaises(SignatureError):
+            gateway.verify_payment(order['id'], 'pay_2', gateway.sign_payment(order['id'], 'pay_1'))
+        gateway.verify_webhook(b'{}', gateway.sign_webhook(b'{}'))
+        with self.assertRaises(SignatureError):
+            gateway.verify_webhook(b'{}', '')
+
+    def test_initiate_and_verify_through_the_api(self):
+        self.assertIsInstance(get_gateway(), LocalGateway)
+        order = Order.objects.create(customer=self.customer, branch=self.customer.branch, status='open')
+        OrderItem.objects.create(order=order, item=self.item, price=Decimal('25.00'), quantity=2)
+
+        response = self.client.post(
+            '/api/POS/payment/initiate-razorpay/', {'order_id': order.pk}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        gateway_order_id = response.json()['razorpay_order_id']
+        self.assertEqual(response.json()['amount'], 50.0)
+
+        response = self.client.post('/api/POS/payment/verify-razorpay/', {
+            'order_id': order.pk,
+            'razorpay_order_id': gateway_order_id,
+            'razorpay_payment_id': 'pay_local_1',
+            'razorpay_signature': get_gateway().sign_payment(gateway_order_id, 'pay_local_1'),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_paid'])
+        order.refresh_from_db()
+        self.assertEqual(order.gateway_order_id, gateway_order_id)
+
+
+@override_settings(PAYMENT_GATEWAY='local')
+class RazorpayWebhookTest(TestCase):
+    URL = '/api/payments/webhooks/razorpay/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(13)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+
+    def setUp(self):
+        get_gateway.cache_clear()
+        self.addCleanup(get_gateway.cache_clear)
+        self.order = Order.objects.create(
+            customer=self.customer, branch=self.customer.branch, status='open', gateway_order_id='order_local_1',
+        )
+        OrderItem.objects.create(order=self.order, item=self.item, price=Decimal('25.00'), quantity=2)
+
+    def deliver(self, event_id, payment_id='pay_1', gateway_order_id='order_local_1', signature=None):
+        body = json.dumps({
+            'event': 'payment.captured',
+            'payload': {'payment': {'entity': {'id': payment_id, 'order_id': gateway_order_id, 'amount': 5000}}},
+        }).encode()
+        return self.client.generic(
+            'POST', self.URL, body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=get_gateway().sign_webhook(body) if signature is None else signature,
+            HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def verify(self, payment_id='pay_1'):
+        self.client.force_login(self.cashier)
+        return self.client.post('/api/POS/payment/verify-razorpay/', {
+            'order_id': self.order.pk,
+            'razorpay_order_id': 'order_local_1',
+            'razorpay_payment_id': payment_id,
+            'razorpay_signature': get_gateway().sign_payment('order_local_1', payment_id),
+        }, content_type='application/json')
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(self.deliver('evt_1', signature='0' * 64).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_duplicate_event_is_stored_and_applied_once(self):
+        self.assertEqual(self.deliver('evt_1').status_code, 200)
+        self.assertEqual(self.deliver('evt_1').status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(process_pending(), 1)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.is_paid)
+        self.assertEqual(Payment.objects.filter(reference='pay_1').count(), 1)
+
+    def test_failing_event_stops_after_max_attempts(self):
+        self.deliver('evt_1', gateway_order_id='order_unknown')
+        with self.assertLogs('cashflow.webhooks', 'WARNING') as logs:
+            for _ in range(MAX_ATTEMPTS):
+                self.assertEqual(process_pending(), 1)
+        self.assertEqual(len(logs.output), MAX_ATTEMPTS)
+        self.assertEqual(process_pending(), 0)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.attempts, event.processed_at), (MAX_ATTEMPTS, None))
+        self.assertIn('order_unknown', event.last_error)
+
+    def test_capture_after_verify_is_only_marked_processed(self):
+        self.assertEqual(self.verify().status_code, 200)
+        self.deliver('evt_1')
+        self.assertEqual(process_pending(), 1)
+        self.assertIsNotNone(WebhookEvent.objects.get().processed_at)
+        self.assertEqual(Payment.objects.filter(reference='pay_1').count(), 1)
+
+    def test_capture_recorded_under_the_order_lock_is_reported_not_failed(self):
+        settle(self.order.pk, [{'mode': 'razorpay', 'amount': None, 'reference': 'pay_1'}])
+        # The order is paid by now; the repeat is still recognised by its reference.
+        with self.assertRaises(TenderAlreadyRecorded):
+            settle(self.order.pk, [{'mode': 'razorpay', 'amount': None, 'reference': 'pay_1'}])
+        self.deliver('evt_1')
+        self.assertEqual(process_pending(), 1)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.attempts, event.last_error), (0, ''))
+        self.assertIsNotNone(event.processed_at)
+
+    def test_gateway_references_are_unique_per_mode(self):
+        Payment.objects.create(order=self.order, mode='razorpay', amount=Decimal('1.00'), reference='pay_9')
+        Payment.objects.create(order=self.order, mode='upi', amount=Decimal('1.00'), reference='pay_9')
+        for _ in range(2):
+            Payment.objects.create(order=self.order, mode='cash', amount=Decimal('1.00'))
+            Payment.objects.create(order=self.order, mode='cash', amount=Decimal('1.00'), reference='')
+        with transaction.atomic(), self.assertRaises(IntegrityError):
+            Payment.objects.create(order=self.order, mode='razorpay', amount=Decimal('1.00'), reference='pay_9')
+
+    def test_verify_after_capture_does_not_pay_again(self):
+        self.deliver('evt_1')
+        process_pending()
+        response = self.verify()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['message'], 'Razorpay payment already recorded')
+        self.assertEqual(Payment.objects.filter(order=self.order).count(), 1)
+
+
+class SalesMatrixTest(TestCase):
+    URL = '/api/ordermanagement/sales-matrix/'
+    DAY = '2026-03-02:2026-03-02'
+    NEXT_DAY = '2026-03-03:2026-03-03'
+    MONTH = '2026-03-01:2026-03-31'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(11)
+        business, (cls.branch, cls.second) = synthetic.make_business(rng, 1, branches=2)
+        _, (cls.foreign,) = synthetic.make_business(rng, 2)
+        cls.cashier = synthetic.make_cashier(rng, business, cls.branch)
+        cls.item = synthetic.make_items(rng, 1)[0]
+        customers = {branch: synthetic.make_customers(rng, branch, 1)[0] for branch in (cls.branch, cls.second, cls.foreign)}
+        for branch, day, price, discount in [
+            (cls.branch, 2, '100.00', 0),
+            (cls.branch, 2, '40.00', 0),
+            (cls.branch, 3, '50.00', 10),
+            (cls.second, 3, '30.00', 0),
+            (cls.foreign, 2, '999.00', 0),
+        ]:
+            order = Order.objects.create(customer=customers[branch], status='closed', discount=discount)
+            OrderItem.objects.create(order=order, item=cls.item, price=Decimal(price), quantity=1)
+            created_at = timezone.make_aware(datetime(2026, 3, day, 12))
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def matrix(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cells_are_branch_by_period(self):
+        report = self.matrix(periods=','.join([self.DAY, self.NEXT_DAY, self.MONTH]))
+        self.assertEqual([b['id'] for b in report['branches']], [self.branch.pk, self.second.pk])
+        self.assertEqual([p['start'] for p in report['periods']], ['2026-03-02', '2026-03-03', '2026-03-01'])
+        self.assertEqual(report['matrix'], [
+            [[140.0, 0.0, 140.0, 2], [50.0, 10.0, 40.0, 1], [190.0, 10.0, 180.0, 3]],
+            [[0.0, 0.0, 0.0, 0], [30.0, 0.0, 30.0, 1], [30.0, 0.0, 30.0, 1]],
+        ])
+
+    def test_branches_can_be_picked(self):
+        report = self.matrix(branches=str(self.second.pk), periods=self.MONTH)
+        self.assertEqual((len(report['branches']), report['matrix']), (1, [[[30.0, 0.0, 30.0, 1]]]))
+
+    def test_other_businesses_are_out_of_reach(self):
+        response = self.client.get(self.URL, {'branches': f'{self.branch.pk},{self.foreign.pk}', 'periods': self.MONTH})
+        self.assertEqual(response.status_code, 403)
+        report = self.matrix(periods=self.MONTH)
+        self.assertNotIn(self.foreign.pk, [b['id'] for b in report['branches']])
+        self.assertEqual(sum(row[0][3] for row in report['matrix']), 4)
+
+    def test_bad_parameters_are_refused(self):
+        for params in ({'periods': 'fortnight'}, {'periods': '2026-03-05:2026-03-01'}, {'branches': 'one'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.URL, params).status_code, 400)
@@ -1,12 +1,40 @@
 from django.urls import path
 from rest_framework.permissions import IsAuthenticated
-from .views import CashSummaryView
+from .views import (
+    CashSummaryView, HourlyHeatmapView, ItemSalesView, SalesMatrixView,
+    RazorpayWebhookView, SessionCloseView, SessionDetailView, SessionOpenView,
+)
 
 urlpatterns = [
     path('ordermanagement/dailysales/', 
          CashSummaryView.as_view(permission_classes=[IsAuthenticated]), 
          name='daily-sales'
     ),
+    path('ordermanagement/sales-matrix/',
+         SalesMatrixView.as_view(permission_classes=[IsAuthenticated]),
+         name='sales-matrix'
+    ),
+    path('ordermanagement/item-sales/',
+         ItemSalesView.as_view(permission_classes=[IsAuthenticated]),
+         name='item-sales'
+    ),
+    path('ordermanagement/hourly-heatmap/',
+         HourlyHeatmapView.as_view(permission_classes=[IsAuthenticated]),
+         name='hourly-heatmap'
+    ),
+    path('sessions/open/',
+         SessionOpenView.as_view(permission_classes=[IsAuthenticated]),
+         name='session-open'
+    ),
+    path('sessions/<str:pk>/',
+         SessionDetailView.as_view(permission_classes=[IsAuthenticated]),
+         name='session-detail'
+    ),
+    path('sessions/<str:pk>/close/',
+         SessionCloseView.as_view(permission_classes=[IsAuthenticated]),
+         name='session-close'
+    ),
+    path('payments/webhooks/razorpay/', RazorpayWebhookView.as_view(), name='razorpay-webhook'),
     # Keeping old endpoints for backward compatibility
     path('sales/report/', CashSummaryView.as_view(), name='sales-report'),
     path('cashsummary/', CashSummaryView.as_view(), name='cash-summary')
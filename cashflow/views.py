@@ -1,14 +1,64 @@
+import hashlib
+import json
+
 from rest_framework.views import APIView
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import transaction
+from django.utils import timezone
 from django.utils.timezone import make_aware
 from datetime import datetime, timedelta
-from django.db.models import Sum, Count, Avg, Q, F
-from features.models import Order, OrderItem
-from cashflow.models import Payment, Tip, Session, ReturnOrder
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Sum, Count
+from features.models import Order
+from features.sales import sales_signatures
+from cashflow.reports import cash_summary, hourly_sales, item_sales, order_gross
+from cashflow.gateways import SignatureError, get_gateway
+from cashflow.models import Session, WebhookEvent
+from cashflow.serializer import (
+    CashSummarySerializer, ItemSalesSerializer, SessionCloseSerializer, SessionOpenSerializer, TillSessionSerializer,
+)
+from django.db.models.functions import TruncDate
+from business.models import Branch
 from users.models import User
-from customer.models import Customer
-from django.db.models.functions import TruncDate, TruncMonth
+
+VALID_PERIODS = ['today', 'yesterday', 'this_month', 'last_month']
+
+
+def resolve_period(period):
+    """
+    Return the aware ``(start, end)`` datetimes covered by a named period
+    (see ``VALID_PERIODS``) or a ``YYYY-MM-DD:YYYY-MM-DD`` date range.
+    Raises ValueError for anything else.
+    """
+    now = datetime.now()
+    if period == 'today':
+        start, end = now, now
+    elif period == 'yesterday':
+        start = end = now - timedelta(days=1)
+    elif period == 'this_month':
+        start = now.replace(day=1)
+        next_month = now.month % 12 + 1
+        next_year = now.year + (1 if next_month == 1 else 0)
+        end = datetime(next_year, next_month, 1) - timedelta(days=1)
+    elif period == 'last_month':
+        end = now.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+    elif ':' in period:
+        start_str, end_str = period.split(':', 1)
+        start = datetime.strptime(start_str, '%Y-%m-%d')
+        end = datetime.strptime(end_str, '%Y-%m-%d')
+        if start > end:
+            raise ValueError(f"Invalid date range {period!r}")
+    else:
+        raise ValueError(f"Invalid period {period!r}")
+    return (
+        make_aware(datetime(start.year, start.month, start.day)),
+        make_aware(datetime(end.year, end.month, end.day, 23, 59, 59)),
+    )
+
 
 class CashSummaryView(APIView):
     def get(self, request):
@@ -20,12 +70,9 @@ class CashSummaryView(APIView):
             )
             
         branch = request.user.branch
-        print("🔍 Branch:", branch)
         period = request.query_params.get('period')
         start_date_str = request.query_params.get('start_date')
         end_date_str = request.query_params.get('end_date')
-        print("📅 Start Date:", start_date_str)
-        print("📅 End Date:", end_date_str)
 
         try:
             # Handle date range
@@ -33,30 +80,11 @@ class CashSummaryView(APIView):
                 start_date = make_aware(datetime.strptime(start_date_str, '%Y-%m-%d'))
                 end_date = make_aware(datetime.strptime(end_date_str, '%Y-%m-%d')).replace(hour=23, minute=59, second=59)
             elif period:
-                if period == 'today':
-                    start_date = make_aware(datetime.now().replace(hour=0, minute=0, second=0))
-                    end_date = make_aware(datetime.now().replace(hour=23, minute=59, second=59))
-                elif period == 'yesterday':
-                    yesterday = datetime.now() - timedelta(days=1)
-                    start_date = make_aware(yesterday.replace(hour=0, minute=0, second=0))
-                    end_date = make_aware(yesterday.replace(hour=23, minute=59, second=59))
-                elif period == 'this_month':
-                    today = datetime.now()
-                    start_date = make_aware(datetime(today.year, today.month, 1))
-                    next_month = today.month % 12 + 1
-                    next_year = today.year + (1 if next_month == 1 else 0)
-                    end_date = make_aware(datetime(next_year, next_month, 1) - timedelta(days=1))
-                    end_date = end_date.replace(hour=23, minute=59, second=59)
-                elif period == 'last_month':
-                    today = datetime.now()
-                    first_day_this_month = today.replace(day=1)
-                    last_day_last_month = first_day_this_month - timedelta(days=1)
-                    start_date = make_aware(datetime(last_day_last_month.year, last_day_last_month.month, 1))
-                    end_date = make_aware(last_day_last_month.replace(hour=23, minute=59, second=59))
-                else:
-                    valid_periods = ['today', 'yesterday', 'this_month', 'last_month']
+                try:
+                    start_date, end_date = resolve_period(period)
+                except ValueError:
                     return Response(
-                        {'error': f'Invalid period. Valid options are: {", ".join(valid_periods)}'}, 
+                        {'error': f'Invalid period. Valid options are: {", ".join(VALID_PERIODS)}'}, 
                         status=status.HTTP_400_BAD_REQUEST
                     )
             else:
@@ -64,77 +92,34 @@ class CashSummaryView(APIView):
                 start_date = make_aware(datetime.now().replace(hour=0, minute=0, second=0))
                 end_date = make_aware(datetime.now().replace(hour=23, minute=59, second=59))
 
-            # Get orders for the current branch in the date range
-            # First get all customers in the current branch
-            customers_in_branch = Customer.objects.filter(branch=request.user.branch)
-            print("👥 Customers in Branch:", customers_in_branch.count())
+            report = cash_summary(branch, start_date, end_date)
 
-            # Then get orders for those customers
-            orders = Order.objects.filter(
-                created_at__range=(start_date, end_date),
-                customer__in=customers_in_branch
-            )
-            print("📦 Orders found:", orders.count())
-
-            # Get related data
-            order_items = OrderItem.objects.filter(order__in=orders)
-            payments = Payment.objects.filter(order__in=orders)
-            print("🧾 Order Items:", order_items.count())
-            print("💰 Payments found:", payments.count())
-            tips = Tip.objects.filter(order__in=orders)
-            returns = ReturnOrder.objects.filter(original_order__in=orders)
-            sessions = Session.objects.filter(
-                started_at__lte=end_date,
-                ended_at__gte=start_date
-            )
+            # ?report=full returns every breakdown in the CashSummarySerializer shape
+            if request.query_params.get('report') == 'full':
+                return Response(CashSummarySerializer(report).data)
 
-            # Calculate metrics
-            gross = order_items.aggregate(total=Sum(F('price') * F('quantity')))['total'] or 0
-            discount = orders.aggregate(total=Sum('discount'))['total'] or 0
-            tip_total = tips.aggregate(total=Sum('amount'))['total'] or 0
-            payment_total = payments.aggregate(total=Sum('amount'))['total'] or 0
-            # Calculate return total from the original order's total price
-            return_total = sum(
-                return_order.original_order.total_price() 
-                for return_order in returns
-            )
-           
-            # Calculate tax total from order items if tax is included in item prices
-            tax_total = 0  # Default to 0 if tax calculation is not implemented
-            round_off = 0  # Not currently tracked in the Order model
-            net_sales = gross - discount
-            
-            # Calculate number of unique customers
-            no_of_people = orders.values('customer').distinct().count()
-            no_of_sales = orders.count()
-            avg_sale = net_sales / no_of_sales if no_of_sales > 0 else 0
-            avg_sale_per_person = net_sales / no_of_people if no_of_people > 0 else 0
-
-            # Prepare response with only essential fields
+            net_sales = report['netAmount']
             response_data = {
-                "branchName": request.user.branch.branch_name if hasattr(request.user.branch, 'branch_name') else "Unnamed Branch",
-                "grossSales": float(gross),
-                "salesReturn": float(return_total),
-                "discount": float(discount),
+                "branchName": branch.branch_name if hasattr(branch, 'branch_name') else "Unnamed Branch",
+                "grossSales": float(report['grossAmount']),
+                "salesReturn": float(report['returnAmount']),
+                "discount": float(report['discountTotal']),
                 "directCharges": 0.0,
                 "netSales": float(net_sales),
                 "otherCharges": 0.0,
-                "tax": 0.0,
+                "tax": float(report['taxTotal']),
                 "rounding": 0.0,
-                "tip": float(tip_total),
-                "totalRevenue": float(net_sales + tip_total),
-                "payment": float(payment_total),
-                "balanceDue": float(max(0, net_sales - payment_total)),
+                "tip": float(report['tipTotal']),
+                "totalRevenue": float(report['revenue']),
+                "payment": float(report['paymentTotal']),
+                "balanceDue": float(report['balanceAmount']),
                 "netSalesTotal": float(net_sales),
-                "numberOfSales": no_of_sales,
-                "averageSale": float(avg_sale),
-                "numberOfPeople": no_of_people,
-                "averageSalePerPerson": float(avg_sale_per_person),
-                "asOfTime": datetime.now().isoformat()
+                "numberOfSales": report['noOfSales'],
+                "averageSale": float(report['avgSaleAmount']),
+                "numberOfPeople": report['noOfPeople'],
+                "averageSalePerPerson": float(report['avgSaleAmountPerPerson']),
+                "asOfTime": report['asOfTime'],
             }
-            print("🧮 Net Sales:", net_sales)
-            print("💸 Payment Total:", payment_total)
-            print("📊 Response Summary:", response_data)
             return Response(response_data)
 
         except Exception as e:
@@ -142,3 +127,347 @@ class CashSummaryView(APIView):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class SalesMatrixView(APIView):
+    """
+    Sales summary for several branches and periods in one call.
+
+    Query params:
+      branches: comma-separated branch ids, or ``all`` (default) for every
+                branch of the user's business
+      periods:  comma-separated periods as accepted by ``resolve_period``
+                (default ``today``)
+
+    Orders are aggregated once, grouped by branch and day; each period cell
+    is then the sum of its days. ``matrix[i][j]`` holds the figures for
+    ``branches[i]`` over ``periods[j]``.
+    """
+    METRICS = ['grossSales', 'discount', 'netSales', 'numberOfSales']
+
+    def get(self, request):
+        business = getattr(request.user, 'business', None)
+        if business is None:
+            return Response(
+                {'error': 'User is not associated with any business'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        branches = Branch.objects.filter(business=business).order_by('id')
+        branch_param = request.query_params.get('branches', 'all')
+        if branch_param != 'all':
+            try:
+                branch_ids = {int(value) for value in branch_param.split(',') if value}
+            except ValueError:
+                return Response({'error': 'branches must be a list of ids or "all"'}, status=status.HTTP_400_BAD_REQUEST)
+            branches = branches.filter(id__in=branch_ids)
+        branches = list(branches.values('id', 'branch_name'))
+        if branch_param != 'all' and len(branches) != len(branch_ids):
+            return Response(
+                {'error': 'One or more branches do not belong to your business'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        period_keys = request.query_params.get('periods', 'today').split(',')
+        periods = []
+        for key in period_keys:
+            try:
+                start, end = resolve_period(key)
+            except ValueError:
+                return Response(
+                    {'error': f'Invalid period {key!r}. Use one of {", ".join(VALID_PERIODS)} or YYYY-MM-DD:YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            periods.append((key, start.date(), end.date()))
+
+        start = make_aware(datetime.combine(min(p[1] for p in periods), datetime.min.time()))
+        end = make_aware(datetime.combine(max(p[2] for p in periods), datetime.max.time()))
+
+        daily = (
+            Order.objects
+            .filter(branch__in=[b['id'] for b in branches], created_at__range=(start, end))
+            .annotate(order_gross=order_gross())
+            .values('branch', day=TruncDate('created_at'))
+            .annotate(gross=Sum('order_gross'), discount=Sum('discount'), sales=Count('id'))
+            .order_by()
+        )
+
+        cells = {}
+        for row in daily:
+            for index, (_, period_start, period_end) in enumerate(periods):
+                if period_start <= row['day'] <= period_end:
+                    cell = cells.setdefault((row['branch'], index), [Decimal('0'), Decimal('0'), 0])
+                    cell[0] += row['gross'] or 0
+                    cell[1] += row['discount'] or 0
+                    cell[2] += row['sales']
+
+        matrix = []
+        for branch in branches:
+            branch_row = []
+            for index in range(len(periods)):
+                gross, discount, sales = cells.get((branch['id'], index), (Decimal('0'), Decimal('0'), 0))
+                branch_row.append([float(gross), float(discount), float(gross - discount), sales])
+            matrix.append(branch_row)
+
+        return Response({
+            'branches': [{'id': b['id'], 'name': b['branch_name']} for b in branches],
+            'periods': [{'key': key, 'start': s.isoformat(), 'end': e.isoformat()} for key, s, e in periods],
+            'metrics': self.METRICS,
+            'matrix': matrix,
+            'asOfTime': datetime.now().isoformat(),
+        })
+
+
+class ItemSalesView(APIView):
+    """
+    Item sales analytics for the user's branch.
+
+    Query params:
+      period:   a period accepted by ``resolve_period`` (default ``this_month``)
+      compare:  a period to compare against; defaults to the window of the
+                same length immediately before ``period``
+      top:      only return the first N items by net amount
+      abc:      cumulative-share thresholds for classes A and B (default ``80,95``)
+    """
+    def get(self, request):
+        branch = getattr(request.user, 'branch', None)
+        if branch is None:
+            return Response(
+                {'error': 'User is not associated with any branch'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            start_date, end_date = resolve_period(request.query_params.get('period', 'this_month'))
+            compare = request.query_params.get('compare')
+            if compare:
+                previous_start, previous_end = resolve_period(compare)
+            else:
+                length = (end_date.date() - start_date.date()).days + 1
+                previous_start = start_date - timedelta(days=length)
+                previous_end = end_date - timedelta(days=length)
+            thresholds = tuple(Decimal(value) for value in request.query_params.get('abc', '80,95').split(','))
+            top = int(request.query_params['top']) if 'top' in request.query_params else None
+            if len(thresholds) != 2 or (top is not None and top < 1):
+                raise ValueError
+        except (ValueError, ArithmeticError):
+            return Response(
+                {'error': 'Invalid period, compare, abc or top parameter'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        items = item_sales(branch, start_date, end_date, previous_start, previous_end, thresholds)
+        classes = {name: {'items': 0, 'netAmount': Decimal('0')} for name in 'ABC'}
+        for item in items:
+            classes[item['abcClass']]['items'] += 1
+            classes[item['abcClass']]['netAmount'] += item['itemTotalNetAmount']
+
+        return Response({
+            'period': {'start': start_date.date().isoformat(), 'end': end_date.date().isoformat()},
+            'comparedWith': {'start': previous_start.date().isoformat(), 'end': previous_end.date().isoformat()},
+            'classes': {name: {'items': c['items'], 'netAmount': str(c['netAmount'])} for name, c in classes.items()},
+            'items': ItemSalesSerializer(items[:top], many=True).data,
+            'asOfTime': datetime.now().isoformat(),
+        })
+
+
+class HourlyHeatmapView(APIView):
+    """
+    Orders and net sales by weekday and hour for the user's branch, summed
+    over a run of ISO weeks, with the busiest hours listed for staffing.
+
+    Query params:
+      week:   last ISO week to include, as ``YYYY-Www`` (default: current week)
+      weeks:  number of weeks ending at ``week`` (default 4, at most 52)
+      peaks:  number of peak hours to list (default 5)
+
+    ``heatmap[weekday - 1][hour]`` is ``[orders, netSales]`` with Monday as
+    weekday 1. Each (branch, week) grid is cached under the week's sales
+    signature (``features.sales``), so orders written into a past week, such
+    as an offline upload, make it be summed again; the current week is also
+    refreshed every few minutes. Weeks after the current one are refused.
+    """
+    MAX_WEEKS = 52
+    CACHE_TIMEOUT = 60 * 60 * 24 * 7
+    CURRENT_WEEK_CACHE_TIMEOUT = 60 * 5
+
+    def get(self, request):
+        branch = getattr(request.user, 'branch', None)
+        if branch is None:
+            return Response(
+                {'error': 'User is not associated with any branch'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        today = datetime.now().date()
+        current_monday = today - timedelta(days=today.weekday())
+        try:
+            week = request.query_params.get('week')
+            last_monday = datetime.strptime(f'{week}-1', '%G-W%V-%u').date() if week else current_monday
+            count = int(request.query_params.get('weeks', 4))
+            peaks = int(request.query_params.get('peaks', 5))
+            if not 1 <= count <= self.MAX_WEEKS or peaks < 0 or last_monday > current_monday:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': f'Invalid week, weeks or peaks parameter (week is YYYY-Www up to the current week, weeks 1-{self.MAX_WEEKS})'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        mondays = [last_monday - timedelta(weeks=n) for n in reversed(range(count))]
+        signatures = sales_signatures(branch, [(monday, monday + timedelta(days=6)) for monday in mondays])
+        keys = {
+            monday: f'hourly-heatmap:{branch.id}:{monday.isoformat()}:{signature}'
+            for monday, signature in zip(mondays, signatures)
+        }
+        cached = cache.get_many(keys.values())
+
+        missing = [monday for monday in mondays if keys[monday] not in cached]
+        if missing:
+            computed = hourly_sales(
+                branch,
+                make_aware(datetime.combine(missing[0], datetime.min.time())),
+                make_aware(datetime.combine(missing[-1] + timedelta(days=6), datetime.max.time())),
+            )
+            empty = [[[0, Decimal('0')] for _ in range(24)] for _ in range(7)]
+            fresh = {keys[monday]: computed.get(monday, empty) for monday in missing}
+            live = keys.get(current_monday)
+            cache.set_many({k: v for k, v in fresh.items() if k != live}, self.CACHE_TIMEOUT)
+            if live in fresh:
+                cache.set(live, fresh[live], self.CURRENT_WEEK_CACHE_TIMEOUT)
+            cached.update(fresh)
+
+        heatmap = [[[0, Decimal('0')] for _ in range(24)] for _ in range(7)]
+        for monday in mondays:
+            for weekday, hours in enumerate(cached[keys[monday]]):
+                for hour, (orders, net) in enumerate(hours):
+                    heatmap[weekday][hour][0] += orders
+                    heatmap[weekday][hour][1] += net
+
+        busiest = sorted(
+            ((cell[0], cell[1], weekday, hour) for weekday, hours in enumerate(heatmap) for hour, cell in enumerate(hours) if cell[0]),
+            key=lambda peak: (-peak[0], -peak[1]),
+        )[:peaks]
+
+        return Response({
+            'weeks': [monday.strftime('%G-W%V') for monday in mondays],
+            'metrics': ['orders', 'netSales'],
+            'heatmap': [[[orders, float(net)] for orders, net in hours] for hours in heatmap],
+            'peakHours': [
+                {
+                    'weekday': weekday + 1,
+                    'hour': hour,
+                    'orders': orders,
+                    'avgOrders': round(orders / count, 2),
+                    'netSales': float(net),
+                }
+                for orders, net, weekday, hour in busiest
+            ],
+            'asOfTime': datetime.now().isoformat(),
+        })
+
+
+class SessionOpenView(APIView):
+    """Open a till session for the requesting user at their branch."""
+    def post(self, request):
+        serializer = SessionOpenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            # Lock the user's row so two taps on "open shift" cannot race.
+            User.objects.select_for_update().filter(pk=request.user.pk).first()
+            if Session.objects.filter(user=request.user, ended_at__isnull=True).exists():
+                return Response(
+                    {'error': 'Close your open session before starting a new one'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            now = timezone.now()
+            session = Session.objects.create(
+                name=serializer.validated_data.get('name') or f"{request.user.user_id} {now:%Y-%m-%d %H:%M}",
+                branch=getattr(request.user, 'branch', None),
+                user=request.user,
+                started_at=now,
+                opening_float=serializer.validated_data['opening_float'],
+            )
+        return Response(TillSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class SessionDetailView(APIView):
+    """
+    Running totals of a till session. ``current`` resolves to the user's
+    open session.
+    """
+    def get_session(self, request, pk):
+        sessions = Session.objects.prefetch_related('payment_totals')
+        if pk == 'current':
+            return sessions.filter(user=request.user, ended_at__isnull=True).order_by('-started_at').first()
+        if not str(pk).isdigit():
+            return None
+        return sessions.filter(pk=pk, branch=getattr(request.user, 'branch', None)).first()
+
+    def get(self, request, pk):
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(TillSessionSerializer(session).data)
+
+
+class SessionCloseView(SessionDetailView):
+    """
+    Close a till session. Only the session's own user or a manager of the
+    branch may close it. The close-out report is read from the session's
+    running totals; no orders or payments are scanned.
+    """
+    http_method_names = ['post', 'options']
+    CLOSING_ROLES = ('admin', 'manager')
+
+    def post(self, request, pk):
+        serializer = SessionCloseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+        if session.user_id != request.user.pk and str(request.user.role).lower() not in self.CLOSING_ROLES:
+            return Response(
+                {'error': 'Only the session owner or a manager can close this session'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        closed = Session.objects.filter(pk=session.pk, ended_at__isnull=True).update(
+            ended_at=timezone.now(),
+            counted_cash=serializer.validated_data.get('counted_cash'),
+        )
+        if not closed:
+            return Response({'error': 'Session is already closed'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(TillSessionSerializer(self.get_session(request, session.pk)).data)
+
+
+class RazorpayWebhookView(APIView):
+    """
+    Razorpay webhook receiver. The signature is checked against the raw
+    body and the event is stored in the inbox with a single insert;
+    ``process_webhooks`` applies it to the order later. Redeliveries of an
+    event already in the inbox are acknowledged and dropped.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        body = request.body
+        try:
+            get_gateway().verify_webhook(body, request.headers.get('X-Razorpay-Signature'))
+        except SignatureError:
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            payload = json.loads(body)
+            event = payload['event']
+        except (ValueError, KeyError, TypeError):
+            return Response({'error': 'Malformed event'}, status=status.HTTP_400_BAD_REQUEST)
+
+        WebhookEvent.objects.bulk_create([WebhookEvent(
+            provider='razorpay',
+            event_id=request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(body).hexdigest(),
+            event=event,
+            payload=payload,
+        )], ignore_conflicts=True)
+        return Response({'status': 'accepted'})
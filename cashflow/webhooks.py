@@ -0,0 +1,86 @@
+"""
+Application of gateway webhook events from the ``WebhookEvent`` inbox.
+
+Events are claimed one at a time in id order with ``SKIP LOCKED``, so
+several workers can drain the inbox without blocking each other. Applying
+an event is idempotent: a capture whose gateway payment id is already
+recorded (by an earlier delivery or by the client's verify call) is only
+marked processed.
+"""
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from features.models import Order
+from cashflow.models import WebhookEvent
+from cashflow.settlement import SettlementError, TenderAlreadyRecorded, settle
+
+
+logger = logging.getLogger(__name__)
+
+# Events that carry a captured payment in ``payload.payment.entity``.
+CAPTURE_EVENTS = {'payment.captured', 'order.paid'}
+MAX_ATTEMPTS = 5
+
+
+class WebhookError(Exception):
+    """The event cannot be applied (yet)."""
+
+
+def apply_event(event):
+    if event.event not in CAPTURE_EVENTS:
+        return
+    try:
+        payment = event.payload['payload']['payment']['entity']
+        payment_id, gateway_order_id, amount = payment['id'], payment['order_id'], payment['amount']
+    except (KeyError, TypeError):
+        raise WebhookError("Payload has no payment entity")
+
+    order = Order.objects.filter(gateway_order_id=gateway_order_id).only('id').first()
+    if order is None:
+        raise WebhookError(f"No order for gateway order {gateway_order_id}")
+    try:
+        settle(order.id, [{'mode': 'razorpay', 'amount': Decimal(amount) / 100, 'reference': payment_id}])
+    except TenderAlreadyRecorded:
+        return
+    except Order.DoesNotExist:
+        raise WebhookError(f"Order {order.id} is already paid")
+    except SettlementError as e:
+        raise WebhookError(str(e))
+
+
+def process_pending(limit=100):
+    """
+    Apply up to ``limit`` pending events, oldest first. Returns the number
+    of events handled (applied or failed). An event that fails is retried
+    on a later run, up to ``MAX_ATTEMPTS`` times.
+    """
+    handled = 0
+    failed = []
+    while handled < limit:
+        with transaction.atomic():
+            event = (
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+                .exclude(id__in=failed)
+                .order_by('id')
+                .first()
+            )
+            if event is None:
+                break
+            try:
+                with transaction.atomic():
+                    apply_event(event)
+            except WebhookError as e:
+                event.attempts += 1
+                event.last_error = str(e)
+                failed.append(event.id)
+                logger.warning("Webhook event %s failed (attempt %s): %s", event.event_id, event.attempts, e)
+            else:
+                event.processed_at = timezone.now()
+                event.last_error = ''
+            event.save(update_fields=['attempts', 'last_error', 'processed_at'])
+        handled += 1
+    return handled
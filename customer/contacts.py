@@ -0,0 +1,70 @@
+"""
+Normalized customer contact keys.
+
+``Customer.phone_number`` keeps the number as it was typed; ``phone_e164``
+holds it in E.164 form (``+``, country code and number, at most 15 digits),
+which is what lookups and the per-branch uniqueness use. A number written
+without a country code is taken to be a national number in
+``settings.DEFAULT_PHONE_COUNTRY_CODE``. Email addresses live in
+``CustomerEmail`` rows, trimmed and lower-cased.
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+
+# Digits in a national number; longer numbers that start with the country
+# code already include it.
+NATIONAL_DIGITS = 10
+
+
+def normalize_phone(value):
+    """``value`` in E.164 form, or None if it cannot be a phone number."""
+    value = str(value or '').strip()
+    digits = re.sub(r'\D', '', value)
+    if value.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    else:
+        national = digits.lstrip('0')
+        code = settings.DEFAULT_PHONE_COUNTRY_CODE
+        digits = national if len(national) > NATIONAL_DIGITS and national.startswith(code) else code + national
+    if not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        return None
+    return f'+{digits}'
+
+
+def normalize_email(value):
+    """``value`` trimmed and lower-cased, or None if it is not an email address."""
+    value = str(value or '').strip().lower()
+    try:
+        validate_email(value)
+    except ValidationError:
+        return None
+    return value
+
+
+def split_emails(text):
+    """
+    The addresses in a comma-separated list, normalized and without
+    repeats. Raises ``ValueError`` naming the entries that are not valid.
+    """
+    entries = [entry.strip() for entry in str(text or '').split(',') if entry.strip()]
+    emails = [normalize_email(entry) for entry in entries]
+    invalid = [entry for entry, email in zip(entries, emails) if email is None]
+    if invalid:
+        raise ValueError(f"Invalid email address: {', '.join(invalid)}")
+    return list(dict.fromkeys(emails))
+
+
+def set_emails(customer, emails):
+    """Make the customer's ``CustomerEmail`` rows exactly ``emails`` (normalized)."""
+    addresses = customer.email_addresses
+    addresses.exclude(email__in=emails).delete()
+    addresses.model.objects.bulk_create(
+        [addresses.model(customer=customer, email=email) for email in emails],
+        ignore_conflicts=True,
+    )
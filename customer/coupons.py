@@ -0,0 +1,257 @@
+"""
+Coupon validation and redemption.
+
+A ``CouponCampaign`` belongs to one customer and is found by
+``(couponCode, customer)`` through an index. Validating a code at checkout
+reads the campaign from the cache, so it costs no query when the campaign
+was seen recently and one indexed read when it was not. Campaign saves and
+redemptions drop the cached entry.
+
+Redemption runs in one transaction. It locks the order, then increments
+``timesRedeemed`` with a conditional UPDATE that only matches while the
+campaign is in its date window and has uses left, so concurrent
+redemptions cannot go over ``usageLimit``. The discount from the linked
+``Discount`` rows is added to the order's discount, capped at what is
+still owed.
+
+A bulk campaign has no customer. Its codes are ``CouponCode`` rows, created
+by ``generate_codes`` or ``import_codes`` in chunks of one INSERT each, with
+``ON CONFLICT DO NOTHING`` on the unique code so a clash is skipped rather
+than failing the batch. A code that is not one of the customer's own is
+looked up there. ``usageLimit`` then applies per customer, across all of
+the campaign's codes: the customer's ``CouponRedemption`` rows for the
+campaign are counted with the customer row locked, so concurrent orders of
+one customer cannot go over it. Codes only count their uses.
+"""
+import base64
+import secrets
+from decimal import Decimal
+
+from django.apps import apps
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, IntegerField, Sum, Value
+from django.utils import timezone
+
+from features.models import Order, OrderItem
+from features.tax import apply_order_tax
+
+
+CACHE_TIMEOUT = 60 * 5
+ZERO = Decimal('0')
+
+# Base32 without 0, 1, I and O, which are easy to misread on a printed coupon.
+CODE_ALPHABET = '23456789ABCDEFGHJKLMNPQRSTUVWXYZ'
+CODE_LENGTH = 10
+MIN_CODE_LENGTH = 6
+CODE_CHUNK = 5000
+MAX_CODES = 500000
+_FROM_BASE32 = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', CODE_ALPHABET)
+
+
+class CouponError(Exception):
+    """The coupon cannot be used on this order."""
+
+
+def _key(code, customer_id):
+    return f"coupon:{code}:{customer_id}"
+
+
+def forget_coupons(pairs):
+    """Drop cached campaigns for ``(code, customer_id)`` pairs."""
+    cache.delete_many([_key(code, customer_id) for code, customer_id in pairs])
+
+
+def _campaigns(code, customer_id):
+    """
+    The customer's campaigns with ``code``, cached; each with its discounts.
+    With ``customer_id=None``, the bulk campaign that issued ``code``.
+    """
+    key = _key(code, customer_id)
+    campaigns = cache.get(key)
+    if campaigns is None:
+        CouponCampaign = apps.get_model('customer', 'CouponCampaign')
+        fields = ['id', 'campaignName', 'startDate', 'expiryDate', 'usageLimit']
+        if customer_id is None:
+            # Uses are counted per customer when the code is checked.
+            rows = CouponCampaign.objects.filter(codes__code=code).values(
+                *fields, code_id=F('codes__id'), used=Value(0, output_field=IntegerField()),
+            )
+        else:
+            rows = CouponCampaign.objects.filter(couponCode=code, customer_id=customer_id).values(
+                *fields, code_id=Value(None, output_field=IntegerField()), used=F('timesRedeemed'),
+            )
+        campaigns = [
+            {
+                'id': row['id'],
+                'code_id': row['code_id'],
+                'campaignName': row['campaignName'],
+                'startDate': row['startDate'],
+                'expiryDate': row['expiryDate'],
+                'usageLimit': row['usageLimit'],
+                'usesLeft': row['usageLimit'] - row['used'],
+                'discounts': [
+                    (kind, value) for kind, value in zip(row['types'], row['values']) if kind is not None
+                ],
+            }
+            for row in rows
+            .annotate(types=ArrayAgg('discounts__discountType'), values=ArrayAgg('discounts__value'))
+            .order_by('id')
+        ]
+        cache.set(key, campaigns, CACHE_TIMEOUT)
+    return campaigns
+
+
+def _customer_redemptions(campaign_id, customer_id):
+    CouponRedemption = apps.get_model('customer', 'CouponRedemption')
+    return CouponRedemption.objects.filter(campaign_id=campaign_id, customer_id=customer_id).count()
+
+
+def _uses_left(campaign, customer_id):
+    """Uses of ``campaign`` left to the customer; bulk campaigns count the customer's redemptions."""
+    if campaign['code_id'] is None:
+        return campaign['usesLeft']
+    return campaign['usageLimit'] - _customer_redemptions(campaign['id'], customer_id)
+
+
+def _order_gross(order):
+    return OrderItem.objects.filter(order=order).aggregate(
+        gross=Sum(F('price') * F('quantity'))
+    )['gross'] or ZERO
+
+
+def check_coupon(code, order):
+    """
+    The campaign that ``code`` applies to on ``order`` and the discount it
+    would give. Raises ``CouponError`` when it cannot be used.
+    """
+    campaigns = _campaigns(code, order.customer_id) or _campaigns(code, None)
+    if not campaigns:
+        raise CouponError("Unknown coupon code")
+    today = timezone.localdate()
+    current = [c for c in campaigns if c['startDate'] <= today <= c['expiryDate']]
+    if not current:
+        raise CouponError("Coupon is not valid today")
+    usable = [c for c in current if _uses_left(c, order.customer_id) > 0]
+    if not usable:
+        raise CouponError("Coupon has already been used")
+    campaign = usable[0]
+
+    gross = _order_gross(order)
+    amount = sum(
+        (gross * value / 100 if kind == 'percent' else value for kind, value in campaign['discounts']),
+        ZERO,
+    )
+    owed = max(ZERO, gross - order.discount - (order.amount_paid or ZERO))
+    amount = min(amount, owed).quantize(Decimal('0.01'))
+    if amount <= 0:
+        raise CouponError("Coupon gives no discount on this order")
+    return campaign, amount
+
+
+def redeem_coupon(code, order_id):
+    """
+    Apply ``code`` to the unpaid order ``order_id``. Returns
+    ``(order, campaign, amount)``; raises ``CouponError`` if the coupon
+    cannot be used and ``Order.DoesNotExist`` if the order is not open.
+    """
+    CouponCampaign = apps.get_model('customer', 'CouponCampaign')
+    CouponCode = apps.get_model('customer', 'CouponCode')
+    CouponRedemption = apps.get_model('customer', 'CouponRedemption')
+    Customer = apps.get_model('customer', 'Customer')
+    today = timezone.localdate()
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id, is_paid=False)
+        campaign, amount = check_coupon(code, order)
+        if campaign['code_id'] is None:
+            claimed = CouponCampaign.objects.filter(
+                pk=campaign['id'],
+                timesRedeemed__lt=F('usageLimit'),
+                startDate__lte=today,
+                expiryDate__gte=today,
+            ).update(timesRedeemed=F('timesRedeemed') + 1)
+        else:
+            # The customer's redemptions are counted under the customer row
+            # lock, so two of their orders cannot both take the last use.
+            Customer.objects.select_for_update().filter(pk=order.customer_id).exists()
+            limit = CouponCampaign.objects.filter(
+                pk=campaign['id'], startDate__lte=today, expiryDate__gte=today,
+            ).values_list('usageLimit', flat=True).first()
+            claimed = limit is not None and _customer_redemptions(campaign['id'], order.customer_id) < limit
+            if claimed:
+                CouponCode.objects.filter(pk=campaign['code_id']).update(timesRedeemed=F('timesRedeemed') + 1)
+        if not claimed:
+            raise CouponError("Coupon has already been used")
+        try:
+            with transaction.atomic():
+                CouponRedemption.objects.create(
+                    campaign_id=campaign['id'], customer_id=order.customer_id, order=order, amount=amount,
+                )
+        except IntegrityError:
+            raise CouponError("Coupon is already applied to this order")
+        order.discount += amount
+        order.save(update_fields=['discount'])
+        apply_order_tax([order.id])
+    forget_coupons([(code, order.customer_id), (code, None)])
+    return order, campaign, amount
+
+
+def _random_codes(count, prefix, length):
+    """``count`` random codes; every character carries five random bits."""
+    text = base64.b32encode(secrets.token_bytes(-(-count * length // 8) * 5)).decode().translate(_FROM_BASE32)
+    return [prefix + text[start:start + length] for start in range(0, count * length, length)]
+
+
+def _insert_codes(campaign_id, codes):
+    """Insert ``codes`` for the campaign and return the ones that were not taken."""
+    CouponCode = apps.get_model('customer', 'CouponCode')
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(CouponCode._meta.db_table)} "
+            f"(campaign_id, code, {quote('timesRedeemed')}, created_at) "
+            "SELECT %s, code, 0, now() FROM unnest(%s::varchar[]) AS code "
+            "ON CONFLICT (code) DO NOTHING RETURNING code",
+            [campaign_id, codes],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def generate_codes(campaign_id, count, prefix='', length=CODE_LENGTH):
+    """
+    Create ``count`` new random codes for the campaign, yielding them a
+    chunk at a time. A code that collides with an existing one is replaced
+    in the next round, so exactly ``count`` are made.
+    """
+    if not 0 < count <= MAX_CODES:
+        raise CouponError(f"Generate between 1 and {MAX_CODES} codes at a time")
+    if length < MIN_CODE_LENGTH:
+        raise CouponError(f"Codes need at least {MIN_CODE_LENGTH} random characters")
+    remaining = count
+    while remaining:
+        batch = list(dict.fromkeys(_random_codes(min(remaining, CODE_CHUNK), prefix, length)))
+        inserted = _insert_codes(campaign_id, batch)
+        if not inserted:
+            raise CouponError("No unused codes left with this prefix and length")
+        remaining -= len(inserted)
+        yield inserted
+
+
+def import_codes(campaign_id, codes):
+    """
+    Add existing codes (from a coupon provider) to the campaign. Returns
+    ``{"imported": n, "duplicates": [code, ...]}``; codes already in use,
+    here or in another campaign, are left out.
+    """
+    codes = list(dict.fromkeys(code.strip() for code in codes if code and code.strip()))
+    if len(codes) > MAX_CODES:
+        raise CouponError(f"At most {MAX_CODES} codes per import")
+    if any(len(code) > 100 for code in codes):
+        raise CouponError("Codes can be at most 100 characters")
+    inserted = set()
+    for start in range(0, len(codes), CODE_CHUNK):
+        inserted.update(_insert_codes(campaign_id, codes[start:start + CODE_CHUNK]))
+    forget_coupons([(code, None) for code in inserted])
+    return {'imported': len(inserted), 'duplicates': [code for code in codes if code not in inserted]}
@@ -0,0 +1,238 @@
+"""
+Loyalty points ledger.
+
+Every change to a customer's points is a ``LoyaltyEntry``. ``LoyaltyInfo``
+keeps the running balance and the points expiring this month and next, and
+is only changed here, by adding deltas with F() expressions or in SQL, never
+by writing back a value read earlier.
+
+Points are earned when an order is paid, once per order (a partial unique
+index makes a repeat a no-op), and last ``LOYALTY_EXPIRY_DAYS``. An earning
+entry is a lot: redemptions spend the lots' ``remaining`` points soonest
+expiry first and ``expire_points`` zeroes the lapsed ones. Since every lot
+has a fixed expiry date, the month buckets move by the lot amounts as points
+are earned, spent or expire; only the start of a new month needs them
+rebuilt. ``expire_points`` does both in a few set-based statements and is
+meant to run nightly.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from features.models import Order
+from features.tax import apply_order_tax
+
+from .models import LoyaltyEntry, LoyaltyInfo
+
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+
+class LoyaltyError(Exception):
+    """Points cannot be redeemed."""
+
+
+def _months(today):
+    """First days of this month, next month and the month after."""
+    this_month = today.replace(day=1)
+    next_month = (this_month + timedelta(days=32)).replace(day=1)
+    return this_month, next_month, (next_month + timedelta(days=32)).replace(day=1)
+
+
+def _buckets(today, lots):
+    """How much of ``lots`` (``(expires_on, points)``) expires this month and next."""
+    _, next_month, after = _months(today)
+    this_bucket = next_bucket = ZERO
+    for expires_on, points in lots:
+        if expires_on is None or expires_on >= after:
+            continue
+        if expires_on < next_month:
+            this_bucket += points
+        else:
+            next_bucket += points
+    return this_bucket, next_bucket
+
+
+def accrue_points(order_ids):
+    """
+    Credit points for the paid orders among ``order_ids`` that have not
+    earned any yet, in one statement. Returns the number of orders credited.
+    """
+    order_ids = [order_id for order_id in order_ids if order_id is not None]
+    if not order_ids:
+        return 0
+    today = timezone.localdate()
+    expires_on = today + timedelta(days=settings.LOYALTY_EXPIRY_DAYS)
+    this_share, next_share = _buckets(today, [(expires_on, Decimal(1))])
+    quote = connection.ops.quote_name
+    entries, accounts = quote(LoyaltyEntry._meta.db_table), quote(LoyaltyInfo._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH earned AS (
+                INSERT INTO {entries} (customer_id, kind, points, remaining, expires_on, order_id, created_at)
+                SELECT customer_id, 'accrual', points, points, %(expires_on)s, id, now()
+                FROM (
+                    SELECT id, customer_id, TRUNC(COALESCE(amount_paid, 0) * %(rate)s, 2) AS points
+                    FROM {quote(Order._meta.db_table)}
+                    WHERE id = ANY(%(ids)s) AND is_paid
+                ) AS paid
+                WHERE points > 0
+                ON CONFLICT (order_id) WHERE kind = 'accrual' DO NOTHING
+                RETURNING customer_id, points
+            ), credited AS (
+                INSERT INTO {accounts} AS a (customer_id, points, reserved_points,
+                                             points_ending_this_month, points_ending_next_month, buckets_month)
+                SELECT customer_id, SUM(points), 0, SUM(points) * %(this_share)s, SUM(points) * %(next_share)s,
+                       %(this_month)s
+                FROM earned GROUP BY customer_id
+                ON CONFLICT (customer_id) DO UPDATE SET
+                    points = a.points + EXCLUDED.points,
+                    points_ending_this_month = a.points_ending_this_month + EXCLUDED.points_ending_this_month,
+                    points_ending_next_month = a.points_ending_next_month + EXCLUDED.points_ending_next_month
+            )
+            SELECT COUNT(*) FROM earned
+            """,
+            {
+                'ids': order_ids, 'rate': settings.LOYALTY_EARN_RATE, 'expires_on': expires_on,
+                'this_share': this_share, 'next_share': next_share, 'this_month': _months(today)[0],
+            },
+        )
+        return cursor.fetchone()[0]
+
+
+def _spend(customer_id, points, today):
+    """
+    Take ``points`` from the customer's unexpired lots, soonest expiry
+    first. Returns the ``(expires_on, points)`` taken from each lot.
+    """
+    lots = (
+        LoyaltyEntry.objects.select_for_update()
+        .filter(customer_id=customer_id, remaining__gt=0)
+        .exclude(expires_on__lt=today)
+        .order_by(F('expires_on').asc(nulls_last=True), 'id')
+    )
+    taken, changed, needed = [], [], points
+    for lot in lots.iterator(chunk_size=100):
+        amount = min(lot.remaining, needed)
+        lot.remaining -= amount
+        needed -= amount
+        taken.append((lot.expires_on, amount))
+        changed.append(lot)
+        if not needed:
+            break
+    if needed:
+        raise LoyaltyError("Not enough unexpired points")
+    LoyaltyEntry.objects.bulk_update(changed, ['remaining'])
+    return taken
+
+
+def redeem_points(customer_id, points, order_id):
+    """
+    Spend ``points`` of the customer's as a discount on their unpaid order
+    ``order_id``. Returns ``(order, value)``; raises ``LoyaltyError`` if the
+    points cannot be used and ``Order.DoesNotExist`` if the order is not
+    the customer's or not open.
+    """
+    points = Decimal(points).quantize(CENT)
+    if points <= 0:
+        raise LoyaltyError("Points to redeem must be positive")
+    value = (points * settings.LOYALTY_POINT_VALUE).quantize(CENT)
+    today = timezone.localdate()
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id, customer_id=customer_id, is_paid=False)
+        account = LoyaltyInfo.objects.select_for_update().filter(customer_id=customer_id).first()
+        if account is None or points > account.points - account.reserved_points:
+            raise LoyaltyError("Not enough points")
+        owed = order.total_price() - (order.amount_paid or ZERO)
+        if value > owed:
+            raise LoyaltyError(f"Points are worth {value}, more than the {owed} owed on the order")
+
+        this_bucket, next_bucket = _buckets(today, _spend(customer_id, points, today))
+        LoyaltyEntry.objects.create(customer_id=customer_id, kind='redemption', points=-points, order=order)
+        LoyaltyInfo.objects.filter(pk=account.pk).update(
+            points=F('points') - points,
+            points_ending_this_month=F('points_ending_this_month') - this_bucket,
+            points_ending_next_month=F('points_ending_next_month') - next_bucket,
+        )
+        order.discount += value
+        order.save(update_fields=['discount'])
+        apply_order_tax([order.id])
+    return order, value
+
+
+def expire_points(today=None):
+    """
+    Expire every lot that lapsed before ``today``, recording one expiry
+    entry per customer, then rebuild the month buckets of accounts last
+    bucketed in an earlier month. Returns ``(customers, points, rebucketed)``.
+    """
+    today = today or timezone.localdate()
+    this_month, next_month, after = _months(today)
+    quote = connection.ops.quote_name
+    entries, accounts = quote(LoyaltyEntry._meta.db_table), quote(LoyaltyInfo._meta.db_table)
+    params = {'today': today, 'this_month': this_month, 'next_month': next_month, 'after': after}
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Accounts first, in id order, the same lock order as redemption.
+        cursor.execute(
+            f"""
+            SELECT id FROM {accounts} WHERE customer_id IN (
+                SELECT customer_id FROM {entries} WHERE remaining > 0 AND expires_on < %(today)s
+            ) ORDER BY id FOR UPDATE
+            """,
+            params,
+        )
+        cursor.execute(
+            f"""
+            WITH lapsed AS (
+                SELECT id, customer_id, remaining, expires_on FROM {entries}
+                WHERE remaining > 0 AND expires_on < %(today)s
+                FOR UPDATE
+            ), cleared AS (
+                UPDATE {entries} AS e SET remaining = 0 FROM lapsed WHERE e.id = lapsed.id
+            ), totals AS (
+                SELECT customer_id, SUM(remaining) AS points,
+                       COALESCE(SUM(remaining) FILTER (WHERE expires_on >= %(this_month)s), 0) AS this_month
+                FROM lapsed GROUP BY customer_id
+            ), logged AS (
+                INSERT INTO {entries} (customer_id, kind, points, remaining, created_at)
+                SELECT customer_id, 'expiry', -points, 0, now() FROM totals
+            ), debited AS (
+                UPDATE {accounts} AS a SET
+                    points = a.points - totals.points,
+                    points_ending_this_month = a.points_ending_this_month - totals.this_month
+                FROM totals WHERE a.customer_id = totals.customer_id
+                RETURNING totals.points
+            )
+            SELECT (SELECT COUNT(*) FROM totals), COALESCE((SELECT SUM(points) FROM debited), 0)
+            """,
+            params,
+        )
+        customers, points = cursor.fetchone()
+        cursor.execute(
+            f"""
+            UPDATE {accounts} AS a SET
+                points_ending_this_month = COALESCE(b.this_month, 0),
+                points_ending_next_month = COALESCE(b.next_month, 0),
+                buckets_month = %(this_month)s
+            FROM {accounts} AS stale
+            LEFT JOIN (
+                SELECT customer_id,
+                       SUM(remaining) FILTER (WHERE expires_on < %(next_month)s) AS this_month,
+                       SUM(remaining) FILTER (WHERE expires_on >= %(next_month)s) AS next_month
+                FROM {entries}
+                WHERE remaining > 0 AND expires_on >= %(today)s AND expires_on < %(after)s
+                GROUP BY customer_id
+            ) AS b ON b.customer_id = stale.customer_id
+            WHERE a.id = stale.id AND stale.buckets_month IS DISTINCT FROM %(this_month)s
+            """,
+            params,
+        )
+        rebucketed = cursor.rowcount
+    return customers, points, rebucketed
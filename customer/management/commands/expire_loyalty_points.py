@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from customer.loyalty import expire_points
+
+
+class Command(BaseCommand):
+    help = "Expire lapsed loyalty points and roll the monthly expiry buckets over. Run nightly (e.g. from cron)."
+
+    def handle(self, *args, **options):
+        customers, points, rebucketed = expire_points()
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {points} points for {customers} customers; rebuilt buckets for {rebucketed} accounts"
+        ))
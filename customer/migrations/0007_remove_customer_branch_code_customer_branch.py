@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_branch_codes(apps, schema_editor):
+    """
+    Point every customer at the branch its ``branch_code`` names. Codes that
+    name no branch are resolved before the column becomes NOT NULL: each gets
+    an inactive branch with that code and no business, named "Unassigned
+    (<code>)", so no customer is dropped and the rows can be moved to the
+    right branch afterwards.
+    """
+    Branch = apps.get_model('business', 'Branch')
+    Customer = apps.get_model('customer', 'Customer')
+    known = set(Branch.objects.values_list('branch_code', flat=True))
+    unmatched = (
+        Customer.objects.exclude(branch_code__in=known).order_by().values_list('branch_code', flat=True).distinct()
+    )
+    Branch.objects.bulk_create([
+        Branch(branch_name=f"Unassigned ({code})", branch_code=code, status='inactive', is_active=False)
+        for code in unmatched
+    ])
+    branch_ids = dict(Branch.objects.values_list('branch_code', 'id'))
+    for code, branch_id in branch_ids.items():
+        Customer.objects.filter(branch_code=code).update(branch_id=branch_id)
+    # Run the new branches' deferred foreign key checks now; PostgreSQL will
+    # not alter a table with pending trigger events.
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0003_branch_is_default'),
+        ('customer', '0006_company_company_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='branch',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='business.branch'),
+        ),
+        migrations.RunPython(copy_branch_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customer',
+            name='branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='business.branch'),
+        ),
+        migrations.RemoveField(
+            model_name='customer',
+            name='branch_code',
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0007_remove_customer_branch_code_customer_branch'),
+        ('features', '0024_pricebooks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('redeemed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='couponcampaign',
+            name='timesRedeemed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='couponcampaign',
+            name='usageLimit',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='discount',
+            name='discountType',
+            field=models.CharField(choices=[('amount', 'Flat amount'), ('percent', 'Percent of order')], default='amount', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='discount',
+            name='value',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='couponcampaign',
+            index=models.Index(fields=['couponCode', 'customer'], name='coupon_code_customer_idx'),
+        ),
+        migrations.AddField(
+            model_name='couponredemption',
+            name='campaign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='customer.couponcampaign'),
+        ),
+        migrations.AddField(
+            model_name='couponredemption',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to='customer.customer'),
+        ),
+        migrations.AddField(
+            model_name='couponredemption',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to='features.order'),
+        ),
+        migrations.AddConstraint(
+            model_name='couponredemption',
+            constraint=models.UniqueConstraint(fields=('campaign', 'order'), name='unique_coupon_per_order'),
+        ),
+    ]
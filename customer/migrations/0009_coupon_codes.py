@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0008_coupon_redemptions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='couponcampaign',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='coupons', to='customer.customer'),
+        ),
+        migrations.CreateModel(
+            name='CouponCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=100, unique=True)),
+                ('timesRedeemed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codes', to='customer.couponcampaign')),
+            ],
+        ),
+    ]
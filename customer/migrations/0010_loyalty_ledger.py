@@ -0,0 +1,85 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:45
+
+import django.db.models.deletion
+from datetime import date, timedelta
+
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    """
+    Give every existing balance opening entries: the two expiry buckets
+    become lots expiring at the end of this and next month, the rest does
+    not expire.
+    """
+    today = date.today()
+    this_month = today.replace(day=1)
+    next_month = (this_month + timedelta(days=32)).replace(day=1)
+    after = (next_month + timedelta(days=32)).replace(day=1)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO customer_loyaltyentry (customer_id, kind, points, remaining, expires_on, created_at)
+            SELECT customer_id, 'opening', amount, amount, expires_on, now()
+            FROM (
+                SELECT customer_id, LEAST(points, points_ending_this_month) AS amount, %s::date AS expires_on
+                FROM customer_loyaltyinfo
+                UNION ALL
+                SELECT customer_id, LEAST(points - LEAST(points, points_ending_this_month), points_ending_next_month), %s::date
+                FROM customer_loyaltyinfo
+                UNION ALL
+                SELECT customer_id, points - LEAST(points, points_ending_this_month + points_ending_next_month), NULL
+                FROM customer_loyaltyinfo
+            ) AS lots
+            WHERE amount > 0
+            """,
+            [next_month - timedelta(days=1), after - timedelta(days=1)],
+        )
+        cursor.execute(
+            """
+            UPDATE customer_loyaltyinfo SET
+                points_ending_this_month = LEAST(points, points_ending_this_month),
+                points_ending_next_month = LEAST(points - LEAST(points, points_ending_this_month), points_ending_next_month),
+                buckets_month = %s
+            """,
+            [this_month],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0009_coupon_codes'),
+        ('features', '0024_pricebooks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loyaltyinfo',
+            name='buckets_month',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='loyaltyinfo',
+            name='points',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='LoyaltyEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('accrual', 'Earned on an order'), ('redemption', 'Redeemed on an order'), ('expiry', 'Expired')], max_length=20)),
+                ('points', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('remaining', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('expires_on', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loyalty_entries', to='customer.customer')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loyalty_entries', to='features.order')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('remaining__gt', 0)), fields=['customer', 'expires_on'], name='loyalty_open_idx'), models.Index(condition=models.Q(('remaining__gt', 0)), fields=['expires_on'], name='loyalty_expiring_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('kind', 'accrual')), fields=('order',), name='one_accrual_per_order')],
+            },
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
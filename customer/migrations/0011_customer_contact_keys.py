@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from customer.contacts import normalize_email, normalize_phone
+
+
+def split_contacts(apps, schema_editor):
+    """
+    Fill ``phone_e164`` and move ``emails`` into ``CustomerEmail`` rows.
+    Where customers of a branch share a number only the first registered
+    keeps the key; the others can still be found by search.
+    """
+    Customer = apps.get_model('customer', 'Customer')
+    CustomerEmail = apps.get_model('customer', 'CustomerEmail')
+    seen, changed, emails = set(), [], []
+
+    def flush():
+        Customer.objects.bulk_update(changed, ['phone_e164'])
+        CustomerEmail.objects.bulk_create(emails, ignore_conflicts=True)
+        changed.clear()
+        emails.clear()
+
+    customers = Customer.objects.only('id', 'branch_id', 'phone_number', 'emails').order_by('created_date', 'id')
+    for customer in customers.iterator(chunk_size=5000):
+        phone = normalize_phone(customer.phone_number)
+        if phone and (customer.branch_id, phone) not in seen:
+            seen.add((customer.branch_id, phone))
+            customer.phone_e164 = phone
+            changed.append(customer)
+        for entry in (customer.emails or '').split(','):
+            email = normalize_email(entry)
+            if email:
+                emails.append(CustomerEmail(customer_id=customer.id, email=email))
+        if len(changed) >= 5000:
+            flush()
+    flush()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0003_branch_is_default'),
+        ('customer', '0010_loyalty_ledger'),
+        ('users', '0006_user_branch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(db_index=True, max_length=254)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_e164',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='customeremail',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_addresses', to='customer.customer'),
+        ),
+        migrations.AddConstraint(
+            model_name='customeremail',
+            constraint=models.UniqueConstraint(fields=('customer', 'email'), name='unique_customer_email'),
+        ),
+        migrations.RunPython(split_contacts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(fields=('branch', 'phone_e164'), name='unique_customer_phone_per_branch'),
+        ),
+        migrations.RemoveField(
+            model_name='customer',
+            name='emails',
+        ),
+    ]
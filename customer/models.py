@@ -4,6 +4,9 @@ from business.models import Branch
 from users.models import Address  
 from cloudinary.models import CloudinaryField
 
+from .contacts import normalize_phone
+from .coupons import forget_coupons
+
 
 
 class Company(models.Model):
@@ -32,7 +35,8 @@ class Customer(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100, blank=True, null=True)
     phone_number = models.CharField(max_length=15)
-    emails = models.TextField(help_text="Comma-separated list of emails", blank=True)
+    # phone_number in E.164 form, set on save; the key for phone lookups.
+    phone_e164 = models.CharField(max_length=16, null=True, blank=True, editable=False)
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES, blank=True, null=True)
     dob = models.DateField(blank=True, null=True)
     anniversary_date = models.DateField(blank=True, null=True)
@@ -56,10 +60,53 @@ class Customer(models.Model):
     is_blocked = models.BooleanField(default=False)
     created_date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'phone_e164'], name='unique_customer_phone_per_branch'),
+        ]
+
+    # phone_e164 is only derived again when phone_number changes, so rows that
+    # share a number and were left without the key (migration 0011) can still
+    # be saved.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        customer = super().from_db(db, field_names, values)
+        customer._stored_phone = customer.__dict__.get('phone_number')
+        return customer
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'phone_number' in fields:
+            self._stored_phone = self.phone_number
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or (
+            'phone_number' not in self.get_deferred_fields()
+            and self.phone_number != getattr(self, '_stored_phone', None)
+        ):
+            self.phone_e164 = normalize_phone(self.phone_number)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'phone_number' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'phone_e164'}
+        super().save(*args, **kwargs)
+        if 'phone_number' not in self.get_deferred_fields():
+            self._stored_phone = self.phone_number
+
     def __str__(self):
         return f"{self.first_name} {self.last_name or ''}"
 
 
+class CustomerEmail(models.Model):
+    """One of a customer's email addresses, normalized (see customer.contacts)."""
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='email_addresses')
+    email = models.EmailField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'email'], name='unique_customer_email'),
+        ]
+
+
 class Membership(models.Model):
     customer = models.OneToOneField(Customer, on_delete=models.CASCADE, related_name='membership')
     name = models.CharField(max_length=100)
@@ -68,15 +115,60 @@ class Membership(models.Model):
 
 
 class LoyaltyInfo(models.Model):
+    # Running totals of the customer's LoyaltyEntry rows; only
+    # customer.loyalty changes them, with F() updates under a row lock.
     customer = models.OneToOneField(Customer, on_delete=models.CASCADE, related_name='loyalty_info')
-    points = models.DecimalField(max_digits=10, decimal_places=2)
+    points = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     reserved_points = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     points_ending_this_month = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     points_ending_next_month = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # First day of the month the two buckets above refer to.
+    buckets_month = models.DateField(null=True, blank=True)
+
+
+class LoyaltyEntry(models.Model):
+    """
+    One movement of a customer's points, signed. Entries are never changed
+    or deleted, except that an earning entry's ``remaining`` goes down as
+    its points are redeemed or expire.
+    """
+    KIND_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('accrual', 'Earned on an order'),
+        ('redemption', 'Redeemed on an order'),
+        ('expiry', 'Expired'),
+    ]
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loyalty_entries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    points = models.DecimalField(max_digits=10, decimal_places=2)
+    remaining = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    expires_on = models.DateField(null=True, blank=True)
+    order = models.ForeignKey('features.Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='loyalty_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order'], condition=models.Q(kind='accrual'), name='one_accrual_per_order'),
+        ]
+        indexes = [
+            # Unspent points, oldest expiry first, for redemption and expiry.
+            models.Index(fields=['customer', 'expires_on'], condition=models.Q(remaining__gt=0), name='loyalty_open_idx'),
+            models.Index(fields=['expires_on'], condition=models.Q(remaining__gt=0), name='loyalty_expiring_idx'),
+        ]
 
 
 class Discount(models.Model):
+    TYPE_CHOICES = [
+        ('amount', 'Flat amount'),
+        ('percent', 'Percent of order'),
+    ]
     discountCode = models.CharField(max_length=100)
+    discountType = models.CharField(max_length=10, choices=TYPE_CHOICES, default='amount')
+    value = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        forget_coupons(self.couponcampaign_set.values_list('couponCode', 'customer_id'))
 
 class CouponCampaign(models.Model):
     couponProvider = models.CharField(max_length=100)
@@ -84,7 +176,51 @@ class CouponCampaign(models.Model):
     startDate = models.DateField()
     expiryDate = models.DateField()
     campaignName = models.CharField(max_length=100)
+    # Redemptions allowed for the campaign's customer, and how many were made;
+    # the count only moves through a conditional update (see customer.coupons).
+    # Bulk campaigns count each customer's redemptions instead.
+    usageLimit = models.PositiveIntegerField(default=1)
+    timesRedeemed = models.PositiveIntegerField(default=0)
 
     # Assuming you already have a Customer model
-    customer = models.ForeignKey('customer.Customer', on_delete=models.CASCADE, related_name='coupons')
-    discounts = models.ManyToManyField(Discount)
\ No newline at end of file
+    # A campaign without a customer is a bulk campaign: it is used through
+    # its generated or imported ``codes`` and ``usageLimit`` applies to each
+    # customer redeeming them.
+    customer = models.ForeignKey('customer.Customer', on_delete=models.CASCADE, related_name='coupons', null=True, blank=True)
+    discounts = models.ManyToManyField(Discount)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['couponCode', 'customer'], name='coupon_code_customer_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        forget_coupons([(self.couponCode, self.customer_id)])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        forget_coupons([(self.couponCode, self.customer_id)])
+        return result
+
+
+class CouponCode(models.Model):
+    """One code of a bulk campaign, usable by any customer."""
+    campaign = models.ForeignKey(CouponCampaign, on_delete=models.CASCADE, related_name='codes')
+    code = models.CharField(max_length=100, unique=True)
+    timesRedeemed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class CouponRedemption(models.Model):
+    """One use of a coupon on an order, with the discount it gave."""
+    campaign = models.ForeignKey(CouponCampaign, on_delete=models.CASCADE, related_name='redemptions')
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='coupon_redemptions')
+    order = models.ForeignKey('features.Order', on_delete=models.CASCADE, related_name='coupon_redemptions')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    redeemed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'order'], name='unique_coupon_per_order'),
+        ]
@@ -1,7 +1,11 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 import cloudinary
 from users.models import Address
-from .models import Customer, Membership, LoyaltyInfo, Company
+from .models import Customer, Membership, LoyaltyEntry, LoyaltyInfo, Company
+from .contacts import normalize_phone, set_emails, split_emails
+from .coupons import CODE_LENGTH, MAX_CODES, MIN_CODE_LENGTH, forget_coupons
 from .models import CouponCampaign, Discount
 
 
@@ -38,6 +42,17 @@ class LoyaltyInfoSerializer(serializers.ModelSerializer):
         ]
 
 
+class LoyaltyEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LoyaltyEntry
+        fields = ['id', 'kind', 'points', 'remaining', 'expires_on', 'order', 'created_at']
+
+
+class LoyaltyRedeemSerializer(serializers.Serializer):
+    points = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    order = serializers.IntegerField()
+
+
 class CompanySerializer(serializers.ModelSerializer):
     class Meta:
         model = Company
@@ -46,7 +61,8 @@ class CompanySerializer(serializers.ModelSerializer):
 
 class CustomerSerializer(serializers.ModelSerializer):
     membership = MembershipSerializer(required=False)
-    loyalty_info = LoyaltyInfoSerializer(required=False)
+    # Points only change through the ledger (customer.loyalty).
+    loyalty_info = LoyaltyInfoSerializer(read_only=True)
     address_data = AddressSerializer(write_only=True, required=False)
     addresses = AddressSerializer(read_only=True)
 
@@ -56,6 +72,9 @@ class CustomerSerializer(serializers.ModelSerializer):
     pan_card_front = serializers.ImageField(required=False, allow_null=True, write_only=True)
     pan_card_back  = serializers.ImageField(required=False, allow_null=True, write_only=True)
 
+    # Stored as CustomerEmail rows; read and written as a comma-separated list.
+    emails = serializers.CharField(required=False, allow_blank=True, write_only=True)
+
 
     class Meta:
         model = Customer
@@ -84,11 +103,37 @@ class CustomerSerializer(serializers.ModelSerializer):
             'loyalty_info',
         ]
 
+    def validate_phone_number(self, value):
+        if normalize_phone(value) is None:
+            raise serializers.ValidationError("Enter a valid phone number")
+        return value
+
+    def validate_emails(self, value):
+        try:
+            return split_emails(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate(self, attrs):
+        if 'phone_number' in attrs:
+            request = self.context.get('request')
+            branch = (
+                attrs.get('branch')
+                or getattr(self.instance, 'branch', None)
+                or getattr(getattr(request, 'user', None), 'branch', None)
+            )
+            clash = Customer.objects.filter(branch=branch, phone_e164=normalize_phone(attrs['phone_number']))
+            if self.instance is not None:
+                clash = clash.exclude(pk=self.instance.pk)
+            if clash.exists():
+                raise serializers.ValidationError({'phone_number': "Another customer of this branch has this phone number"})
+        return attrs
+
     def create(self, validated_data):
         membership_data = validated_data.pop('membership', None)
-        loyalty_data = validated_data.pop('loyalty_info', None)
         address_data = validated_data.pop('address_data', None)
         company_data = validated_data.pop('company_data', None)
+        emails = validated_data.pop('emails', None)
 
         if company_data:
             company, _ = Company.objects.get_or_create(**company_data)
@@ -103,13 +148,14 @@ class CustomerSerializer(serializers.ModelSerializer):
         if membership_data:
             Membership.objects.create(customer=customer, **membership_data)
 
-        if loyalty_data:
-            LoyaltyInfo.objects.create(customer=customer, **loyalty_data)
+        if emails:
+            set_emails(customer, emails)
 
         return customer
     def to_representation(self, instance):
         
         data = super().to_representation(instance)
+        data['emails'] = ', '.join(address.email for address in sorted(instance.email_addresses.all(), key=lambda a: a.id))
 
         if instance.pan_card_front:
             data['pan_card_front'] = instance.pan_card_front.url
@@ -120,9 +166,9 @@ class CustomerSerializer(serializers.ModelSerializer):
     
     def update(self, instance, validated_data):
         membership_data = validated_data.pop('membership', None)
-        loyalty_data = validated_data.pop('loyalty_info', None)
         address_data = validated_data.pop('address_data', None)
         company_data = validated_data.pop('company_data', None)
+        emails = validated_data.pop('emails', None)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -150,13 +196,8 @@ class CustomerSerializer(serializers.ModelSerializer):
             else:
                 Membership.objects.create(customer=instance, **membership_data)
 
-        if loyalty_data:
-            if hasattr(instance, 'loyalty_info'):
-                for attr, value in loyalty_data.items():
-                    setattr(instance.loyalty_info, attr, value)
-                instance.loyalty_info.save()
-            else:
-                LoyaltyInfo.objects.create(customer=instance, **loyalty_data)
+        if emails is not None:
+            set_emails(instance, emails)
 
         return instance
 
@@ -165,18 +206,19 @@ class CustomerSerializer(serializers.ModelSerializer):
 class DiscountSerializer(serializers.ModelSerializer):
     class Meta:
         model = Discount
-        fields = ['discountCode']
+        fields = ['discountCode', 'discountType', 'value']
 
 class CouponCampaignSerializer(serializers.ModelSerializer):
     discounts = DiscountSerializer(many=True)
-    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all())
+    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all(), allow_null=True, required=False)
 
     class Meta:
         model = CouponCampaign
         fields = [
             'couponProvider', 'couponCode', 'startDate', 'expiryDate',
-            'campaignName', 'discounts', 'customer'
+            'campaignName', 'discounts', 'customer', 'usageLimit', 'timesRedeemed'
         ]
+        read_only_fields = ['timesRedeemed']
 
     def create(self, validated_data):
         discount_data = validated_data.pop('discounts')
@@ -184,9 +226,21 @@ class CouponCampaignSerializer(serializers.ModelSerializer):
         for discount in discount_data:
             d, _ = Discount.objects.get_or_create(**discount)
             campaign.discounts.add(d)
+        forget_coupons([(campaign.couponCode, campaign.customer_id)])
         return campaign
 
 
+class CouponApplySerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=100)
+    order = serializers.IntegerField()
+
+
+class CouponCodeGenerateSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, max_value=MAX_CODES)
+    prefix = serializers.RegexField(r'^[A-Za-z0-9\-]*$', max_length=40, required=False, default='')
+    length = serializers.IntegerField(min_value=MIN_CODE_LENGTH, max_value=60, required=False, default=CODE_LENGTH)
+
+
 
 from rest_framework import serializers
 from .models import Company
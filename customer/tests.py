@@ -1,3 +1,413 @@
-from django.test import TestCase
+import random
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from backend import synthetic
+from customer.contacts import normalize_phone
+from customer.coupons import CODE_ALPHABET, CouponError, check_coupon, import_codes, redeem_coupon
+from customer.loyalty import LoyaltyError, expire_points, redeem_points
+from customer.models import CouponCampaign, CouponCode, Customer, Discount, LoyaltyEntry, LoyaltyInfo
+from features.models import Order, OrderItem
+
+
+class CouponTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(37)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+        cls.today = timezone.localdate()
+
+    def setUp(self):
+        cache.clear()
+        self.discount = Discount.objects.create(discountCode='TEN', discountType='amount', value=Decimal('10.00'))
+        self.campaign = self.coupon('SAVE10', usageLimit=2)
+
+    def coupon(self, code, starts=-1, expires=1, **fields):
+        campaign = CouponCampaign.objects.create(
+            couponProvider='store', couponCode=code, campaignName=code, customer=self.customer,
+            startDate=self.today + timedelta(days=starts), expiryDate=self.today + timedelta(days=expires), **fields,
+        )
+        campaign.discounts.add(self.discount)
+        return campaign
+
+    def order(self):
+        order = Order.objects.create(customer=self.customer, branch=self.customer.branch, status='open')
+        OrderItem.objects.create(order=order, item=self.item, price=Decimal('100.00'), quantity=1)
+        return Order.objects.get(pk=order.pk)
+
+    def test_redemptions_stop_at_the_usage_limit(self):
+        for _ in range(2):
+            order, _, amount = redeem_coupon('SAVE10', self.order().pk)
+            self.assertEqual((order.discount, amount), (Decimal('10.00'), Decimal('10.00')))
+        with self.assertRaisesMessage(CouponError, 'already been used'):
+            redeem_coupon('SAVE10', self.order().pk)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.timesRedeemed, 2)
+
+    def test_conditional_update_refuses_a_stale_cached_campaign(self):
+        order = self.order()
+        check_coupon('SAVE10', order)
+        # Bypasses the save hook, so the cached entry still shows uses left.
+        CouponCampaign.objects.filter(pk=self.campaign.pk).update(timesRedeemed=2)
+        with self.assertRaisesMessage(CouponError, 'already been used'):
+            redeem_coupon('SAVE10', order.pk)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.timesRedeemed, 2)
+        order.refresh_from_db()
+        self.assertEqual(order.discount, 0)
+
+    def test_coupons_outside_their_dates_are_refused(self):
+        self.coupon('LATER', starts=1, expires=5)
+        self.coupon('GONE', starts=-5, expires=-1)
+        for code in ('LATER', 'GONE'):
+            with self.subTest(code=code), self.assertRaisesMessage(CouponError, 'not valid today'):
+                redeem_coupon(code, self.order().pk)
+        self.coupon('TODAY', starts=0, expires=0)
+        self.assertEqual(redeem_coupon('TODAY', self.order().pk)[2], Decimal('10.00'))
+
+    def test_expiry_is_checked_again_when_redeeming(self):
+        order = self.order()
+        check_coupon('SAVE10', order)
+        CouponCampaign.objects.filter(pk=self.campaign.pk).update(expiryDate=self.today - timedelta(days=1))
+        with self.assertRaisesMessage(CouponError, 'already been used'):
+            redeem_coupon('SAVE10', order.pk)
+
+    def test_campaign_save_drops_the_cached_entry(self):
+        order = self.order()
+        check_coupon('SAVE10', order)
+        self.campaign.expiryDate = self.today - timedelta(days=1)
+        self.campaign.save()
+        with self.assertRaisesMessage(CouponError, 'not valid today'):
+            check_coupon('SAVE10', order)
+
+    def test_discount_save_drops_the_cached_entry(self):
+        order = self.order()
+        self.assertEqual(check_coupon('SAVE10', order)[1], Decimal('10.00'))
+        self.discount.discountType, self.discount.value = 'percent', Decimal('25.00')
+        self.discount.save()
+        self.assertEqual(check_coupon('SAVE10', order)[1], Decimal('25.00'))
+
+
+    def test_manual_discount_adds_to_a_redeemed_coupon(self):
+        order, _, _ = redeem_coupon('SAVE10', self.order().pk)
+        self.client.force_login(self.cashier)
+        url = f'/api/POS/payment/{order.pk}/apply-discount/'
+        response = self.client.post(url, {'discount': '5.00'}, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['discount']), (200, '15.00'))
+        order.refresh_from_db()
+        self.assertEqual(order.discount, Decimal('15.00'))
+        # 85 left to discount.
+        response = self.client.post(url, {'discount': '90.00'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class LoyaltyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(41)
+        _, branches = synthetic.make_business(rng, 1)
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+        cls.today = timezone.localdate()
+
+    def setUp(self):
+        self.account = LoyaltyInfo.objects.create(customer=self.customer, buckets_month=self.today.replace(day=1))
+        self.order = Order.objects.create(customer=self.customer, branch=self.customer.branch, status='open')
+        OrderItem.objects.create(order=self.order, item=self.item, price=Decimal('100.00'), quantity=1)
+
+    def lot(self, points, days):
+        points = Decimal(points)
+        LoyaltyInfo.objects.filter(pk=self.account.pk).update(points=F('points') + points)
+        return LoyaltyEntry.objects.create(
+            customer=self.customer, kind='accrual', points=points, remaining=points,
+            expires_on=None if days is None else self.today + timedelta(days=days),
+        )
+
+    def remaining(self, *lots):
+        return [LoyaltyEntry.objects.get(pk=lot.pk).remaining for lot in lots]
+
+    def points(self):
+        self.account.refresh_from_db()
+        return self.account.points
+
+    def test_overspending_is_refused(self):
+        first, second = self.lot('30', 100), self.lot('20', 200)
+        with self.assertRaisesMessage(LoyaltyError, 'Not enough points'):
+            redeem_points(self.customer.pk, '60', self.order.pk)
+        LoyaltyInfo.objects.filter(pk=self.account.pk).update(reserved_points=20)
+        with self.assertRaisesMessage(LoyaltyError, 'Not enough points'):
+            redeem_points(self.customer.pk, '40', self.order.pk)
+        self.assertEqual(self.remaining(first, second), [Decimal('30.00'), Decimal('20.00')])
+        self.assertEqual(self.points(), Decimal('50.00'))
+
+    def test_lapsed_lots_cannot_be_spent_before_they_are_expired(self):
+        lapsed, live = self.lot('30', -1), self.lot('20', 100)
+        with self.assertRaisesMessage(LoyaltyError, 'Not enough unexpired points'):
+            redeem_points(self.customer.pk, '40', self.order.pk)
+        self.assertEqual(self.remaining(lapsed, live), [Decimal('30.00'), Decimal('20.00')])
+        self.assertFalse(LoyaltyEntry.objects.filter(kind='redemption').exists())
+
+    def test_spending_takes_the_soonest_expiring_lots_first(self):
+        lots = [self.lot('40', None), self.lot('20', 200), self.lot('30', 100)]
+        order, value = redeem_points(self.customer.pk, '45', self.order.pk)
+        self.assertEqual(self.remaining(*lots), [Decimal('40.00'), Decimal('5.00'), Decimal('0.00')])
+        self.assertEqual((order.discount, value), (Decimal('45.00'), Decimal('45.00')))
+        self.assertEqual(self.points(), Decimal('45.00'))
+        self.assertEqual(LoyaltyEntry.objects.get(kind='redemption').points, Decimal('-45.00'))
+
+        redeem_points(self.customer.pk, '25', self.order.pk)
+        self.assertEqual(self.remaining(*lots), [Decimal('20.00'), Decimal('0.00'), Decimal('0.00')])
+
+    def test_expiry_runs_once(self):
+        lapsed, live = self.lot('25', -1), self.lot('30', 100)
+        self.assertEqual(expire_points(self.today)[:2], (1, Decimal('25.00')))
+        self.assertEqual(expire_points(self.today), (0, 0, 0))
+        self.assertEqual(self.remaining(lapsed, live), [Decimal('0.00'), Decimal('30.00')])
+        self.assertEqual(self.points(), Decimal('30.00'))
+        self.assertEqual(LoyaltyEntry.objects.filter(kind='expiry').count(), 1)
+
+    def test_new_month_rebuilds_buckets_once(self):
+        self.lot('30', 20)
+        next_month = (self.today.replace(day=1) + timedelta(days=32)).replace(day=1)
+        self.assertEqual(expire_points(next_month)[2], 1)
+        self.assertEqual(expire_points(next_month)[2], 0)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.buckets_month, next_month)
+
+
+class ContactKeysTest(TestCase):
+    URL = '/api/customer/lookup/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(43)
+        business, (cls.branch, cls.other) = synthetic.make_business(rng, 1, branches=2)
+        cls.cashier = synthetic.make_cashier(rng, business, cls.branch)
+        cls.customer = Customer.objects.create(
+            id='C-1', branch=cls.branch, first_name='Asha', phone_number='098765 43210',
+        )
+        cls.customer.email_addresses.create(email='asha@example.com')
+
+    @override_settings(DEFAULT_PHONE_COUNTRY_CODE='91')
+    def test_normalize_phone(self):
+        for value, e164 in [
+            ('9876543210', '+919876543210'),
+            ('098765 43210', '+919876543210'),
+            ('(98765) 432-10', '+919876543210'),
+            ('919876543210', '+919876543210'),
+            ('+91 98765 43210', '+919876543210'),
+            ('0091 98765 43210', '+919876543210'),
+            ('+1 415 555 0100', '+14155550100'),
+            ('12345', None),
+            ('+0123456789', None),
+            ('+1234567890123456', None),
+            ('', None),
+            (None, None),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(normalize_phone(value), e164)
+
+    def test_key_follows_the_number(self):
+        self.assertEqual(self.customer.phone_e164, '+919876543210')
+        customer = Customer.objects.get(pk=self.customer.pk)
+        customer.phone_number = '+4420 7946 0958'
+        customer.save(update_fields=['phone_number'])
+        self.assertEqual(Customer.objects.get(pk=customer.pk).phone_e164, '+442079460958')
+
+    def test_customer_left_without_a_key_can_be_saved(self):
+        twin = Customer.objects.create(id='C-2', branch=self.other, first_name='Asha', phone_number='9876543210')
+        Customer.objects.filter(pk=twin.pk).update(branch=self.branch, phone_e164=None)
+        twin = Customer.objects.get(pk=twin.pk)
+        twin.first_name = 'Asha R'
+        twin.save()
+        twin.refresh_from_db()
+        twin.save()
+        self.assertIsNone(Customer.objects.get(pk=twin.pk).phone_e164)
+
+    def lookup(self, **params):
+        self.client.force_login(self.cashier)
+        return self.client.get(self.URL, params)
+
+    def test_lookup_by_phone_in_any_form(self):
+        for phone in ('9876543210', '+91 98765-43210', '00919876543210'):
+            with self.subTest(phone=phone):
+                response = self.lookup(phone=phone)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['id'], self.customer.pk)
+        self.assertEqual(self.lookup(phone='9876543211').status_code, 404)
+        self.assertEqual(self.lookup(phone='123').status_code, 400)
+
+    def test_lookup_by_email(self):
+        self.assertEqual(self.lookup(email=' Asha@Example.COM ').json()['id'], self.customer.pk)
+        self.assertEqual(self.lookup(email='ravi@example.com').status_code, 404)
+        self.assertEqual(self.lookup(email='not-an-address').status_code, 400)
+        self.assertEqual(self.lookup().status_code, 400)
+
+    def test_lookup_stays_in_the_branch(self):
+        self.cashier.branch = self.other
+        self.cashier.save()
+        self.assertEqual(self.lookup(phone='9876543210').status_code, 404)
+
+
+class ContactKeysMigrationTest(TransactionTestCase):
+    before = [('customer', '0010_loyalty_ledger')]
+
+    def setUp(self):
+        rng = random.Random(47)
+        _, (self.branch,) = synthetic.make_business(rng, 1)
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+        self.old_customer = executor.loader.project_state(self.before).apps.get_model('customer', 'Customer')
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_contacts_are_split(self):
+        for n, (phone, emails) in enumerate([
+            ('9876543210', 'Asha@Example.com, asha@example.com'),
+            ('+91 98765 43210', 'a.r@example.com'),
+            ('12345', 'bad, ravi@example.com'),
+        ]):
+            self.old_customer.objects.create(
+                id=f'C-{n}', branch_id=self.branch.pk, first_name='Asha', phone_number=phone, emails=emails,
+            )
+        self.migrate_to_latest()
+
+        keys = dict(Customer.objects.values_list('id', 'phone_e164'))
+        self.assertEqual(keys, {'C-0': '+919876543210', 'C-1': None, 'C-2': None})
+        emails = Customer.objects.get(pk='C-0').email_addresses.values_list('email', flat=True)
+        self.assertEqual(list(emails), ['asha@example.com'])
+        self.assertEqual(
+            list(Customer.objects.get(pk='C-2').email_addresses.values_list('email', flat=True)), ['ravi@example.com'],
+        )
+
+        duplicate = Customer.objects.get(pk='C-1')
+        duplicate.last_name = 'R'
+        duplicate.save()
+        self.assertIsNone(Customer.objects.get(pk='C-1').phone_e164)
+
+
+class BulkCouponTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(47)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customers = synthetic.make_customers(rng, branches[0], 2)
+        today = timezone.localdate()
+        cls.campaign = CouponCampaign.objects.create(
+            couponProvider='store', couponCode='', campaignName='Flyer', usageLimit=1,
+            startDate=today - timedelta(days=1), expiryDate=today + timedelta(days=1),
+        )
+        cls.campaign.discounts.add(Discount.objects.create(discountCode='TEN', discountType='amount', value=Decimal('10.00')))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.cashier)
+
+    def url(self, action, campaign=None):
+        return f'/api/coupon-campaigns/{(campaign or self.campaign).pk}/codes/{action}/'
+
+    def order(self, customer):
+        order = Order.objects.create(customer=customer, branch=customer.branch, status='open')
+        OrderItem.objects.create(order=order, item=self.item, price=Decimal('100.00'), quantity=1)
+        return order
+
+    def test_generated_codes_are_streamed_as_csv(self):
+        response = self.client.post(self.url('generate'), {'count': 250, 'prefix': 'FLY-', 'length': 8}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = b''.join(response.streaming_content).decode().split('\r\n')
+        self.assertEqual((rows[0], rows[-1]), ('code', ''))
+        codes = rows[1:-1]
+        self.assertEqual(len(set(codes)), 250)
+        self.assertTrue(all(code.startswith('FLY-') and len(code) == 12 for code in codes))
+        self.assertTrue(all(set(code[4:]) <= set(CODE_ALPHABET) for code in codes))
+        self.assertEqual(set(self.campaign.codes.values_list('code', flat=True)), set(codes))
+
+    def test_codes_are_only_generated_within_limits_for_bulk_campaigns(self):
+        self.assertEqual(self.client.post(self.url('generate'), {'count': 5, 'length': 3}, content_type='application/json').status_code, 400)
+        own = CouponCampaign.objects.create(
+            couponProvider='store', couponCode='MINE', campaignName='Mine', customer=self.customers[0],
+            startDate=timezone.localdate(), expiryDate=timezone.localdate(),
+        )
+        self.assertEqual(self.client.post(self.url('generate', own), {'count': 5}, content_type='application/json').status_code, 400)
+        self.assertFalse(CouponCode.objects.exists())
+
+    def test_csv_import_skips_codes_already_in_use(self):
+        other = CouponCampaign.objects.create(
+            couponProvider='partner', couponCode='', campaignName='Partner',
+            startDate=timezone.localdate(), expiryDate=timezone.localdate(),
+        )
+        import_codes(other.pk, ['TAKEN1'])
+        body = 'code\r\nPARTNER1\r\n PARTNER2 \r\nPARTNER1\r\nTAKEN1\r\n\r\n'
+        response = self.client.generic('POST', self.url('import'), body.encode('utf-8-sig'), content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'imported': 2, 'duplicates': ['TAKEN1']})
+        self.assertEqual(sorted(self.campaign.codes.values_list('code', flat=True)), ['PARTNER1', 'PARTNER2'])
+
+    def test_csv_import_accepts_a_file_upload(self):
+        upload = SimpleUploadedFile('codes.csv', b'PARTNER3,extra column\nPARTNER4\n', content_type='text/csv')
+        response = self.client.post(self.url('import'), {'file': upload})
+        self.assertEqual(response.json(), {'imported': 2, 'duplicates': []})
+        response = self.client.generic('POST', self.url('import'), b'\xff\xfe', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+
+    def test_usage_limit_applies_per_customer_across_codes(self):
+        import_codes(self.campaign.pk, ['FLY1', 'FLY2'])
+        first, second = self.customers
+        self.assertEqual(redeem_coupon('FLY1', self.order(first).pk)[2], Decimal('10.00'))
+        # Another code of the same campaign is used up for this customer...
+        with self.assertRaisesMessage(CouponError, 'already been used'):
+            check_coupon('FLY2', self.order(first))
+        with self.assertRaisesMessage(CouponError, 'already been used'):
+            redeem_coupon('FLY2', self.order(first).pk)
+        # ...but the same code still works for someone else.
+        self.assertEqual(redeem_coupon('FLY1', self.order(second).pk)[2], Decimal('10.00'))
+        self.assertEqual(
+            list(CouponCode.objects.order_by('code').values_list('code', 'timesRedeemed')), [('FLY1', 2), ('FLY2', 0)],
+        )
+
+
+class CustomerBranchMigrationTest(TransactionTestCase):
+    before = [('customer', '0006_company_company_since')]
+
+    def setUp(self):
+        rng = random.Random(53)
+        _, (self.branch,) = synthetic.make_business(rng, 1)
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+        self.old_customer = executor.loader.project_state(self.before).apps.get_model('customer', 'Customer')
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_unknown_branch_codes_get_an_unassigned_branch(self):
+        for n, code in enumerate([self.branch.branch_code, 'GONE01', 'GONE01', 'GONE02']):
+            self.old_customer.objects.create(
+                id=f'C-{n}', branch_code=code, first_name='Asha', phone_number=f'98765432{n:02d}',
+            )
+        self.migrate_to_latest()
+
+        branches = dict(Customer.objects.values_list('id', 'branch__branch_code'))
+        self.assertEqual(branches, {'C-0': self.branch.branch_code, 'C-1': 'GONE01', 'C-2': 'GONE01', 'C-3': 'GONE02'})
+        unassigned = Customer.objects.get(pk='C-1').branch
+        self.assertEqual(
+            (unassigned.branch_name, unassigned.business, unassigned.is_active), ('Unassigned (GONE01)', None, False),
+        )
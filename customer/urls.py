@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CompanyViewSet, CustomerListCreateView, CustomerDetailView,CouponCampaignViewSet
+from .views import CompanyViewSet, CustomerListCreateView, CustomerDetailView,CouponCampaignViewSet, CustomerLookupView, CustomerLoyaltyView, LoyaltyRedeemView
 
 
 router = DefaultRouter()
@@ -9,7 +9,10 @@ router.register(r'companies', CompanyViewSet, basename='company')
 
 urlpatterns = [
     path('customer/', CustomerListCreateView.as_view(), name='customer-list-create'),
+    path('customer/lookup/', CustomerLookupView.as_view(), name='customer-lookup'),
     path('customer/<str:id>/', CustomerDetailView.as_view(), name='customer-detail'),
+    path('customer/<str:id>/loyalty/', CustomerLoyaltyView.as_view(), name='customer-loyalty'),
+    path('customer/<str:id>/loyalty/redeem/', LoyaltyRedeemView.as_view(), name='customer-loyalty-redeem'),
 ]
 
 
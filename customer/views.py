@@ -1,16 +1,37 @@
+import csv
+import io
+
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import filters, status
 from rest_framework.response import Response
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework import viewsets
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.decorators import action
+from rest_framework.views import APIView
 
-from .serializers import CustomerSerializer, CouponCampaignSerializer
-from .models import Customer, CouponCampaign
+from features.idempotency import idempotent
+from features.models import Order
+from .contacts import normalize_email, normalize_phone
+from .coupons import CouponError, check_coupon, generate_codes, import_codes, redeem_coupon
+from .loyalty import LoyaltyError, redeem_points
+from .serializers import (
+    CustomerSerializer, CouponApplySerializer, CouponCampaignSerializer, CouponCodeGenerateSerializer,
+    LoyaltyEntrySerializer, LoyaltyInfoSerializer, LoyaltyRedeemSerializer,
+)
+from .models import Customer, CouponCampaign, LoyaltyInfo
 
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
+LOYALTY_ENTRIES_SHOWN = 50
+
+CUSTOMER_RELATIONS = ['company', 'addresses', 'membership', 'loyalty_info']
+
+
 class CustomerListCreateView(ListCreateAPIView):
-    queryset = Customer.objects.all()
+    queryset = Customer.objects.select_related(*CUSTOMER_RELATIONS).prefetch_related('email_addresses')
     serializer_class = CustomerSerializer
 
     # Set permissions - AllowAny for GET, IsAuthenticated for POST
@@ -43,8 +64,38 @@ class CustomerListCreateView(ListCreateAPIView):
     ordering_fields = ['created_date', 'first_name']
 
 
+class CustomerLookupView(APIView):
+    """
+    Find a customer of the user's branch (or ``branch``) by ``phone`` or
+    ``email``. Both are normalized first, so any way of writing the number
+    or address matches, and the match is a single index lookup.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        branch_id = getattr(request.user, 'branch_id', None) or request.query_params.get('branch')
+        if not branch_id:
+            return Response({'error': 'branch is required'}, status=status.HTTP_400_BAD_REQUEST)
+        customers = Customer.objects.select_related(*CUSTOMER_RELATIONS).prefetch_related('email_addresses')
+        if 'phone' in request.query_params:
+            phone = normalize_phone(request.query_params['phone'])
+            if phone is None:
+                return Response({'error': 'Invalid phone number'}, status=status.HTTP_400_BAD_REQUEST)
+            customer = customers.filter(branch_id=branch_id, phone_e164=phone).first()
+        elif 'email' in request.query_params:
+            email = normalize_email(request.query_params['email'])
+            if email is None:
+                return Response({'error': 'Invalid email address'}, status=status.HTTP_400_BAD_REQUEST)
+            customer = customers.filter(branch_id=branch_id, email_addresses__email=email).order_by('created_date').first()
+        else:
+            return Response({'error': 'Pass phone or email'}, status=status.HTTP_400_BAD_REQUEST)
+        if customer is None:
+            return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CustomerSerializer(customer, context={'request': request}).data)
+
+
 class CustomerDetailView(RetrieveUpdateDestroyAPIView):
-    queryset = Customer.objects.all()
+    queryset = Customer.objects.select_related(*CUSTOMER_RELATIONS).prefetch_related('email_addresses')
     serializer_class = CustomerSerializer
     lookup_field = 'id'  # Important: since your ID is a CharField primary key
 
@@ -55,10 +106,135 @@ class CustomerDetailView(RetrieveUpdateDestroyAPIView):
         customer.save()
         return Response({'detail': 'Customer blocked instead of deleted.'}, status=status.HTTP_200_OK)
 
+class CustomerLoyaltyView(APIView):
+    """A customer's points balance and latest ledger entries."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, id):
+        customer = get_object_or_404(Customer, id=id)
+        account = LoyaltyInfo.objects.filter(customer=customer).first()
+        entries = customer.loyalty_entries.order_by('-id')[:LOYALTY_ENTRIES_SHOWN]
+        return Response({
+            'balance': LoyaltyInfoSerializer(account).data if account else None,
+            'entries': LoyaltyEntrySerializer(entries, many=True).data,
+        })
+
+
+class LoyaltyRedeemView(APIView):
+    """Spend a customer's points as a discount on one of their open orders."""
+    permission_classes = [IsAuthenticated]
+
+    @idempotent
+    def post(self, request, id):
+        serializer = LoyaltyRedeemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order, value = redeem_points(id, serializer.validated_data['points'], serializer.validated_data['order'])
+        except Order.DoesNotExist:
+            return Response({'error': "Order not found, already paid or not this customer's"}, status=status.HTTP_404_NOT_FOUND)
+        except LoyaltyError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'points': serializer.validated_data['points'],
+            'discount': value,
+            'orderDiscount': order.discount,
+            'balance': LoyaltyInfo.objects.get(customer_id=id).points,
+        })
+
+
 class CouponCampaignViewSet(viewsets.ModelViewSet):
     queryset = CouponCampaign.objects.all()
     serializer_class = CouponCampaignSerializer
 
+    def coupon_order(self, request):
+        serializer = CouponApplySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['code'], serializer.validated_data['order']
+
+    @action(detail=False, methods=['post'], url_path='validate', permission_classes=[IsAuthenticated])
+    def validate_coupon(self, request):
+        """Check a code against an order without using it (see ``customer.coupons``)."""
+        code, order_id = self.coupon_order(request)
+        order = Order.objects.filter(pk=order_id, is_paid=False).first()
+        if order is None:
+            return Response({'error': 'Order not found or already paid'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            campaign, amount = check_coupon(code, order)
+        except CouponError as e:
+            return Response({'valid': False, 'error': str(e)})
+        return Response({'valid': True, 'campaign': campaign['campaignName'], 'discount': amount})
+
+    @action(detail=False, methods=['post'], url_path='redeem', permission_classes=[IsAuthenticated])
+    @idempotent
+    def redeem(self, request):
+        """Use a code on an unpaid order and add its discount to the order."""
+        code, order_id = self.coupon_order(request)
+        try:
+            order, campaign, amount = redeem_coupon(code, order_id)
+        except Order.DoesNotExist:
+            return Response({'error': 'Order not found or already paid'}, status=status.HTTP_404_NOT_FOUND)
+        except CouponError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'campaign': campaign['campaignName'],
+            'discount': amount,
+            'orderDiscount': order.discount,
+        })
+
+    @action(detail=True, methods=['post'], url_path='codes/generate', permission_classes=[IsAuthenticated])
+    def generate_codes(self, request, pk=None):
+        """
+        Create ``count`` unique random codes for a bulk campaign and return
+        them as a CSV download.
+        """
+        campaign = self.get_object()
+        if campaign.customer_id is not None:
+            return Response({'error': 'Codes can only be added to a campaign without a customer'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = CouponCodeGenerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+        # Generate everything before answering, so a failure is an error
+        # response rather than a truncated file.
+        try:
+            with transaction.atomic():
+                chunks = list(generate_codes(campaign.pk, options['count'], options['prefix'], options['length']))
+        except CouponError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        def rows():
+            yield 'code\r\n'
+            for chunk in chunks:
+                yield ''.join(f'{code}\r\n' for code in chunk)
+
+        response = StreamingHttpResponse(rows(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="coupon-codes-{campaign.pk}.csv"'
+        return response
+
+    @action(detail=True, methods=['post'], url_path='codes/import', permission_classes=[IsAuthenticated])
+    def import_codes(self, request, pk=None):
+        """
+        Add existing codes to a bulk campaign. Send a CSV (code in the first
+        column) as the request body or as a ``file`` upload.
+        """
+        campaign = self.get_object()
+        if campaign.customer_id is not None:
+            return Response({'error': 'Codes can only be added to a campaign without a customer'}, status=status.HTTP_400_BAD_REQUEST)
+        upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+        data = upload.read() if upload is not None else request.body
+        try:
+            text = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return Response({'error': 'Upload must be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+        codes = [row[0] for row in csv.reader(io.StringIO(text)) if row]
+        if codes and codes[0].strip().lower() == 'code':
+            codes = codes[1:]
+        try:
+            with transaction.atomic():
+                result = import_codes(campaign.pk, codes)
+        except CouponError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
 
 from rest_framework import viewsets
 from .models import Company
@@ -1,4 +1,6 @@
 from django.contrib import admin
-from .models import Menu
+from .models import Menu, PriceOverride, Pricebook
 # Register your models here.
-admin.site.register(Menu)
\ No newline at end of file
+admin.site.register(Menu)
+admin.site.register(Pricebook)
+admin.site.register(PriceOverride)
\ No newline at end of file
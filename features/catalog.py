@@ -0,0 +1,282 @@
+"""
+Change tracking for catalog tables synced to POS devices.
+
+Every insert, update and delete of a tracked row (``features.Item`` and
+``inventory.Item``) stamps the row's ``version`` column, or for deletes a
+``CatalogTombstone``, with the writing transaction's version: its
+PostgreSQL transaction id plus a fixed offset (see the
+``catalog_write_version()`` function created by migration 0019). A device
+that last synced at version ``v`` only needs the rows and tombstones with
+``version > v``.
+
+Transaction ids are handed out when a transaction first writes, not when it
+commits, so a transaction still in flight can hold a lower version than one
+that already committed. Syncs therefore only hand out versions below the
+oldest transaction still running (``catalog_horizon()``): everything below
+it is committed (or rolled back) and nothing below it can appear later.
+
+Each write also advances ``catalog_version_seq``, which caches and ETags of
+catalog listings use as a change counter. Saves, ``QuerySet.update()``,
+``bulk_create`` and deletes through the model or its default manager are
+tracked. Raw SQL and cascades from other tables are not. Saves and deletes
+of the lookup tables (taxes, variants, option sets) only advance the
+sequence.
+"""
+from django.apps import apps
+from django.db import connection, models, transaction
+from django.db.models import Func, Value
+from django.db.models.functions import Now
+from django.utils.deconstruct import deconstructible
+
+
+VERSION_SEQUENCE = 'catalog_version_seq'
+
+
+@deconstructible(path='features.catalog.NextCatalogVersion')
+class NextCatalogVersion(Func):
+    """``nextval()`` on the catalog version sequence, usable in updates."""
+    function = 'nextval'
+    output_field = models.BigIntegerField()
+
+    def __init__(self):
+        super().__init__(Value(VERSION_SEQUENCE))
+
+
+@deconstructible(path='features.catalog.CatalogWriteVersion')
+class CatalogWriteVersion(Func):
+    """
+    ``catalog_write_version()``: the current transaction's catalog version.
+    Also advances the catalog version sequence.
+    """
+    template = 'catalog_write_version()'
+    output_field = models.BigIntegerField()
+
+    def __init__(self):
+        super().__init__()
+
+
+def catalog_write_version():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT catalog_write_version()")
+        return cursor.fetchone()[0]
+
+
+def next_catalog_version():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [VERSION_SEQUENCE])
+        return cursor.fetchone()[0]
+
+
+def touch_catalog():
+    """
+    Move the catalog version on once the current transaction commits, for
+    writes that bypass ``save()`` or span several statements (relations set
+    after the row). Caches keyed on the version made while the transaction
+    was open are then never reused.
+    """
+    transaction.on_commit(next_catalog_version)
+
+
+def current_catalog_version():
+    """
+    Value of the catalog change counter (0 before the first change). It
+    includes writes not yet committed; use ``committed_catalog_version``
+    for anything handed to devices.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {VERSION_SEQUENCE}")
+        return cursor.fetchone()[0]
+
+
+def committed_catalog_version():
+    """
+    Highest row or tombstone version below ``catalog_horizon()`` (0 if
+    none): every change up to it is committed, and any change made later
+    gets a higher version.
+    """
+    CatalogTombstone = apps.get_model('features', 'CatalogTombstone')
+    quote = connection.ops.quote_name
+    tables = [apps.get_model(label)._meta.db_table for label, _ in SYNC_TABLES.values()]
+    tables.append(CatalogTombstone._meta.db_table)
+    latest = ', '.join(
+        f"(SELECT MAX(version) FROM {quote(table)} WHERE version < h.horizon)" for table in tables
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT GREATEST({latest}, 0) FROM (SELECT catalog_horizon() AS horizon) AS h")
+        return cursor.fetchone()[0]
+
+
+def record_tombstones(model, ids):
+    CatalogTombstone = apps.get_model('features', 'CatalogTombstone')
+    CatalogTombstone.objects.bulk_create([
+        CatalogTombstone(model=model._meta.label_lower, object_id=pk) for pk in ids
+    ])
+
+
+class CatalogQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        kwargs.setdefault('version', CatalogWriteVersion())
+        kwargs.setdefault('updated_at', Now())
+        return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def delete(self):
+        record_tombstones(self.model, list(self.values_list('pk', flat=True)))
+        return super().delete()
+
+    delete.alters_data = True
+
+
+class CatalogModel(models.Model):
+    """
+    Base for catalog models synced to devices. New rows get their version
+    from the column default; saves of existing rows take a fresh one.
+    """
+    version = models.BigIntegerField(db_default=CatalogWriteVersion(), db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+
+    objects = CatalogQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version = catalog_write_version()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        record_tombstones(type(self), [self.pk])
+        return super().delete(*args, **kwargs)
+
+
+
+class CatalogLookupModel(models.Model):
+    """
+    Base for the small tables shipped with catalog snapshots (taxes,
+    variants, option sets). Their rows are not versioned, but saving or
+    deleting one moves the catalog version on so snapshots and ETags built
+    from the old state go stale; it moves again on commit, so a snapshot
+    built while the change was in flight is not taken as current.
+    """
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        next_catalog_version()
+        touch_catalog()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        next_catalog_version()
+        touch_catalog()
+        return result
+
+# Columns sent to devices per catalog table, keyed by the name used in the
+# sync payload. Many-to-many ids are appended for inventory items.
+SYNC_TABLES = {
+    'items': ('features.Item', [
+        'id', 'item_name', 'short_name', 'sku_code', 'barcode', 'category_id', 'item_brand_id',
+        'measuring_unit', 'mrp', 'selling_price', 'includes_tax', 'allow_price_override',
+        'not_eligible_for_discount', 'tax_code', 'taxes', 'tax_rate', 'nature_of_item', 'display_order', 'version',
+    ]),
+    'inventoryItems': ('inventory.Item', [
+        'id', 'shortName', 'longName', 'skuCode', 'barCode', 'groupSKUCode', 'category',
+        'measuringUnit', 'price', 'priceIncludesTax', 'displayOrder', 'categoryDisplayOrder',
+        'menus', 'tags', 'version',
+    ]),
+}
+INVENTORY_RELATIONS = ['taxes', 'optionSets', 'variants']
+
+
+def catalog_changes(since, limit, upto=None):
+    """
+    Rows and tombstones changed after version ``since`` and up to ``upto``
+    (by default ``committed_catalog_version()``), at most about ``limit``
+    per table, in a columnar layout::
+
+        {"version": v, "more": bool,
+         "items": {"columns": [...], "rows": [[...], ...]},
+         "inventoryItems": {...},
+         "deleted": {"items": [ids], "inventoryItems": [ids]}}
+
+    When a table has more than ``limit`` changes every table is cut at the
+    same version, so a device can continue from ``version`` with
+    ``more`` set. The rows of one transaction share a version and are never
+    split across pages, so a transaction larger than ``limit`` is sent whole.
+    """
+    CatalogTombstone = apps.get_model('features', 'CatalogTombstone')
+    if upto is None:
+        upto = committed_catalog_version()
+    querysets = {}
+    fetched = {}
+    cut = None
+    for key, (label, columns) in SYNC_TABLES.items():
+        model = apps.get_model(label)
+        rows = model.objects.filter(version__gt=since, version__lte=upto).order_by('version', 'pk').values_list(*columns)
+        deleted = (
+            CatalogTombstone.objects.filter(model=model._meta.label_lower, version__gt=since, version__lte=upto)
+            .order_by('version', 'pk').values_list('object_id', 'version')
+        )
+        querysets[key] = (rows, deleted)
+        rows, deleted = list(rows[:limit + 1]), list(deleted[:limit + 1])
+        for changes in (rows, deleted):
+            if len(changes) > limit:
+                # Stop before the transaction that does not fit, unless it
+                # is the first one on the page.
+                version = changes[limit][-1]
+                if changes[0][-1] < version:
+                    version -= 1
+                cut = version if cut is None else min(cut, version)
+        fetched[key] = (model, columns, rows, deleted)
+
+    payload = {'version': cut if cut is not None else max(since, upto), 'more': cut is not None}
+    payload['deleted'] = {}
+    for key, (model, columns, rows, deleted) in fetched.items():
+        if cut is not None:
+            all_rows, all_deleted = querysets[key]
+            rows, deleted = _up_to(rows, all_rows, cut, limit), _up_to(deleted, all_deleted, cut, limit)
+        table = {'columns': list(columns), 'rows': [list(row) for row in rows]}
+        if key == 'inventoryItems':
+            _append_relations(model, table)
+        payload[key] = table
+        payload['deleted'][key] = [object_id for object_id, _ in deleted]
+    return payload
+
+
+def _up_to(changes, queryset, cut, limit):
+    """
+    The fetched ``changes`` up to version ``cut``; a page that was
+    truncated inside that version is fetched again in full.
+    """
+    if len(changes) > limit and changes[-1][-1] <= cut:
+        return list(queryset.filter(version__lte=cut))
+    return [change for change in changes if change[-1] <= cut]
+
+
+def relation_ids(model, ids, names=INVENTORY_RELATIONS):
+    """``{relation: {item_id: [related ids]}}`` for the given many-to-many fields."""
+    relations = {}
+    for name in names:
+        field = model._meta.get_field(name)
+        through = field.remote_field.through
+        source, target = field.m2m_column_name(), field.m2m_reverse_name()
+        related = relations[name] = {}
+        if ids:
+            for item_id, related_id in through.objects.filter(**{f'{source}__in': ids}).values_list(source, target):
+                related.setdefault(item_id, []).append(related_id)
+    return relations
+
+
+def _append_relations(model, table):
+    """Add one id-list column per many-to-many relation of inventory items."""
+    relations = relation_ids(model, [row[0] for row in table['rows']])
+    for name, related in relations.items():
+        table['columns'].append(f'{name}Ids')
+        for row in table['rows']:
+            row.append(related.get(row[0], []))
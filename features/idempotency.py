@@ -0,0 +1,108 @@
+"""
+Idempotent replay of POS mutations.
+
+Clients on unreliable networks send an ``Idempotency-Key`` header with
+each mutation and reuse it on retries. The first request with a key runs
+normally and its response is stored; a retry with the same key and the same
+body gets the stored response back without running the view again. Keys are
+scoped to the device (or user) that sent them and expire after
+``IDEMPOTENCY_KEY_TTL`` seconds.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+DEFAULT_TTL = 60 * 60 * 24
+
+
+def _scope(request):
+    user = request.user
+    if not getattr(user, 'is_authenticated', False):
+        return 'anonymous'
+    return f"device:{user.device_key}" if getattr(user, 'device_key', None) else f"user:{user.pk}"
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def idempotent(view):
+    """
+    Make a DRF view method replay its stored response for a repeated
+    ``Idempotency-Key``. Requests without the header are not affected.
+
+    A key reused with a different request is rejected with 422, and a retry
+    that arrives while the first request is still running gets 409. Server
+    errors are not stored, so the client can retry them.
+    """
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return view(self, request, *args, **kwargs)
+        if len(key) > 100:
+            return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope = _scope(request)
+        fingerprint = _fingerprint(request)
+        now = timezone.now()
+        ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+
+        # Claim the key in its own transaction so a concurrent retry sees it.
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=fingerprint, expires_at=now + timedelta(seconds=ttl),
+                )
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None or record.expires_at <= now:
+                # Expired (or just evicted): drop it and treat this as a new request.
+                IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+                return wrapper(self, request, *args, **kwargs)
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {'error': 'Idempotency-Key was already used for a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record.status_code is None:
+                return Response(
+                    {'error': 'A request with this Idempotency-Key is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            response = Response(record.response, status=record.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        record.status_code = response.status_code
+        record.response = response.data
+        record.save(update_fields=['status_code', 'response'])
+        return response
+
+    return wrapper
+
+
+def purge_expired(now=None):
+    """Delete expired keys; returns the number removed."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,251 @@
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from backend import synthetic
+from cashflow.gateways import get_gateway
+
+
+STEPS = [
+    'device_login',
+    'create_order',
+    'add_items',
+    'apply_discount',
+    'manual_payment',
+    'close',
+    'print_receipt',
+]
+# With --payment gateway the cash tender is replaced by a card payment
+# through the local (offline) gateway stand-in.
+GATEWAY_STEPS = STEPS[:4] + ['gateway_initiate', 'gateway_verify'] + STEPS[5:]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the POS billing flow (login, add items, discount, payment, "
+        "close, receipt) against synthetic data and save the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help="Measured billing flows per pass")
+        parser.add_argument('--warmup', type=int, default=3, help="Unmeasured flows run before measuring")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--branches', type=int, default=2)
+        parser.add_argument('--items', type=int, default=500)
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=1000, help="Historical orders seeded before the run")
+        parser.add_argument('--lines', type=int, default=5, help="Order lines added per billing flow")
+        parser.add_argument('--output', default=None, help="Result file (default: bench_results/pos-<timestamp>.json)")
+        parser.add_argument('--compare', default=None, help="Earlier result file to print deltas against")
+        parser.add_argument('--payment', choices=['manual', 'gateway'], default='manual',
+                            help="Settle with a cash tender or through the local payment gateway stand-in")
+        parser.add_argument('--no-alloc', action='store_true', help="Skip the tracemalloc allocation pass")
+        parser.add_argument('--keep-data', action='store_true', help="Commit the synthetic data instead of rolling back")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        gateway = override_settings(PAYMENT_GATEWAY='local') if options['payment'] == 'gateway' else contextlib.nullcontext()
+        try:
+            with gateway, transaction.atomic():
+                get_gateway.cache_clear()
+                results = self.run(options)
+                if not options['keep_data']:
+                    transaction.set_rollback(True)
+        finally:
+            get_gateway.cache_clear()
+            teardown_test_environment()
+
+        output = options['output'] or os.path.join(
+            'bench_results', f"pos-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+        self.report(results)
+        if options['compare']:
+            self.compare(results, options['compare'])
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+
+        business, branches = synthetic.make_business(rng, 1, branches=options['branches'])
+        branch = branches[0]
+        cashier = synthetic.make_cashier(rng, business, branch)
+        items = synthetic.make_items(rng, options['items'])
+        customers = synthetic.make_customers(rng, branch, options['customers'])
+        synthetic.make_orders(rng, customers, items, options['orders'])
+
+        client = Client()
+        context = {
+            'rng': rng, 'cashier': cashier, 'items': items, 'customers': customers,
+            'lines': options['lines'], 'payment': options['payment'],
+        }
+        steps = GATEWAY_STEPS if options['payment'] == 'gateway' else STEPS
+
+        for _ in range(options['warmup']):
+            self.billing_flow(client, context)
+
+        timings = [self.billing_flow(client, context) for _ in range(options['iterations'])]
+
+        allocations = []
+        if not options['no_alloc']:
+            tracemalloc.start()
+            try:
+                allocations = [
+                    self.billing_flow(client, context, trace_alloc=True)
+                    for _ in range(options['iterations'])
+                ]
+            finally:
+                tracemalloc.stop()
+
+        return {
+            'meta': {
+                'benchmark': 'pos_billing_flow',
+                'timestamp': datetime.now().isoformat(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'seed': options['seed'],
+                'payment': options['payment'],
+                'iterations': options['iterations'],
+                'warmup': options['warmup'],
+                'dataset': {
+                    'branches': options['branches'],
+                    'items': options['items'],
+                    'customers': options['customers'],
+                    'orders': options['orders'],
+                    'lines_per_order': options['lines'],
+                },
+            },
+            'steps': {step: self.summarize(step, timings, allocations) for step in steps},
+        }
+
+    def billing_flow(self, client, context, trace_alloc=False):
+        """Run one full billing flow and return the per-step measurements."""
+        rng = context['rng']
+        cashier = context['cashier']
+        measurements = {}
+
+        def measure(step, method, path, data=None):
+            with CaptureQueriesContext(connection) as queries, contextlib.redirect_stdout(io.StringIO()):
+                if trace_alloc:
+                    tracemalloc.reset_peak()
+                    baseline = tracemalloc.get_traced_memory()[0]
+                started = time.perf_counter()
+                response = getattr(client, method)(path, data=data, content_type='application/json')
+                elapsed = time.perf_counter() - started
+                if trace_alloc:
+                    peak = tracemalloc.get_traced_memory()[1] - baseline
+            measurements[step] = {
+                'latency_ms': elapsed * 1000,
+                'queries': len(queries),
+                'status': response.status_code,
+            }
+            if trace_alloc:
+                measurements[step]['alloc_kb'] = peak / 1024
+            return response
+
+        measure('device_login', 'post', '/api/auth/login/', {
+            'user_id': cashier.user_id,
+            'device_key': cashier.device_key,
+            'pin': synthetic.BENCH_PIN,
+        })
+        client.force_login(cashier)
+
+        response = measure('create_order', 'post', '/api/POS/orders/interaction/', {
+            'customer': rng.choice(context['customers']).id,
+        })
+        order_id = response.json()['id']
+
+        lines = [
+            {'item_id': item.id, 'quantity': rng.randint(1, 3)}
+            for item in rng.sample(context['items'], min(len(context['items']), context['lines']))
+        ]
+        measure('add_items', 'post', f'/api/POS/orders/interaction/{order_id}/add_items/', {'items': lines})
+        measure('apply_discount', 'post', f'/api/POS/payment/{order_id}/apply-discount/', {'discount': '1.00'})
+        if context['payment'] == 'gateway':
+            response = measure('gateway_initiate', 'post', '/api/POS/payment/initiate-razorpay/', {'order_id': order_id})
+            gateway_order = response.json()['razorpay_order_id']
+            payment_id = f"pay_bench_{order_id}"
+            measure('gateway_verify', 'post', '/api/POS/payment/verify-razorpay/', {
+                'order_id': order_id,
+                'razorpay_order_id': gateway_order,
+                'razorpay_payment_id': payment_id,
+                'razorpay_signature': get_gateway().sign_payment(gateway_order, payment_id),
+            })
+        else:
+            measure('manual_payment', 'post', '/api/POS/payment/manual-payment/', {
+                'order_id': order_id,
+                'mode': 'cash',
+                'amount_received': str(Decimal('100000.00')),
+            })
+        measure('close', 'post', f'/api/POS/orders/interaction/{order_id}/close/')
+        measure('print_receipt', 'get', f'/api/POS/orders/interaction/{order_id}/print_receipt/')
+
+        client.logout()
+        return measurements
+
+    def summarize(self, step, timings, allocations):
+        latencies = sorted(run[step]['latency_ms'] for run in timings)
+        queries = [run[step]['queries'] for run in timings]
+        summary = {
+            'latency_ms': {
+                'min': round(latencies[0], 3),
+                'median': round(statistics.median(latencies), 3),
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                'max': round(latencies[-1], 3),
+                'mean': round(statistics.fmean(latencies), 3),
+            },
+            'queries': {
+                'min': min(queries),
+                'max': max(queries),
+                'mean': round(statistics.fmean(queries), 2),
+            },
+            'errors': sum(1 for run in timings if run[step]['status'] >= 400),
+        }
+        if allocations:
+            allocated = [run[step]['alloc_kb'] for run in allocations]
+            summary['alloc_kb'] = {
+                'median': round(statistics.median(allocated), 1),
+                'max': round(max(allocated), 1),
+            }
+        return summary
+
+    def report(self, results):
+        self.stdout.write(f"{'step':<16}{'median ms':>12}{'p95 ms':>10}{'queries':>10}{'alloc KB':>10}{'errors':>8}")
+        for step, summary in results['steps'].items():
+            alloc = summary.get('alloc_kb', {}).get('median', '-')
+            self.stdout.write(
+                f"{step:<16}{summary['latency_ms']['median']:>12}{summary['latency_ms']['p95']:>10}"
+                f"{summary['queries']['mean']:>10}{alloc:>10}{summary['errors']:>8}"
+            )
+
+    def compare(self, results, baseline_path):
+        try:
+            with open(baseline_path) as fh:
+                baseline = json.load(fh)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read baseline {baseline_path}: {e}")
+
+        self.stdout.write(f"\nCompared with {baseline_path} ({baseline['meta']['timestamp']}):")
+        for step, summary in results['steps'].items():
+            previous = baseline['steps'].get(step)
+            if not previous:
+                continue
+            latency_delta = summary['latency_ms']['median'] - previous['latency_ms']['median']
+            query_delta = summary['queries']['mean'] - previous['queries']['mean']
+            self.stdout.write(f"{step:<16}{latency_delta:>+12.3f} ms{query_delta:>+10.2f} queries")
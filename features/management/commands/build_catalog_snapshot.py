@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from features.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Build the full catalog snapshot if the catalog changed since the last one. Devices download the latest snapshot built, so run it after deploys and catalog imports and every few minutes from cron."
+
+    def handle(self, *args, **options):
+        version, path = build_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Catalog snapshot {version}: {path} ({path.stat().st_size:,} bytes)"))
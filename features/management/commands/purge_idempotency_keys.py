@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from features.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records and their stored responses. Run periodically (e.g. hourly from cron)."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} expired idempotency keys"))
@@ -0,0 +1,417 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from backend import synthetic
+from business.models import Business, Branch
+from cashflow.models import Payment
+from customer.contacts import normalize_phone
+from customer.models import Customer, LoyaltyEntry, LoyaltyInfo, Discount, CouponCampaign
+from features.models import Category, Brand, Item, Order, OrderItem
+from features.sales import touch_sales
+from inventory import models as inventory
+
+
+ORDER_COLUMNS = [
+    'id', 'customer_id', 'branch_id', 'created_at', 'status', 'is_paid', 'payment_mode',
+    'payment_reference', 'payment_date', 'amount_paid', 'discount',
+    'is_non_chargeable', 'non_chargeable_reason', 'special_notes',
+    'payment_received', 'change_due', 'tax_added',
+]
+ORDER_ITEM_COLUMNS = ['order_id', 'item_id', 'quantity', 'price', 'discount_amount', 'tax_rate', 'tax_amount']
+PAYMENT_COLUMNS = ['order_id', 'mode', 'amount', 'received_at']
+TAX_RATES = ['0.00', '5.00', '12.00', '18.00', '28.00']
+
+
+def money(paise):
+    return f"{paise // 100}.{paise % 100:02d}"
+
+
+def tax_factor(rate, includes_tax):
+    """``Item.tax_factor`` as the database stores it (ten decimal places)."""
+    rate = Decimal(rate)
+    factor = rate / (100 + rate) if includes_tax else rate / 100
+    return factor.quantize(Decimal('1E-10'), ROUND_HALF_UP)
+
+
+def round_paise(value):
+    """``value`` in paise rounded to whole paise, half away from zero like PostgreSQL's ROUND."""
+    return int(value.quantize(Decimal(1), ROUND_HALF_UP))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with tenant-scale synthetic data (businesses, branches, "
+        "catalog, customers with loyalty and coupons, orders, lines and payments) "
+        "for load testing. Uses COPY on PostgreSQL and bulk_create elsewhere. "
+        "Example for 10M orders: --businesses 2000 --branches 1:6 --items 100000 "
+        "--inventory-items 100000 --customers 2000000 --orders 10000000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--tag', default=None, help="Prefix for generated codes and ids (default: s<seed>)")
+        parser.add_argument('--businesses', type=int, default=100)
+        parser.add_argument('--branches', default='1:3', help="Extra branches per business as min:max, on top of the default branch")
+        parser.add_argument('--items', type=int, default=10000, help="features.Item rows")
+        parser.add_argument('--inventory-items', type=int, default=10000, help="inventory.Item rows")
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--lines', default='1:6', help="Order lines per order as min:max")
+        parser.add_argument('--quantity', default='1:3', help="Quantity per order line as min:max")
+        parser.add_argument('--days', type=int, default=365, help="Spread orders over this many past days")
+        parser.add_argument('--branch-skew', type=float, default=1.0, help="Zipf skew of order volume across branches (0 = uniform)")
+        parser.add_argument('--item-skew', type=float, default=1.1, help="Zipf skew of item popularity (0 = uniform)")
+        parser.add_argument('--payment-mix', default='cash:45,card:30,upi:20,razorpay:5')
+        parser.add_argument('--unpaid-ratio', type=float, default=0.02, help="Share of orders left open and unpaid")
+        parser.add_argument('--discount-ratio', type=float, default=0.1, help="Share of orders with a discount")
+        parser.add_argument('--loyalty-ratio', type=float, default=0.3, help="Share of customers with loyalty points")
+        parser.add_argument('--coupon-ratio', type=float, default=0.05, help="Share of customers with a coupon campaign")
+        parser.add_argument('--chunk', type=int, default=50000, help="Rows per COPY/bulk_create batch")
+        parser.add_argument('--no-copy', action='store_true', help="Use bulk_create even on PostgreSQL")
+        parser.add_argument(
+            '--skip-fk-checks', action='store_true',
+            help="PostgreSQL only, needs superuser: skip foreign key triggers while loading",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.tag = options['tag'] or f"s{options['seed']}"
+        self.chunk = options['chunk']
+        self.use_copy = not options['no_copy']
+        try:
+            self.branch_range = synthetic.parse_range(options['branches'])
+            self.line_range = synthetic.parse_range(options['lines'])
+            self.quantity_range = synthetic.parse_range(options['quantity'])
+            self.payment_modes, self.payment_weights = synthetic.parse_mix(options['payment_mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['orders'] and (options['customers'] < 1 or options['items'] < 1):
+            raise CommandError("Orders need at least one customer and one item.")
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Durability of synthetic data does not matter; don't wait on WAL flushes.
+                cursor.execute("SET synchronous_commit TO off")
+                if options['skip_fk_checks']:
+                    cursor.execute("SET session_replication_role TO replica")
+
+        started = time.perf_counter()
+        branches = self.seed_tenants(options['businesses'])
+        items = self.seed_catalog(options['items'])
+        self.seed_inventory(options['inventory_items'])
+        customers = self.seed_customers(branches, options)
+        self.seed_orders(customers, items, options)
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
+
+    def progress(self, label, done, total, started):
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(f"  {label}: {done:,}/{total:,} ({rate:,.0f} rows/s)")
+
+    def seed_tenants(self, count):
+        """Businesses with their default branch plus a random number of extra branches."""
+        rng = self.rng
+        business_types = [choice for choice, _ in Business.BUSINESS_TYPES]
+        businesses = Business.objects.bulk_create([
+            Business(
+                business_name=f"{self.tag} Business {n}",
+                brand_name=f"{self.tag} Brand {n}",
+                business_type=rng.choice(business_types),
+                account_number=f"{self.tag[:4]}{n:08d}",
+                is_active=True,
+            )
+            for n in range(count)
+        ], batch_size=self.chunk)
+
+        # bulk_create skips Business.save, so create the default branches here.
+        branches = []
+        for n, business in enumerate(businesses):
+            for number in range(1 + rng.randint(*self.branch_range)):
+                branches.append(Branch(
+                    branch_name=f"{business.business_name} - {'Main Branch' if number == 0 else f'Branch {number}'}",
+                    branch_code=f"{self.tag}B{n:06d}N{number:03d}",
+                    business=business,
+                    is_default=number == 0,
+                    status='active',
+                ))
+        branches = Branch.objects.bulk_create(branches, batch_size=self.chunk)
+        self.stdout.write(f"Tenants: {len(businesses):,} businesses, {len(branches):,} branches")
+        return branches
+
+    def seed_catalog(self, count):
+        """
+        features.Item rows; returns ``(ids, prices_in_paise, taxes)`` where
+        ``taxes`` holds each item's ``(tax_rate, tax_factor, includes_tax)``.
+        """
+        rng = self.rng
+        categories = Category.objects.bulk_create([Category(name=f"{self.tag} Category {n}") for n in range(50)])
+        brands = Brand.objects.bulk_create([Brand(name=f"{self.tag} Brand {n}") for n in range(20)])
+        first_id = synthetic.reserve_ids(Item, count)
+        ids, prices, taxes, rows = [], [], [], []
+        columns = [
+            'id', 'item_name', 'short_name', 'description', 'sku_code', 'barcode',
+            'supplier_barcodes', 'tax_code', 'nature_of_item', 'display_order', 'schedules',
+            'images', 'service_description', 'taxes', 'optional_set', 'category_id',
+            'account', 'menus', 'item_brand_id', 'tags', 'charges', 'measuring_unit',
+            'mrp', 'selling_price', 'includes_tax', 'allow_price_override',
+            'not_eligible_for_discount', 'tax_rate',
+        ]
+        for n in range(count):
+            item_id = first_id + n
+            price = rng.randint(1000, 100000)
+            includes_tax, rate = rng.random() < 0.5, rng.choice(TAX_RATES)
+            ids.append(item_id)
+            prices.append(price)
+            taxes.append((rate, tax_factor(rate, includes_tax), includes_tax))
+            rows.append((
+                item_id, f"{self.tag} Item {n}", f"I{n}", '', f"{self.tag}-SKU{n:07d}", f"89{item_id:011d}",
+                '', 'GST', rng.choice(['Goods', 'Service']), n, '',
+                None, '', rng.choice(['GST', 'CGST', 'SGST']), '', rng.choice(categories).id,
+                '', '', rng.choice(brands).id, '', '', 'pcs',
+                money(price), money(price), includes_tax, False,
+                rng.random() < 0.2, rate,
+            ))
+        self.write_chunked(Item, columns, rows, 'features items')
+        return ids, prices, taxes
+
+    def seed_inventory(self, count):
+        """inventory.Item rows with taxes, variants and option sets."""
+        if not count:
+            return
+        if inventory.Item._meta.db_table not in connection.introspection.table_names():
+            self.stdout.write(self.style.WARNING(
+                "Skipping inventory items: inventory tables do not exist (run migrate first)."
+            ))
+            return
+        rng = self.rng
+        taxes = inventory.Tax.objects.bulk_create([
+            inventory.Tax(name=f"{self.tag} GST {rate}", percentage=rate) for rate in (0, 5, 12, 18, 28)
+        ])
+        variants = inventory.ItemVariant.objects.bulk_create([
+            inventory.ItemVariant(name=f"{self.tag} Size", value=size) for size in ('S', 'M', 'L', 'XL')
+        ])
+        option_sets = inventory.ItemOptionSet.objects.bulk_create([
+            inventory.ItemOptionSet(name=f"{self.tag} Options {n}", label=f"Options {n}", min=0, max=3)
+            for n in range(20)
+        ])
+
+        first_id = synthetic.reserve_ids(inventory.Item, count)
+        columns = [
+            'id', 'shortName', 'longName', 'description', 'skuCode', 'barCode', 'groupSKUCode',
+            'measuringUnit', 'category', 'menus', 'tags', 'priceIncludesTax', 'price',
+            'displayOrder', 'categoryDisplayOrder',
+        ]
+        rows, tax_links, variant_links, option_links = [], [], [], []
+        for n in range(count):
+            item_id = first_id + n
+            rows.append((
+                item_id, f"{self.tag} Inv {n}", None, None, f"{self.tag}-INV{n:07d}", None, None,
+                'pcs', f"Category {rng.randrange(50)}", [], [], rng.random() < 0.5,
+                money(rng.randint(1000, 100000)), n, 0,
+            ))
+            tax_links.append((item_id, rng.choice(taxes).id))
+            if rng.random() < 0.3:
+                variant_links.append((item_id, rng.choice(variants).id))
+            if rng.random() < 0.2:
+                option_links.append((item_id, rng.choice(option_sets).id))
+        self.write_chunked(inventory.Item, columns, rows, 'inventory items')
+        self.write_chunked(inventory.Item.taxes.through, ['item_id', 'tax_id'], tax_links, 'item taxes')
+        self.write_chunked(inventory.Item.variants.through, ['item_id', 'itemvariant_id'], variant_links, 'item variants')
+        self.write_chunked(inventory.Item.optionSets.through, ['item_id', 'itemoptionset_id'], option_links, 'item option sets')
+
+    def seed_customers(self, branches, options):
+        """
+        Customers spread over branches in proportion to their order volume,
+        some with loyalty points and coupon campaigns. Returns a list of
+        ``(branch, cumulative_weight, customer_ids)`` used to draw orders.
+        """
+        rng = self.rng
+        total = options['customers']
+        order_weights = synthetic.zipf_weights(len(branches), options['branch_skew'])
+        shuffled = branches[:]
+        rng.shuffle(shuffled)
+
+        per_branch = []
+        previous = 0
+        for branch, weight in zip(shuffled, order_weights):
+            share = (weight - previous) / order_weights[-1]
+            previous = weight
+            per_branch.append((branch, weight, max(1, round(total * share))))
+
+        first_names = ['Asha', 'Ravi', 'Meena', 'Arjun', 'Divya', 'Karthik', 'Priya', 'Vikram', 'Lakshmi', 'Suresh']
+        today = datetime.now().date()
+        rows, loyalty, lots, coupons, pools = [], [], [], [], []
+        this_month = today.replace(day=1)
+        next_month = (this_month + timedelta(days=32)).replace(day=1)
+        created = datetime.now(dt_timezone.utc)
+        discounts = Discount.objects.bulk_create([
+            Discount(discountCode=f"{self.tag}-DISC{n}", discountType='percent', value=5 * (n % 4 + 1)) if n % 2 else
+            Discount(discountCode=f"{self.tag}-DISC{n}", discountType='amount', value=50 * (n % 5 + 1))
+            for n in range(20)
+        ])
+
+        for position, (branch, weight, count) in enumerate(per_branch):
+            ids = []
+            for n in range(count):
+                customer_id = f"{self.tag}-{position}-{n}"
+                ids.append(customer_id)
+                phone = synthetic.phone_number(len(rows))
+                rows.append((
+                    customer_id, branch.id, rng.choice(first_names), f"Customer{n}",
+                    phone, normalize_phone(phone), None, None, None,
+                    None, None, None, None, None, None, None, False, today,
+                ))
+                if rng.random() < options['loyalty_ratio']:
+                    # Balances come with the ledger lots they add up to.
+                    ending_this, ending_next = rng.randint(0, 100000), rng.randint(0, 100000)
+                    later = rng.randint(0, 300000)
+                    loyalty.append((customer_id, money(ending_this + ending_next + later), money(0),
+                                    money(ending_this), money(ending_next), this_month))
+                    for points, expires_on in (
+                        (ending_this, next_month - timedelta(days=1)),
+                        (ending_next, (next_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)),
+                        (later, today + timedelta(days=rng.randint(62, 365))),
+                    ):
+                        if points:
+                            lots.append((customer_id, 'opening', money(points), money(points), expires_on, None, created))
+                if rng.random() < options['coupon_ratio']:
+                    start = today - timedelta(days=rng.randint(0, 60))
+                    coupons.append((customer_id, start, start + timedelta(days=rng.randint(7, 90))))
+            pools.append((branch, weight, ids))
+
+        columns = [
+            'id', 'branch_id', 'first_name', 'last_name', 'phone_number', 'phone_e164', 'gender',
+            'dob', 'anniversary_date', 'company_id', 'tax_id', 'secondary_tax_id',
+            'tax_state_code', 'addresses_id', 'pan_card_front', 'pan_card_back',
+            'is_blocked', 'created_date',
+        ]
+        self.write_chunked(Customer, columns, rows, 'customers')
+        self.write_chunked(
+            LoyaltyInfo,
+            ['customer_id', 'points', 'reserved_points', 'points_ending_this_month', 'points_ending_next_month',
+             'buckets_month'],
+            loyalty, 'loyalty accounts',
+        )
+        self.write_chunked(
+            LoyaltyEntry,
+            ['customer_id', 'kind', 'points', 'remaining', 'expires_on', 'order_id', 'created_at'],
+            lots, 'loyalty ledger entries',
+        )
+
+        if coupons:
+            first_coupon_id = synthetic.reserve_ids(CouponCampaign, len(coupons))
+            coupon_rows, coupon_discounts = [], []
+            for n, (customer_id, start, expiry) in enumerate(coupons):
+                coupon_id = first_coupon_id + n
+                coupon_rows.append((
+                    coupon_id, rng.choice(['Flipkart', 'Amazon', 'Paytm', 'InStore']),
+                    f"{self.tag.upper()}{coupon_id:09d}", start, expiry,
+                    f"{self.tag} Campaign {n % 50}", customer_id, 1, 0,
+                ))
+                for discount in rng.sample(discounts, rng.randint(1, 2)):
+                    coupon_discounts.append((coupon_id, discount.id))
+            self.write_chunked(
+                CouponCampaign,
+                ['id', 'couponProvider', 'couponCode', 'startDate', 'expiryDate', 'campaignName', 'customer_id',
+                 'usageLimit', 'timesRedeemed'],
+                coupon_rows, 'coupon campaigns',
+            )
+            self.write_chunked(
+                CouponCampaign.discounts.through, ['couponcampaign_id', 'discount_id'],
+                coupon_discounts, 'coupon discounts',
+            )
+        return pools
+
+    def seed_orders(self, pools, items, options):
+        """
+        Orders with their lines and payments, written chunk by chunk. Line
+        discount shares and tax are worked out here as ``features.tax``
+        would store them and written in the same COPY, so the load needs no
+        pass over the lines afterwards.
+        """
+        total = options['orders']
+        if not total:
+            return
+        rng = self.rng
+        item_ids, item_prices, item_taxes = items
+        item_weights = synthetic.zipf_weights(len(item_ids), options['item_skew'])
+        item_positions = list(range(len(item_ids)))
+        rng.shuffle(item_positions)
+        hour_weights = synthetic.cumulative(synthetic.HOURLY_PROFILE)
+        branch_weights = [weight for _, weight, _ in pools]
+        now = datetime.now(dt_timezone.utc)
+        first_day = (now - timedelta(days=options['days'])).replace(hour=0, minute=0, second=0, microsecond=0)
+        unpaid_ratio = options['unpaid_ratio']
+        discount_ratio = options['discount_ratio']
+
+        started = time.perf_counter()
+        done = 0
+        while done < total:
+            size = min(self.chunk, total - done)
+            first_id = synthetic.reserve_ids(Order, size)
+            orders, lines, payments = [], [], []
+            for n in range(size):
+                order_id = first_id + n
+                branch, _, customers = rng.choices(pools, cum_weights=branch_weights)[0]
+                created_at = first_day + timedelta(
+                    days=rng.randrange(options['days']),
+                    hours=rng.choices(range(24), cum_weights=hour_weights)[0],
+                    seconds=rng.randrange(3600),
+                )
+
+                picked = []
+                line_count = rng.randint(*self.line_range)
+                for position in rng.choices(item_positions, cum_weights=item_weights, k=line_count):
+                    picked.append((position, rng.randint(*self.quantity_range)))
+                gross = sum(item_prices[position] * quantity for position, quantity in picked)
+
+                discount = gross * rng.randint(5, 15) // 100 if rng.random() < discount_ratio else 0
+                tax_added = 0
+                for position, quantity in picked:
+                    amount = item_prices[position] * quantity
+                    share = round_paise(Decimal(discount * amount) / gross) if discount else 0
+                    rate, factor, includes_tax = item_taxes[position]
+                    tax = round_paise((amount - share) * factor)
+                    if not includes_tax:
+                        tax_added += tax
+                    lines.append((
+                        order_id, item_ids[position], quantity, money(item_prices[position]),
+                        money(share), rate, money(tax),
+                    ))
+
+                net = gross - discount + tax_added
+                if rng.random() < unpaid_ratio:
+                    orders.append((
+                        order_id, rng.choice(customers), branch.id, created_at, 'open', False, None,
+                        None, None, None, money(discount), False, None, '', '0.00', '0.00', money(tax_added),
+                    ))
+                    continue
+
+                mode = rng.choices(self.payment_modes, cum_weights=self.payment_weights)[0]
+                paid_at = created_at + timedelta(minutes=rng.randint(1, 30))
+                orders.append((
+                    order_id, rng.choice(customers), branch.id, created_at, 'closed', True, mode,
+                    None, paid_at, money(net), money(discount), False, None, '',
+                    money(net), '0.00', money(tax_added),
+                ))
+                payments.append((order_id, mode, money(net), paid_at))
+
+            with transaction.atomic():
+                synthetic.write_rows(Order, ORDER_COLUMNS, orders, self.use_copy)
+                synthetic.write_rows(OrderItem, ORDER_ITEM_COLUMNS, lines, self.use_copy)
+                synthetic.write_rows(Payment, PAYMENT_COLUMNS, payments, self.use_copy)
+                touch_sales(range(first_id, first_id + size))
+            done += size
+            self.progress('orders', done, total, started)
+
+    def write_chunked(self, model, columns, rows, label):
+        started = time.perf_counter()
+        for start in range(0, len(rows), self.chunk):
+            with transaction.atomic():
+                synthetic.write_rows(model, columns, rows[start:start + self.chunk], self.use_copy)
+        if rows:
+            self.progress(label, len(rows), len(rows), started)
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_order_branch(apps, schema_editor):
+    Order = apps.get_model('features', 'Order')
+    Customer = apps.get_model('customer', 'Customer')
+    Order.objects.filter(branch__isnull=True).update(
+        branch=Subquery(Customer.objects.filter(pk=OuterRef('customer_id')).values('branch_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0003_branch_is_default'),
+        ('customer', '0007_remove_customer_branch_code_customer_branch'),
+        ('features', '0010_delete_company_alter_ristacard_linked_customer_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='business.branch'),
+        ),
+        migrations.RunPython(backfill_order_branch, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['branch', 'created_at'], name='order_branch_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['branch', 'status'], name='order_branch_status_idx'),
+        ),
+    ]
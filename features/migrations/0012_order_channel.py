@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0003_branch_is_default'),
+        ('features', '0011_order_branch_order_order_branch_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='channel',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='business.channel'),
+        ),
+    ]
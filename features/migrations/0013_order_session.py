@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cashflow', '0002_session_running_totals'),
+        ('features', '0012_order_channel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='session',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='cashflow.session'),
+        ),
+    ]
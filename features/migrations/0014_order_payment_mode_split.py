@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0013_order_session'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='payment_mode',
+            field=models.CharField(blank=True, choices=[('cash', 'Cash'), ('card', 'Card'), ('upi', 'UPI'), ('razorpay', 'Razorpay'), ('non_chargeable', 'Non-Chargeable'), ('split', 'Split')], max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0015_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='gateway_order_id',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0016_order_gateway_order_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='client_id',
+            field=models.UUIDField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:28
+
+import django.db.models.functions.datetime
+import features.catalog
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0017_order_client_id'),
+    ]
+
+    operations = [
+        # Shared by every catalog table; see features.catalog.
+        migrations.RunSQL(
+            "CREATE SEQUENCE IF NOT EXISTS catalog_version_seq",
+            reverse_sql="DROP SEQUENCE IF EXISTS catalog_version_seq",
+        ),
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.BigIntegerField(db_default=features.catalog.NextCatalogVersion(), db_index=True, editable=False)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='version',
+            field=models.BigIntegerField(db_default=features.catalog.NextCatalogVersion(), db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:05
+
+import features.catalog
+from django.db import migrations, models
+
+
+def create_version_functions(apps, schema_editor):
+    """
+    Catalog versions are transaction ids offset past every version handed
+    out so far, so devices' existing sync versions stay valid.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM catalog_version_seq")
+        offset = cursor.fetchone()[0] + 1
+        cursor.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION catalog_write_version() RETURNS bigint LANGUAGE plpgsql AS $$
+            BEGIN
+                PERFORM nextval('catalog_version_seq');
+                RETURN pg_current_xact_id()::text::bigint + {offset};
+            END $$
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION catalog_horizon() RETURNS bigint LANGUAGE sql STABLE AS $$
+                SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint + {offset}
+            $$
+            """
+        )
+
+
+def drop_version_functions(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP FUNCTION IF EXISTS catalog_write_version(), catalog_horizon()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0018_catalog_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_version_functions,
+            reverse_code=drop_version_functions,
+        ),
+        migrations.AlterField(
+            model_name='catalogtombstone',
+            name='version',
+            field=models.BigIntegerField(db_default=features.catalog.CatalogWriteVersion(), db_index=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='version',
+            field=models.BigIntegerField(db_default=features.catalog.CatalogWriteVersion(), db_index=True, editable=False),
+        ),
+    ]
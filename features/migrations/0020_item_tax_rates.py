@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:37
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0019_catalog_write_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='tax_rate',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='tax_rate',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='tax_amount',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='tax_factor',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(includes_tax=True, then=django.db.models.expressions.CombinedExpression(models.F('tax_rate'), '/', django.db.models.expressions.CombinedExpression(models.Value(100), '+', models.F('tax_rate')))), default=django.db.models.expressions.CombinedExpression(models.F('tax_rate'), '/', models.Value(100))), output_field=models.DecimalField(decimal_places=10, max_digits=12)),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0020_item_tax_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='discount_amount',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, max_digits=10),
+        ),
+        # Existing lines of discounted orders get their share, split as in
+        # features.tax.apply_order_tax; every other line keeps the default 0.
+        migrations.RunSQL(
+            """
+            UPDATE features_orderitem AS l SET discount_amount = v.discount_amount
+            FROM (
+                SELECT l.id, ROUND(o.discount * l.price * l.quantity
+                                   / NULLIF(SUM(l.price * l.quantity) OVER (PARTITION BY l.order_id), 0), 2)
+                       AS discount_amount
+                FROM features_orderitem l
+                JOIN features_order o ON o.id = l.order_id
+                WHERE o.discount > 0
+            ) AS v
+            WHERE l.id = v.id AND v.discount_amount IS NOT NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
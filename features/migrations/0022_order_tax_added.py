@@ -0,0 +1,67 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0021_orderitem_discount_amount'),
+        ('inventory', '0002_catalog_write_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='tax_added',
+            field=models.DecimalField(db_default=0, decimal_places=2, default=0, max_digits=10),
+        ),
+        # Items still at the default rate take the taxes of the inventory item
+        # with the same SKU, and whether its price includes them. The POS item's
+        # own ``taxes`` is only a GST/CGST/SGST label with no rate, so items
+        # without an inventory counterpart stay at 0 until a rate is set.
+        migrations.RunSQL(
+            """
+            UPDATE features_item AS f SET tax_rate = t.tax_rate, includes_tax = t.includes_tax
+            FROM (
+                SELECT i."skuCode" AS sku_code, i."priceIncludesTax" AS includes_tax,
+                       SUM(tax.percentage) AS tax_rate
+                FROM inventory_item i
+                JOIN inventory_item_taxes it ON it.item_id = i.id
+                JOIN inventory_tax tax ON tax.id = it.tax_id
+                GROUP BY i.id
+            ) AS t
+            WHERE f.sku_code = t.sku_code AND f.sku_code <> '' AND f.tax_rate = 0 AND t.tax_rate > 0
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        # Line tax for every existing order, as features.tax.apply_order_tax
+        # computes it. Only open orders get tax_added: paid orders were settled
+        # without it.
+        migrations.RunSQL(
+            """
+            UPDATE features_orderitem AS l SET tax_rate = v.tax_rate, tax_amount = v.tax_amount
+            FROM (
+                SELECT l.id, i.tax_rate, ROUND((l.price * l.quantity - l.discount_amount) * i.tax_factor, 2) AS tax_amount
+                FROM features_orderitem l
+                JOIN features_item i ON i.id = l.item_id
+            ) AS v
+            WHERE l.id = v.id AND (l.tax_rate, l.tax_amount) IS DISTINCT FROM (v.tax_rate, v.tax_amount)
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE features_order AS o SET tax_added = v.tax_added
+            FROM (
+                SELECT l.order_id, SUM(l.tax_amount) AS tax_added
+                FROM features_orderitem l
+                JOIN features_item i ON i.id = l.item_id
+                WHERE NOT i.includes_tax
+                GROUP BY l.order_id
+            ) AS v
+            WHERE o.id = v.order_id AND NOT o.is_paid
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0003_branch_is_default'),
+        ('features', '0022_order_tax_added'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revision', models.PositiveIntegerField(default=1)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='business.branch')),
+            ],
+            options={
+                'unique_together': {('branch', 'day')},
+            },
+        ),
+    ]
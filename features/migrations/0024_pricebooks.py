@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business', '0003_branch_is_default'),
+        ('features', '0023_salesrevision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pricebook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PriceOverride',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='business.branch')),
+                ('channel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='business.channel')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_overrides', to='features.item')),
+                ('pricebook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='features.pricebook')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pricebook', 'branch'], name='price_override_book_branch_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,11 @@
-from django.db import models
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+
+from .catalog import CatalogModel, CatalogWriteVersion
+from .sales import touch_sales
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -16,7 +23,7 @@ class Charge(models.Model):
     name = models.CharField(max_length=100)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
 
-class Item(models.Model):
+class Item(CatalogModel):
     item_name = models.CharField(max_length=255)
     short_name = models.CharField(max_length=100, blank=True)
     description = models.TextField(blank=True)
@@ -44,11 +51,110 @@ class Item(models.Model):
     includes_tax = models.BooleanField(default=False)
     allow_price_override = models.BooleanField(default=False)
     not_eligible_for_discount = models.BooleanField(default=True)
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0, db_default=0)  # percent
+    # Share of a line amount that is tax, kept by the database: rate / (100 + rate)
+    # when the price includes tax, rate / 100 when tax is added on top.
+    tax_factor = models.GeneratedField(
+        expression=Case(
+            When(includes_tax=True, then=F('tax_rate') / (Value(100) + F('tax_rate'))),
+            default=F('tax_rate') / Value(100),
+        ),
+        output_field=models.DecimalField(max_digits=12, decimal_places=10),
+        db_persist=True,
+    )
 
     def __str__(self):
         return self.item_name
     
 
+
+class Pricebook(models.Model):
+    """
+    A set of item prices that branches use instead of ``selling_price``.
+    Branches refer to it by ``code`` in ``Branch.pricebook``. ``version``
+    moves on whenever one of its prices changes, which invalidates the
+    price maps built from it (see ``features.pricebook``).
+    """
+    code = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=255, blank=True)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name or self.code
+
+
+def touch_pricebooks(pricebook_ids):
+    """Move the version of ``pricebook_ids`` on, so their price maps are rebuilt."""
+    Pricebook.objects.filter(pk__in=pricebook_ids).update(version=F('version') + 1)
+
+
+class PriceOverrideQuerySet(models.QuerySet):
+    """
+    Bulk writes move the affected pricebooks' versions on, as ``save`` does.
+    ``bulk_update`` goes through ``update``.
+    """
+
+    def update(self, **kwargs):
+        with transaction.atomic():
+            rows = list(self.values_list('pk', 'pricebook_id'))
+            result = super().update(**kwargs)
+            pricebook_ids = {pricebook_id for _, pricebook_id in rows}
+            if 'pricebook' in kwargs or 'pricebook_id' in kwargs:
+                pricebook_ids.update(
+                    self.model.objects.filter(pk__in=[pk for pk, _ in rows]).values_list('pricebook_id', flat=True)
+                )
+            touch_pricebooks(pricebook_ids)
+        return result
+
+    update.alters_data = True
+
+    def delete(self):
+        with transaction.atomic():
+            pricebook_ids = set(self.values_list('pricebook_id', flat=True))
+            result = super().delete()
+            touch_pricebooks(pricebook_ids)
+        return result
+
+    delete.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic():
+            objs = super().bulk_create(objs, *args, **kwargs)
+            touch_pricebooks({obj.pricebook_id for obj in objs})
+        return objs
+
+
+class PriceOverride(models.Model):
+    """
+    An item price in a pricebook, optionally only for one branch, one
+    channel or a time window. Bounded windows are promotions. Every write,
+    single or bulk, moves the pricebook's version on.
+    """
+    pricebook = models.ForeignKey(Pricebook, related_name='prices', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, related_name='price_overrides', on_delete=models.CASCADE)
+    branch = models.ForeignKey("business.Branch", on_delete=models.CASCADE, null=True, blank=True)
+    channel = models.ForeignKey("business.Channel", on_delete=models.CASCADE, null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pricebook', 'branch'], name='price_override_book_branch_idx'),
+        ]
+
+    objects = PriceOverrideQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        touch_pricebooks([self.pricebook_id])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        touch_pricebooks([self.pricebook_id])
+        return result
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('open', 'Open'),
@@ -57,6 +163,15 @@ class Order(models.Model):
         ('discarded', 'Discarded')
     ]
     customer = models.ForeignKey("customer.Customer", on_delete=models.CASCADE)
+    # Copied from customer.branch on creation so reports can filter orders
+    # by branch without joining through Customer.
+    branch = models.ForeignKey("business.Branch", on_delete=models.CASCADE, related_name='orders', null=True, blank=True)
+    channel = models.ForeignKey("business.Channel", on_delete=models.SET_NULL, related_name='orders', null=True, blank=True)
+    # Id generated by the till for orders captured offline; unique so a
+    # re-uploaded bundle cannot create the order twice.
+    client_id = models.UUIDField(null=True, blank=True, unique=True)
+    # Till session the order was rung up in.
+    session = models.ForeignKey("cashflow.Session", on_delete=models.SET_NULL, related_name='orders', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, default='active')  # new: to track order state
     is_paid = models.BooleanField(default=False)
@@ -65,20 +180,41 @@ class Order(models.Model):
         ('card', 'Card'),
         ('upi', 'UPI'),
         ('razorpay', 'Razorpay'),
-        ('non_chargeable', 'Non-Chargeable')
+        ('non_chargeable', 'Non-Chargeable'),
+        ('split', 'Split'),
     ], null=True, blank=True)
     payment_reference = models.CharField(max_length=100, null=True, blank=True)
+    # Order id issued by the payment gateway, matched against its webhooks.
+    gateway_order_id = models.CharField(max_length=64, null=True, blank=True, db_index=True)
     payment_date = models.DateTimeField(null=True, blank=True)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
-    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     is_non_chargeable = models.BooleanField(default=False)  
     non_chargeable_reason = models.TextField(blank=True, null=True)  # Reason for non-chargeable
     special_notes = models.TextField(blank=True)
     payment_received = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     change_due = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    
+    # Tax on lines whose price excludes it, charged on top of the line
+    # amounts. Written by features.tax.
+    tax_added = models.DecimalField(max_digits=10, decimal_places=2, default=0, db_default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'created_at'], name='order_branch_created_idx'),
+            models.Index(fields=['branch', 'status'], name='order_branch_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.branch_id is None and self.customer_id:
+            self.branch_id = self.customer.branch_id
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        touch_sales([self.pk])
+        return super().delete(*args, **kwargs)
+
     def total_price(self):
-        return sum(item.price * item.quantity for item in self.items.all()) - self.discount
+        return sum(item.price * item.quantity for item in self.items.all()) - self.discount + self.tax_added
     
     def calculate_change(self, amount_received):
         total = self.total_price()
@@ -92,6 +228,12 @@ class OrderItem(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Written by features.tax: the line's share of the order discount, the
+    # item's rate when the tax was computed and the tax in the line's amount
+    # after its discount share.
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, db_default=0)
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0, db_default=0)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, db_default=0)
     
 
 class RistaCard(models.Model):
@@ -104,3 +246,40 @@ class Appointment(models.Model):
     status = models.CharField(max_length=50)
 
 
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied ``Idempotency-Key`` and the response it produced, so
+    a retried POS mutation is answered from here instead of re-running.
+    ``status_code`` is null while the first request is still in flight.
+    """
+    scope = models.CharField(max_length=64)  # device (or user) the key belongs to
+    key = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('scope', 'key')
+
+class CatalogTombstone(models.Model):
+    """A deleted catalog row, kept so devices can drop it on their next sync."""
+    model = models.CharField(max_length=100)  # e.g. "features.item"
+    object_id = models.BigIntegerField()
+    version = models.BigIntegerField(db_default=CatalogWriteVersion(), db_index=True, editable=False)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+
+class SalesRevision(models.Model):
+    """
+    Change counter for a branch's sales on a past day, bumped by
+    ``features.sales.touch_sales``; cached report figures are keyed by it.
+    """
+    branch = models.ForeignKey("business.Branch", on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    revision = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('branch', 'day')
@@ -0,0 +1,290 @@
+"""
+Upload of orders captured by a till while it was offline.
+
+A bundle is JSON (optionally gzip-compressed) of the form::
+
+    {"orders": [{
+        "client_id": "<uuid>", "customer": "<customer id>",
+        "created_at": "<ISO 8601>", "status": "closed",
+        "discount": "10.00", "special_notes": "",
+        "lines": [[item_id, quantity, "price"], ...],
+        "payments": [["cash", "100.00", "reference"], ...]
+    }, ...]}
+
+The whole bundle is applied in one transaction with a handful of bulk
+queries. Conflicts resolve the same way however often a bundle is
+re-sent:
+
+* an order whose ``client_id`` is already on the server is a duplicate;
+  the server copy wins and its id is acknowledged again;
+* an order naming an unknown customer (or one from another branch) or an
+  unknown item, or with invalid values, is rejected as a whole;
+* a line or payment that is not an array of the shape above means the
+  till's encoder is broken, and the whole bundle is refused;
+* line prices are taken as captured on the till, and tax on items priced
+  without it is added to the order total as for orders taken online;
+* tenders beyond the order total are not applied.
+
+Accepted orders are created in ``(created_at, client_id)`` order.
+"""
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from customer.loyalty import accrue_points
+from customer.models import Customer
+from cashflow.models import Payment, Session, SessionClosed
+from .models import Item, Order, OrderItem
+from .sales import touch_sales
+from .tax import apply_order_tax
+
+
+MAX_ORDERS = 5000
+SYNC_ATTEMPTS = 3
+STATUSES = {'open', 'held', 'closed', 'discarded'}
+PAYMENT_MODES = {'cash', 'card', 'upi', 'non_chargeable'}
+
+
+class BundleError(ValueError):
+    """The bundle itself is malformed; nothing was applied."""
+
+
+def _money(value):
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount {value!r}")
+    if amount < 0:
+        raise ValueError(f"Negative amount {value!r}")
+    return amount
+
+
+def _fields(entry, sizes, name):
+    if not isinstance(entry, (list, tuple)) or len(entry) not in sizes:
+        raise BundleError(f"Malformed {name} {entry!r}")
+    return entry
+
+
+def _parse_order(raw):
+    """
+    Normalise one bundle order; raises ValueError for invalid values and
+    ``BundleError`` for lines or payments of the wrong shape.
+    """
+    created_at = parse_datetime(str(raw.get('created_at', '')))
+    if created_at is None:
+        raise ValueError("created_at is missing or invalid")
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    status = raw.get('status', 'closed')
+    if status not in STATUSES:
+        raise ValueError(f"Unknown status {status!r}")
+
+    lines = []
+    for line in raw.get('lines') or []:
+        item_id, quantity, price = _fields(line, {3}, 'order line')
+        if int(quantity) < 1:
+            raise ValueError("Line quantity must be at least 1")
+        lines.append((int(item_id), int(quantity), _money(price)))
+    if not lines:
+        raise ValueError("Order has no lines")
+
+    payments = []
+    for payment in raw.get('payments') or []:
+        mode, amount, *reference = _fields(payment, {2, 3}, 'payment')
+        if mode not in PAYMENT_MODES:
+            raise ValueError(f"Unknown payment mode {mode!r}")
+        payments.append((mode, _money(amount), (reference[0] if reference else None) or None))
+
+    return {
+        'customer': str(raw.get('customer', '')),
+        'created_at': created_at,
+        'status': status,
+        'discount': _money(raw.get('discount', 0)),
+        'special_notes': str(raw.get('special_notes') or ''),
+        'lines': lines,
+        'payments': payments,
+    }
+
+
+SETTLEMENT_FIELDS = ['amount_paid', 'payment_received', 'change_due', 'is_paid', 'payment_mode', 'payment_date']
+
+
+def _finish_orders(orders):
+    """Store the till's ``created_at`` and the settlement fields of ``orders``."""
+    if not orders:
+        return
+    if connection.vendor == 'postgresql':
+        # One UPDATE joined to per-column arrays; bulk_update's CASE
+        # expressions cost more to build than the insert itself.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Order._meta.db_table} AS o SET
+                    created_at = v.created_at, amount_paid = v.amount_paid, payment_received = v.payment_received,
+                    change_due = v.change_due, is_paid = v.is_paid, payment_mode = v.payment_mode,
+                    payment_date = v.payment_date
+                FROM (
+                    SELECT unnest(%s::bigint[]) AS id, unnest(%s::timestamptz[]) AS created_at,
+                           unnest(%s::numeric[]) AS amount_paid, unnest(%s::numeric[]) AS payment_received,
+                           unnest(%s::numeric[]) AS change_due, unnest(%s::boolean[]) AS is_paid,
+                           unnest(%s::varchar[]) AS payment_mode, unnest(%s::timestamptz[]) AS payment_date
+                ) AS v
+                WHERE o.id = v.id
+                """,
+                [[order.id for order in orders], [order.created_at for order in orders]]
+                + [[getattr(order, field) for order in orders] for field in SETTLEMENT_FIELDS],
+            )
+    else:
+        Order.objects.bulk_update(orders, ['created_at', *SETTLEMENT_FIELDS], batch_size=1000)
+
+
+def apply_bundle(user, bundle):
+    """
+    Apply an offline bundle for ``user``'s branch. Returns the compact
+    acknowledgement ``{"accepted": [[client_id, order_id], ...],
+    "duplicates": [[client_id, order_id], ...], "rejected": [[client_id,
+    reason], ...]}``. Raises ``BundleError`` if the bundle is malformed or
+    the user's till session is closed while it is applied.
+    """
+    raw_orders = bundle.get('orders') if isinstance(bundle, dict) else None
+    if not isinstance(raw_orders, list):
+        raise BundleError("Bundle must be an object with an 'orders' list")
+    if len(raw_orders) > MAX_ORDERS:
+        raise BundleError(f"At most {MAX_ORDERS} orders per bundle")
+
+    rejected = []
+    parsed = {}
+    for raw in raw_orders:
+        try:
+            client_id = uuid.UUID(str(raw.get('client_id')))
+        except (AttributeError, ValueError):
+            raise BundleError("Every order needs a UUID client_id")
+        if client_id in parsed:
+            continue  # repeated within the bundle: first copy wins
+        try:
+            parsed[client_id] = _parse_order(raw)
+        except BundleError:
+            raise
+        except (TypeError, ValueError) as e:
+            rejected.append([str(client_id), str(e)])
+
+    branch_id = getattr(user, 'branch_id', None)
+    session = Session.open_for(user)
+
+    for attempt in range(1, SYNC_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                return _apply_orders(parsed, list(rejected), branch_id, session)
+        except IntegrityError:
+            # A concurrent upload of the same orders committed first (the
+            # insert waits for it on the unique client_id); on the next
+            # attempt they read as duplicates.
+            if attempt == SYNC_ATTEMPTS:
+                raise
+
+
+def _apply_orders(parsed, rejected, branch_id, session):
+    """
+    Create the orders of ``parsed`` whose client ids are not stored yet,
+    with their lines and payments, and return ``apply_bundle``'s
+    acknowledgement.
+    """
+    duplicates = dict(
+        Order.objects.filter(client_id__in=list(parsed)).values_list('client_id', 'id')
+    )
+    pending = {cid: order for cid, order in parsed.items() if cid not in duplicates}
+
+    customers = dict(
+        Customer.objects.filter(
+            id__in={order['customer'] for order in pending.values()}, branch_id=branch_id
+        ).values_list('id', 'branch_id')
+    )
+    known_items = set(
+        Item.objects.filter(
+            id__in={line[0] for order in pending.values() for line in order['lines']}
+        ).values_list('id', flat=True)
+    )
+
+    accepted = []
+    for client_id, order in sorted(pending.items(), key=lambda entry: (entry[1]['created_at'], str(entry[0]))):
+        if order['customer'] not in customers:
+            rejected.append([str(client_id), f"Unknown customer {order['customer']}"])
+        elif any(line[0] not in known_items for line in order['lines']):
+            missing = sorted({line[0] for line in order['lines']} - known_items)
+            rejected.append([str(client_id), f"Unknown items {missing}"])
+        else:
+            accepted.append((client_id, order))
+
+    orders = Order.objects.bulk_create([
+        Order(
+            client_id=client_id,
+            customer_id=order['customer'],
+            branch_id=customers[order['customer']],
+            session=session,
+            status=order['status'],
+            discount=order['discount'],
+            special_notes=order['special_notes'],
+        )
+        for client_id, order in accepted
+    ])
+    lines = [
+        OrderItem(order=order, item_id=item_id, quantity=quantity, price=price)
+        for order, (_, data) in zip(orders, accepted) for item_id, quantity, price in data['lines']
+    ]
+    OrderItem.objects.bulk_create(lines, batch_size=5000)
+    # Tax on items priced without it is part of what was owed.
+    apply_order_tax([order.id for order in orders])
+    tax_added = dict(Order.objects.filter(pk__in=[order.id for order in orders]).values_list('id', 'tax_added'))
+
+    payments = []
+    for order, (_, data) in zip(orders, accepted):
+        gross = sum((quantity * price for _, quantity, price in data['lines']), Decimal('0'))
+        total = max(Decimal('0'), gross - data['discount']) + tax_added[order.id]
+        tendered = sum((amount for _, amount, _ in data['payments']), Decimal('0'))
+        paid = min(tendered, total)
+        modes = {mode for mode, _, _ in data['payments']}
+        data['total'] = total
+        # created_at is auto_now_add, so the till's timestamps go in afterwards.
+        order.created_at = data['created_at']
+        order.tax_added = tax_added[order.id]
+        order.amount_paid = paid if data['payments'] else None
+        order.payment_received = tendered
+        order.change_due = tendered - paid
+        order.is_paid = bool(data['payments']) and paid >= total
+        order.payment_mode = (modes.pop() if len(modes) == 1 else 'split') if modes else None
+        order.payment_date = data['created_at'] if data['payments'] else None
+        remaining = total
+        for mode, amount, reference in data['payments']:
+            applied = min(amount, remaining)
+            remaining -= applied
+            if applied > 0:
+                payments.append(Payment(order=order, session=session, mode=mode, amount=applied, reference=reference))
+    _finish_orders(orders)
+    # Orders from past days change figures already cached for them.
+    touch_sales([order.id for order in orders])
+    Payment.objects.bulk_create(payments, batch_size=5000)
+    accrue_points([order.id for order in orders if order.is_paid])
+
+    if session:
+        # bulk_create skips Payment.save, so add to the running totals here.
+        closed = [data for _, data in accepted if data['status'] == 'closed']
+        by_mode = {}
+        for payment in payments:
+            amount, count = by_mode.get(payment.mode, (Decimal('0'), 0))
+            by_mode[payment.mode] = (amount + payment.amount, count + 1)
+        try:
+            if closed:
+                Session.add_sale(session.id, sum(data['total'] for data in closed), count=len(closed))
+            for mode, (amount, count) in by_mode.items():
+                Session.add_payment(session.id, mode, amount, count=count)
+        except SessionClosed:
+            raise BundleError("The till session was closed during the upload; upload the bundle again")
+
+    return {
+        'accepted': [[str(client_id), order.id] for order, (client_id, _) in zip(orders, accepted)],
+        'duplicates': [[str(client_id), order_id] for client_id, order_id in duplicates.items()],
+        'rejected': rejected,
+    }
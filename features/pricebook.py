@@ -0,0 +1,70 @@
+"""
+Price resolution for order lines.
+
+A branch's ``pricebook`` field names a ``Pricebook`` by code. A pricebook
+holds ``PriceOverride`` rows, each optionally limited to one branch, one
+channel or a time window (a promotion). When an item is scanned the most
+specific override that applies wins: branch and channel, then branch, then
+channel, then a plain pricebook price; at the same level a promotion beats a
+standing price. Items with no applicable override sell at ``selling_price``.
+
+The overrides for a (branch, pricebook) pair are loaded once into a dict
+keyed by item and reused until the pricebook's version moves on, so a
+lookup is a dict access however many overrides the pricebook has. Each
+process keeps its own maps; the version makes them agree.
+"""
+import functools
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PriceOverride, Pricebook
+
+
+class PriceMap:
+    """Overrides by item id, each list ordered best first."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def price(self, item, channel_id=None, at=None):
+        candidates = self.entries.get(item.pk)
+        if candidates:
+            at = at or timezone.now()
+            for channel, price, starts_at, ends_at in candidates:
+                if ((channel is None or channel == channel_id)
+                        and (starts_at is None or starts_at <= at)
+                        and (ends_at is None or at < ends_at)):
+                    return price
+        return item.selling_price
+
+
+EMPTY = PriceMap({})
+
+
+@functools.lru_cache(maxsize=256)
+def _build(branch_id, pricebook_id, version):
+    rows = (
+        PriceOverride.objects
+        .filter(Q(branch__isnull=True) | Q(branch_id=branch_id), pricebook_id=pricebook_id)
+        .exclude(ends_at__lte=timezone.now())
+        .values_list('item_id', 'branch_id', 'channel_id', 'price', 'starts_at', 'ends_at')
+    )
+    ranked = {}
+    for item_id, branch, channel, price, starts_at, ends_at in rows:
+        rank = (branch is not None, channel is not None, starts_at is not None or ends_at is not None)
+        ranked.setdefault(item_id, []).append((rank, (channel, price, starts_at, ends_at)))
+    return PriceMap({
+        item_id: [entry for _, entry in sorted(candidates, key=lambda candidate: candidate[0], reverse=True)]
+        for item_id, candidates in ranked.items()
+    })
+
+
+def price_map(branch):
+    """The current ``PriceMap`` for ``branch`` (one query to check the version)."""
+    if branch is None or not branch.pricebook:
+        return EMPTY
+    current = Pricebook.objects.filter(code=branch.pricebook).values_list('id', 'version').first()
+    if current is None:
+        return EMPTY
+    return _build(branch.pk, *current)
@@ -0,0 +1,64 @@
+"""
+Change tracking for past sales, for caches of report figures.
+
+``SalesRevision`` holds a counter per (branch, local day) that is bumped
+whenever orders of that day change after the day is over: lines written
+or re-taxed (``features.tax.apply_order_tax``), orders uploaded by an
+offline till, bulk loads and order deletes. Days still running are not
+counted, so ordinary trading never writes to the table.
+
+A cached figure for a closed period is keyed by the period's signature,
+the sum of its days' revisions: every bump raises it, so a stale entry is
+simply never read again. Read the signature before the figures it keys;
+a write that lands in between then only leaves fresher figures under the
+old key.
+
+Raw SQL writes and cascades from other tables (deleting a customer) are not
+tracked.
+"""
+from django.apps import apps
+from django.db import connection
+from django.utils import timezone
+
+
+def touch_sales(order_ids):
+    """Bump the revision of every past (branch, day) holding one of ``order_ids``."""
+    order_ids = [order_id for order_id in order_ids if order_id is not None]
+    if not order_ids:
+        return
+    Order = apps.get_model('features', 'Order')
+    SalesRevision = apps.get_model('features', 'SalesRevision')
+    revisions, orders = SalesRevision._meta.db_table, Order._meta.db_table
+    zone = timezone.get_current_timezone_name()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {revisions} (branch_id, day, revision)
+            SELECT DISTINCT branch_id, (created_at AT TIME ZONE %s)::date, 1
+            FROM {orders}
+            WHERE id = ANY(%s) AND branch_id IS NOT NULL AND (created_at AT TIME ZONE %s)::date < %s
+            ORDER BY 1, 2
+            ON CONFLICT (branch_id, day) DO UPDATE SET revision = {revisions}.revision + 1
+            """,
+            [zone, order_ids, zone, timezone.localdate()],
+        )
+
+
+def sales_signatures(branch, periods):
+    """
+    Signature of each ``(first_day, last_day)`` period in ``periods`` for
+    ``branch``: the sum of its days' revisions (0 if none changed).
+    """
+    if not periods:
+        return []
+    SalesRevision = apps.get_model('features', 'SalesRevision')
+    revisions = SalesRevision.objects.filter(
+        branch=branch,
+        day__gte=min(first for first, _ in periods),
+        day__lte=max(last for _, last in periods),
+    ).values_list('day', 'revision')
+    revisions = list(revisions)
+    return [
+        sum(revision for day, revision in revisions if first <= day <= last)
+        for first, last in periods
+    ]
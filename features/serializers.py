@@ -60,7 +60,8 @@ class OrderCreateSerializer(serializers.ModelSerializer):
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ['id', 'item', 'quantity', 'price']
+        fields = ['id', 'item', 'quantity', 'price', 'tax_rate', 'tax_amount']
+        read_only_fields = ['tax_rate', 'tax_amount']
 
 class OrderDetailSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
@@ -78,7 +79,7 @@ class OrderItemDisplaySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
-        fields = ['item_name', 'quantity', 'price']
+        fields = ['item_name', 'quantity', 'price', 'tax_rate', 'tax_amount']
         
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemDisplaySerializer(many=True, read_only=True)
@@ -86,7 +87,7 @@ class OrderSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'status', 'created_at', 'items', 'total', 
+        fields = ['id', 'customer', 'channel', 'status', 'created_at', 'items', 'total', 
                  'discount', 'payment_mode', 'is_paid', 'payment_date']
     
     def get_total(self, obj):
@@ -157,6 +158,16 @@ class UPIPaymentSerializer(serializers.Serializer):
     upi_id = serializers.CharField()
     amount = serializers.DecimalField(max_digits=10, decimal_places=2)
     
+class TenderSerializer(serializers.Serializer):
+    mode = serializers.ChoiceField(choices=['cash', 'card', 'upi'])
+    # Omit on the last tender to cover whatever is still outstanding.
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False, default=None)
+    reference = serializers.CharField(required=False, allow_blank=True)
+
+class SplitPaymentSerializer(serializers.Serializer):
+    order_id = serializers.IntegerField()
+    tenders = TenderSerializer(many=True, allow_empty=False)
+
 class NonChargeablePaymentSerializer(serializers.Serializer):
     order_id = serializers.IntegerField()
     reason = serializers.CharField(required=False, allow_blank=True)
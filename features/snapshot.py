@@ -0,0 +1,157 @@
+"""
+Full catalog snapshots for new or wiped devices.
+
+A snapshot is one gzip-compressed NDJSON file, built by the
+``build_catalog_snapshot`` command and then served as a static file, so
+downloads cost no serialization and can be resumed with HTTP ranges.
+Requests are always answered with the latest file built; they never build
+one. After loading it a device continues with the delta sync from the
+snapshot's version. The layout is::
+
+    {"snapshot": "catalog", "version": 6600, "generated_at": "..."}
+    {"table": "taxes", "columns": ["id", "name", "percentage"], "count": 5}
+    [1, "GST 5", "5.00"]
+    ...
+    {"table": "inventoryItems", "columns": [...], "count": 100000}
+    ...
+
+Each table header is followed by ``count`` rows, one JSON array per line.
+
+Every table is read in one REPEATABLE READ transaction, and the snapshot's
+version is the committed catalog version seen by it (see
+``features.catalog``), so the delta sync picks up exactly what the file
+misses. Files are named by that version and the catalog change counter, so
+a lookup-table edit, which has no version of its own, also gets a new file.
+"""
+import gzip
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .catalog import (
+    INVENTORY_RELATIONS, SYNC_TABLES, committed_catalog_version, current_catalog_version, relation_ids,
+)
+
+
+# pg_advisory_lock key so only one process builds a given snapshot.
+BUILD_LOCK = 0x63617461
+KEEP_SNAPSHOTS = 2
+CHUNK_SIZE = 2000
+FILENAME = re.compile(r'catalog-(\d+)-(\d+)\.ndjson\.gz')
+
+LOOKUP_TABLES = [
+    ('taxes', 'inventory.Tax', ['id', 'name', 'percentage']),
+    ('variants', 'inventory.ItemVariant', ['id', 'name', 'value']),
+    ('optionSets', 'inventory.ItemOptionSet', ['id', 'name', 'label', 'min', 'max']),
+    ('options', 'inventory.ItemOptionSetOption', [
+        'id', 'option_set_id', 'option_id', 'name', 'displayOrder', 'skuCode',
+        'isDefault', 'measuringUnit', 'price', 'max',
+    ]),
+]
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'CATALOG_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'var' / 'catalog'))
+
+
+def snapshot_path(version, counter, directory=None):
+    return Path(directory or snapshot_dir()) / f'catalog-{version}-{counter}.ndjson.gz'
+
+
+def _snapshots(directory):
+    """``(counter, version, path)`` of the snapshots in ``directory``, oldest first."""
+    if not directory.is_dir():
+        return []
+    return sorted(
+        (int(match.group(2)), int(match.group(1)), entry) for entry in directory.iterdir()
+        if (match := FILENAME.fullmatch(entry.name))
+    )
+
+
+def _write_table(out, name, queryset, columns, relations=()):
+    out.write(_line({'table': name, 'columns': columns + [f'{r}Ids' for r in relations], 'count': queryset.count()}))
+    chunk = []
+    for row in queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(list(row))
+        if len(chunk) == CHUNK_SIZE:
+            _write_rows(out, queryset.model, chunk, relations)
+            chunk = []
+    _write_rows(out, queryset.model, chunk, relations)
+
+
+def _write_rows(out, model, rows, relations):
+    if relations:
+        related = relation_ids(model, [row[0] for row in rows], relations)
+        for row in rows:
+            row.extend(related[name].get(row[0], []) for name in relations)
+    out.writelines(_line(row) for row in rows)
+
+
+def _line(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+def build_snapshot(directory=None):
+    """
+    Write a snapshot unless the catalog has not changed since the latest
+    one, prune older ones and return ``(version, path)``. The file is
+    written under a temporary name and renamed into place, so readers never
+    see a partial snapshot. Must not be called inside a transaction.
+    """
+    directory = Path(directory or snapshot_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", [BUILD_LOCK])
+        try:
+            # Read before the tables: a change committed after this moves
+            # the counter on again, so it is never taken as covered.
+            counter = current_catalog_version()
+            latest = _snapshots(directory)
+            if latest and latest[-1][0] == counter:
+                return latest[-1][1], latest[-1][2]
+            with transaction.atomic():
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                version = committed_catalog_version()
+                path = _write_snapshot(directory, version, counter)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [BUILD_LOCK])
+
+    for _, _, old in _snapshots(directory)[:-KEEP_SNAPSHOTS]:
+        old.unlink(missing_ok=True)
+    return version, path
+
+
+def _write_snapshot(directory, version, counter):
+    path = snapshot_path(version, counter, directory)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8', compresslevel=9) as out:
+            out.write(_line({'snapshot': 'catalog', 'version': version, 'generated_at': timezone.now()}))
+            for name, label, columns in LOOKUP_TABLES:
+                _write_table(out, name, apps.get_model(label).objects.order_by('id'), columns)
+            for name, (label, columns) in SYNC_TABLES.items():
+                relations = INVENTORY_RELATIONS if label == 'inventory.Item' else ()
+                _write_table(out, name, apps.get_model(label).objects.order_by('id'), columns, relations)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return path
+
+
+def latest_snapshot(directory=None):
+    """``(version, path)`` of the latest snapshot built, or None if there is none yet."""
+    snapshots = _snapshots(Path(directory or snapshot_dir()))
+    if not snapshots:
+        return None
+    _, version, path = snapshots[-1]
+    return version, path
@@ -0,0 +1,72 @@
+"""
+Tax on order lines.
+
+Each catalog item has a tax rate and, derived from it by the database,
+``Item.tax_factor``: the share of an amount that is tax, which already
+accounts for whether the item's price includes tax. Tax for a set of orders
+is then one UPDATE over their lines: each line's amount, less its share of
+the order discount (split by line amount, as in the reports), times its
+item's factor. The result, the rate used and the line's discount share are
+stored on the line, so reports sum ``OrderItem.tax_amount`` and
+``OrderItem.discount_amount`` instead of recomputing them.
+
+For items priced without tax the line tax is also charged: the order's
+``tax_added`` is the sum of those lines' tax and ``Order.total_price()``
+adds it to what the customer pays.
+
+Changes to orders of past days are recorded with ``features.sales.touch_sales``
+so cached report figures for those days are rebuilt.
+"""
+from django.db import connection
+
+from .models import Item, Order, OrderItem
+from .sales import touch_sales
+
+
+def apply_order_tax(order_ids):
+    """Compute and store line tax for every line of ``order_ids``, and the orders' ``tax_added``."""
+    order_ids = [order_id for order_id in order_ids if order_id is not None]
+    if not order_ids:
+        return
+    lines, items, orders = OrderItem._meta.db_table, Item._meta.db_table, Order._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {lines} AS l SET discount_amount = v.discount_amount, tax_rate = v.tax_rate,
+                                    tax_amount = v.tax_amount
+            FROM (
+                SELECT id, tax_rate, discount AS discount_amount,
+                       ROUND((amount - discount) * tax_factor, 2) AS tax_amount
+                FROM (
+                    SELECT l.id, i.tax_rate, i.tax_factor, l.price * l.quantity AS amount,
+                           CASE WHEN o.discount > 0 THEN COALESCE(ROUND(
+                               o.discount * l.price * l.quantity
+                               / NULLIF(SUM(l.price * l.quantity) OVER (PARTITION BY l.order_id), 0), 2
+                           ), 0) ELSE 0 END AS discount
+                    FROM {lines} l
+                    JOIN {items} i ON i.id = l.item_id
+                    JOIN {orders} o ON o.id = l.order_id
+                    WHERE l.order_id = ANY(%s)
+                ) AS shares
+            ) AS v
+            WHERE l.id = v.id AND (l.discount_amount, l.tax_rate, l.tax_amount)
+                  IS DISTINCT FROM (v.discount_amount, v.tax_rate, v.tax_amount)
+            """,
+            [order_ids],
+        )
+        cursor.execute(
+            f"""
+            UPDATE {orders} AS o SET tax_added = v.tax_added
+            FROM (
+                SELECT o.id, COALESCE(SUM(l.tax_amount) FILTER (WHERE NOT i.includes_tax), 0) AS tax_added
+                FROM {orders} o
+                LEFT JOIN {lines} l ON l.order_id = o.id
+                LEFT JOIN {items} i ON i.id = l.item_id
+                WHERE o.id = ANY(%s)
+                GROUP BY o.id
+            ) AS v
+            WHERE o.id = v.id AND o.tax_added IS DISTINCT FROM v.tax_added
+            """,
+            [order_ids],
+        )
+    touch_sales(order_ids)
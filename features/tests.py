@@ -1,3 +1,568 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import random
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.response import Response
+
+from backend import synthetic
+from business.models import Channel
+from cashflow.models import Payment
+from inventory.models import Tax
+from features.catalog import catalog_changes, committed_catalog_version
+from features.models import IdempotencyKey, Item, Order, OrderItem, PriceOverride, Pricebook
+from features.offline_sync import BundleError, apply_bundle
+from features.pricebook import _build, price_map
+from features.snapshot import build_snapshot
+from features.tax import apply_order_tax
+from features.views import PaymentViewSet
+
+
+class IdempotencyTest(TestCase):
+    URL = '/api/POS/payment/manual-payment/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(5)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+        self.order = Order.objects.create(customer=self.customer, branch=self.customer.branch, status='open')
+        OrderItem.objects.create(order=self.order, item=self.item, price=Decimal('50.00'), quantity=2)
+
+    def pay(self, amount, key='key-1'):
+        return self.client.post(
+            self.URL, {'order_id': self.order.pk, 'mode': 'cash', 'amount_received': amount},
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.pay('40.00')
+        second = self.pay('40.00')
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Payment.objects.filter(order=self.order).count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.pay('40.00')
+        self.assertEqual(self.pay('60.00').status_code, 422)
+        self.assertEqual(Payment.objects.filter(order=self.order).count(), 1)
+
+    def test_retry_while_the_first_request_runs_conflicts(self):
+        self.pay('40.00')
+        IdempotencyKey.objects.update(status_code=None, response=None)
+        self.assertEqual(self.pay('40.00').status_code, 409)
+        self.assertEqual(Payment.objects.filter(order=self.order).count(), 1)
+
+    def test_server_errors_are_not_stored(self):
+        with mock.patch.object(PaymentViewSet, 'settle', return_value=Response({'error': 'down'}, status=503)):
+            self.assertEqual(self.pay('40.00').status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.pay('40.00').status_code, 200)
+
+        with mock.patch.object(PaymentViewSet, 'settle', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.pay('10.00', key='key-2')
+        self.assertFalse(IdempotencyKey.objects.filter(key='key-2').exists())
+
+    def test_expired_key_is_claimed_again(self):
+        self.pay('40.00')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.pay('60.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Payment.objects.filter(order=self.order).count(), 2)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+
+    def test_requests_without_a_key_are_not_recorded(self):
+        self.client.post(
+            self.URL, {'order_id': self.order.pk, 'mode': 'cash', 'amount_received': '40.00'},
+            content_type='application/json',
+        )
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class OrderTaxTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(29)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.inclusive, cls.exclusive = synthetic.make_items(rng, 2)
+        Item.objects.filter(pk=cls.inclusive.pk).update(tax_rate=18, includes_tax=True)
+        Item.objects.filter(pk=cls.exclusive.pk).update(tax_rate=18, includes_tax=False)
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+
+    def order(self, lines, discount=0):
+        order = Order.objects.create(
+            customer=self.customer, branch=self.customer.branch, status='open', discount=discount,
+        )
+        for item, price in lines:
+            OrderItem.objects.create(order=order, item=item, price=Decimal(price), quantity=1)
+        apply_order_tax([order.pk])
+        order.refresh_from_db()
+        return order
+
+    def taxes(self, order):
+        return list(order.items.order_by('pk').values_list('discount_amount', 'tax_amount'))
+
+    def test_inclusive_price_carries_its_tax(self):
+        order = self.order([(self.inclusive, '118.00')])
+        self.assertEqual(self.taxes(order), [(Decimal('0.00'), Decimal('18.00'))])
+        self.assertEqual(order.tax_added, 0)
+        self.assertEqual(order.total_price(), Decimal('118.00'))
+
+    def test_exclusive_price_is_charged_its_tax(self):
+        order = self.order([(self.exclusive, '100.00')])
+        self.assertEqual(self.taxes(order), [(Decimal('0.00'), Decimal('18.00'))])
+        self.assertEqual(order.tax_added, Decimal('18.00'))
+        self.assertEqual(order.total_price(), Decimal('118.00'))
+
+        self.client.force_login(self.cashier)
+        url = '/api/POS/payment/manual-payment/'
+        for amount, paid in (('100.00', False), ('18.00', True)):
+            self.client.post(
+                url, {'order_id': order.pk, 'mode': 'cash', 'amount_received': amount},
+                content_type='application/json',
+            )
+            order.refresh_from_db()
+            self.assertEqual(order.is_paid, paid)
+
+    def test_discount_is_split_by_line_amount_before_tax(self):
+        order = self.order([(self.exclusive, '60.00'), (self.inclusive, '40.00')], discount=10)
+        self.assertEqual(self.taxes(order), [
+            (Decimal('6.00'), Decimal('9.72')),   # 54 * 18%
+            (Decimal('4.00'), Decimal('5.49')),   # 36 * 18/118
+        ])
+        self.assertEqual(order.tax_added, Decimal('9.72'))
+        self.assertEqual(order.total_price(), Decimal('99.72'))
+
+    def test_orders_created_through_the_api_report_their_total(self):
+        self.client.force_login(self.cashier)
+        url = '/api/POS/orders/interaction/'
+        response = self.client.post(url, {'customer': self.customer.pk, 'status': 'open'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((Decimal(str(response.json()['total'])), response.json()['discount']), (0, '0.00'))
+
+        order_id = response.json()['id']
+        response = self.client.post(
+            f'{url}{order_id}/add_items/', {'items': [{'item_id': self.exclusive.pk, 'quantity': 2}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        Order.objects.filter(pk=order_id).update(discount=Decimal('10.00'))
+        apply_order_tax([order_id])
+
+        order = Order.objects.get(pk=order_id)
+        subtotal = sum(line.price * line.quantity for line in order.items.all())
+        receipt = self.client.get(f'{url}{order_id}/print_receipt/').json()['receipt']
+        self.assertEqual(
+            (receipt['subtotal'], receipt['discount'], receipt['tax_added'], receipt['total']),
+            (float(subtotal), 10.0, float(order.tax_added), float(order.total_price())),
+        )
+        self.assertEqual(order.tax_added, ((subtotal - 10) * Decimal('0.18')).quantize(Decimal('0.01')))
+
+    def test_offline_orders_charge_exclusive_tax(self):
+        self.client.force_login(self.cashier)
+        bundle = {'orders': [{
+            'client_id': str(uuid.uuid4()), 'customer': self.customer.pk,
+            'created_at': timezone.now().isoformat(),
+            'lines': [[self.exclusive.pk, 1, '100.00']], 'payments': [['cash', '100.00']],
+        }]}
+        self.client.post('/api/POS/orders/interaction/sync/', bundle, content_type='application/json')
+        order = Order.objects.get()
+        self.assertEqual((order.tax_added, order.total_price()), (Decimal('18.00'), Decimal('118.00')))
+        self.assertFalse(order.is_paid)
+
+
+class PricebookTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(31)
+        _, (cls.branch, cls.other) = synthetic.make_business(rng, 1, branches=2)
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.book = Pricebook.objects.create(code='retail')
+        cls.channel = Channel.objects.create(name='Delivery')
+        for branch in (cls.branch, cls.other):
+            branch.pricebook = 'retail'
+            branch.save()
+
+    def setUp(self):
+        # Rolled-back tests reuse pricebook ids and versions.
+        _build.cache_clear()
+
+    def override(self, price, **fields):
+        return PriceOverride.objects.create(pricebook=self.book, item=self.item, price=Decimal(price), **fields)
+
+    def price(self, branch=None, channel=None):
+        return price_map(branch or self.branch).price(self.item, channel.pk if channel else None)
+
+    def version(self):
+        self.book.refresh_from_db()
+        return self.book.version
+
+    def test_resolution_order(self):
+        self.assertEqual(self.price(), self.item.selling_price)
+        self.override('90.00')
+        self.assertEqual(self.price(), Decimal('90.00'))
+        self.override('80.00', channel=self.channel)
+        self.assertEqual((self.price(), self.price(channel=self.channel)), (Decimal('90.00'), Decimal('80.00')))
+        self.override('70.00', branch=self.branch)
+        self.assertEqual(self.price(channel=self.channel), Decimal('70.00'))
+        self.assertEqual(self.price(self.other, self.channel), Decimal('80.00'))
+        self.override('60.00', branch=self.branch, channel=self.channel)
+        self.assertEqual((self.price(), self.price(channel=self.channel)), (Decimal('70.00'), Decimal('60.00')))
+
+    def test_promotion_beats_a_standing_price_only_in_its_window(self):
+        self.override('90.00')
+        now = timezone.now()
+        self.override('50.00', starts_at=now - timedelta(hours=1), ends_at=now + timedelta(hours=1))
+        self.override('40.00', starts_at=now + timedelta(hours=1))
+        self.assertEqual(self.price(), Decimal('50.00'))
+
+    def test_bulk_writes_move_the_version_on(self):
+        version = self.version()
+        PriceOverride.objects.bulk_create([PriceOverride(pricebook=self.book, item=self.item, price=Decimal('90.00'))])
+        self.assertEqual(self.version(), version + 1)
+        self.assertEqual(self.price(), Decimal('90.00'))
+
+        PriceOverride.objects.update(price=Decimal('85.00'))
+        self.assertEqual(self.version(), version + 2)
+        self.assertEqual(self.price(), Decimal('85.00'))
+
+        override = PriceOverride.objects.get()
+        override.price = Decimal('75.00')
+        PriceOverride.objects.bulk_update([override], ['price'])
+        self.assertEqual(self.version(), version + 3)
+        self.assertEqual(self.price(), Decimal('75.00'))
+
+        PriceOverride.objects.all().delete()
+        self.assertEqual(self.version(), version + 4)
+        self.assertEqual(self.price(), self.item.selling_price)
+
+    def test_moving_an_override_touches_both_pricebooks(self):
+        other = Pricebook.objects.create(code='wholesale')
+        self.override('90.00')
+        version = self.version()
+        PriceOverride.objects.update(pricebook=other)
+        other.refresh_from_db()
+        self.assertEqual((self.version(), other.version), (version + 1, 2))
+
+
+class SeedLoadTest(TestCase):
+    def test_loaded_tax_matches_the_tax_pass(self):
+        call_command(
+            'seed_load', businesses=2, items=50, inventory_items=0, customers=20, orders=300,
+            discount_ratio=0.5, unpaid_ratio=0.2, chunk=100, stdout=io.StringIO(),
+        )
+        columns = ('discount_amount', 'tax_rate', 'tax_amount')
+        loaded = list(OrderItem.objects.order_by('pk').values_list(*columns))
+        added = list(Order.objects.order_by('pk').values_list('tax_added', flat=True))
+        self.assertTrue(any(added))
+
+        apply_order_tax(list(Order.objects.values_list('pk', flat=True)))
+        self.assertEqual(list(OrderItem.objects.order_by('pk').values_list(*columns)), loaded)
+        self.assertEqual(list(Order.objects.order_by('pk').values_list('tax_added', flat=True)), added)
+        for order in Order.objects.filter(is_paid=True).prefetch_related('items')[:50]:
+            self.assertEqual(order.amount_paid, order.total_price())
+
+
+class OfflineSyncTest(TestCase):
+    URL = '/api/POS/orders/interaction/sync/'
+    CAPTURED_AT = datetime(2026, 3, 1, 9, 30, tzinfo=dt_timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(17)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.item = synthetic.make_items(rng, 1)[0]
+        cls.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def order(self, **fields):
+        return {
+            'client_id': str(uuid.uuid4()),
+            'customer': self.customer.pk,
+            'created_at': self.CAPTURED_AT.isoformat(),
+            'lines': [[self.item.pk, 2, '20.00']],
+            'payments': [['cash', '40.00']],
+            **fields,
+        }
+
+    def upload(self, bundle):
+        return self.client.post(self.URL, bundle, content_type='application/json')
+
+    def test_reupload_is_acknowledged_as_duplicate(self):
+        bundle = {'orders': [self.order()]}
+        first = self.upload(bundle).json()
+        second = self.upload(bundle).json()
+        self.assertEqual(len(first['accepted']), 1)
+        self.assertEqual((second['accepted'], second['duplicates']), ([], first['accepted']))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_captured_timestamps_are_kept(self):
+        self.upload({'orders': [self.order()]})
+        order = Order.objects.get()
+        self.assertEqual((order.created_at, order.payment_date), (self.CAPTURED_AT, self.CAPTURED_AT))
+        self.assertTrue(order.is_paid)
+
+    def test_invalid_values_reject_only_that_order(self):
+        bad = self.order(lines=[[self.item.pk, 0, '20.00']])
+        ack = self.upload({'orders': [bad, self.order()]}).json()
+        self.assertEqual(ack['rejected'], [[bad['client_id'], 'Line quantity must be at least 1']])
+        self.assertEqual(len(ack['accepted']), 1)
+
+    def test_malformed_lines_refuse_the_bundle(self):
+        for lines in ([[self.item.pk, 2]], [{'item': self.item.pk}], 'lines'):
+            with self.subTest(lines=lines):
+                with self.assertRaises(BundleError):
+                    apply_bundle(self.cashier, {'orders': [self.order(), self.order(lines=lines)]})
+                self.assertEqual(self.upload({'orders': [self.order(lines=lines)]}).status_code, 400)
+        with self.assertRaises(BundleError):
+            apply_bundle(self.cashier, {'orders': [self.order(payments=[['cash']])]})
+        self.assertFalse(Order.objects.exists())
+
+    def test_oversized_gzip_bundle_is_refused(self):
+        body = gzip.compress(json.dumps({'orders': [self.order() for _ in range(20)]}).encode())
+        with mock.patch('features.views.MAX_SYNC_BUNDLE_BYTES', 1024):
+            response = self.client.post(self.URL, body, content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.client.post(self.URL, body, content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(len(response.json()['accepted']), 20)
+
+
+class CatalogChangesTest(TransactionTestCase):
+    URL = '/api/users/sync-catalog/'
+
+    def setUp(self):
+        rng = random.Random(19)
+        business, branches = synthetic.make_business(rng, 1)
+        self.cashier = synthetic.make_cashier(rng, business, branches[0])
+        self.items = [synthetic.make_items(rng, 1)[0] for _ in range(3)]
+
+    def item_ids(self, payload):
+        return sorted(row[0] for row in payload['items']['rows'])
+
+    def test_changes_committed_behind_an_open_transaction_are_held_back(self):
+        since = committed_catalog_version()
+        first, second, _ = self.items
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            # Takes its version now, commits later.
+            cursor.execute(
+                "UPDATE features_item SET mrp = 1, version = catalog_write_version() WHERE id = %s", [first.pk],
+            )
+        Item.objects.filter(pk=second.pk).update(mrp=2)
+
+        payload = catalog_changes(since, 100)
+        self.assertEqual(self.item_ids(payload), [])
+        self.assertEqual(payload['version'], since)
+
+        other.commit()
+        payload = catalog_changes(payload['version'], 100)
+        self.assertEqual(self.item_ids(payload), sorted([first.pk, second.pk]))
+        self.assertEqual(catalog_changes(payload['version'], 100)['items']['rows'], [])
+
+    def test_pages_do_not_split_a_transaction(self):
+        since = committed_catalog_version()
+        Item.objects.filter(pk__in=[item.pk for item in self.items[:2]]).update(mrp=3)
+        self.items[2].save()
+        Item.objects.filter(pk=self.items[2].pk).delete()
+
+        seen, deleted, more = [], [], True
+        while more:
+            payload = catalog_changes(since, 1)
+            seen.append(self.item_ids(payload))
+            deleted += payload['deleted']['items']
+            since, more = payload['version'], payload['more']
+        self.assertEqual(seen, [sorted(item.pk for item in self.items[:2]), []])
+        self.assertEqual(deleted, [self.items[2].pk])
+
+    def test_etag_follows_committed_changes(self):
+        self.client.force_login(self.cashier)
+        response = self.client.get(self.URL)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.items[0].save()
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CatalogSnapshotTest(TransactionTestCase):
+    URL = '/api/users/sync-catalog/snapshot/'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(CATALOG_SNAPSHOT_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        rng = random.Random(23)
+        business, branches = synthetic.make_business(rng, 1)
+        self.cashier = synthetic.make_cashier(rng, business, branches[0])
+        self.items = synthetic.make_items(rng, 2)
+        self.client.force_login(self.cashier)
+
+    def read(self, path):
+        with gzip.open(path, 'rt') as lines:
+            header, *rest = [json.loads(line) for line in lines]
+        tables, table = {}, None
+        for line in rest:
+            if isinstance(line, dict):
+                table = tables[line['table']] = []
+            else:
+                table.append(line)
+        return header, tables
+
+    def test_nothing_is_built_on_request(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '60')
+
+    def test_latest_snapshot_is_served(self):
+        version, path = build_snapshot()
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Catalog-Version'], str(version))
+        self.assertEqual(b''.join(response.streaming_content), path.read_bytes())
+
+    def test_snapshot_and_delta_cover_a_change_in_flight(self):
+        first, second = self.items
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute(
+                "UPDATE features_item SET item_name = 'Renamed', version = catalog_write_version() WHERE id = %s",
+                [first.pk],
+            )
+        Item.objects.filter(pk=second.pk).update(item_name='Committed')
+
+        version, path = build_snapshot()
+        header, tables = self.read(path)
+        self.assertEqual(header['version'], version)
+        names = {row[0]: row[1] for row in tables['items']}
+        self.assertEqual((names[first.pk], names[second.pk]), (first.item_name, 'Committed'))
+
+        other.commit()
+        delta = catalog_changes(version, 100)
+        self.assertIn(first.pk, self.item_ids(delta))
+
+    def test_rebuilt_only_when_the_catalog_changes(self):
+        _, path = build_snapshot()
+        self.assertEqual(build_snapshot()[1], path)
+        Tax.objects.create(name='GST 5', percentage=5)
+        _, rebuilt = build_snapshot()
+        self.assertNotEqual(rebuilt, path)
+        self.assertEqual([row[1] for row in self.read(rebuilt)[1]['taxes']], ['GST 5'])
+
+    def item_ids(self, payload):
+        return sorted(row[0] for row in payload['items']['rows'])
+
+
+class ConcurrentBundleTest(TransactionTestCase):
+    def setUp(self):
+        rng = random.Random(29)
+        business, branches = synthetic.make_business(rng, 1)
+        self.cashier = synthetic.make_cashier(rng, business, branches[0])
+        self.item = synthetic.make_items(rng, 1)[0]
+        self.customer = synthetic.make_customers(rng, branches[0], 1)[0]
+
+    def test_upload_racing_the_same_order_is_acknowledged_as_duplicate(self):
+        client_id = uuid.uuid4()
+        racing = Order.objects.create(customer=self.customer, status='closed')
+        # Another upload has stored the order but not committed yet.
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute("UPDATE features_order SET client_id = %s WHERE id = %s", [client_id, racing.pk])
+        other.inc_thread_sharing()
+        commit = threading.Timer(0.5, other.commit)
+        commit.start()
+        self.addCleanup(commit.join)
+
+        ack = apply_bundle(self.cashier, {'orders': [{
+            'client_id': str(client_id),
+            'customer': self.customer.pk,
+            'created_at': timezone.now().isoformat(),
+            'lines': [[self.item.pk, 1, '20.00']],
+            'payments': [['cash', '20.00']],
+        }]})
+        self.assertEqual((ack['accepted'], ack['duplicates']), ([], [[str(client_id), racing.pk]]))
+        self.assertEqual(Order.objects.filter(client_id=client_id).count(), 1)
+        self.assertFalse(Payment.objects.exists())
+
+
+class OrderBranchTest(TestCase):
+    URL = '/api/POS/orders/interaction/filter-by-status/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(3)
+        business, (cls.branch, cls.other) = synthetic.make_business(rng, 1, branches=2)
+        cls.cashier = synthetic.make_cashier(rng, business, cls.branch)
+        cls.customer = synthetic.make_customers(rng, cls.branch, 1)[0]
+        cls.stranger = synthetic.make_customers(rng, cls.other, 1)[0]
+        cls.open = Order.objects.create(customer=cls.customer, status='open')
+        cls.closed = Order.objects.create(customer=cls.customer, status='closed')
+        cls.elsewhere = Order.objects.create(customer=cls.stranger, status='open')
+
+    def test_branch_is_copied_from_the_customer(self):
+        self.assertEqual((self.open.branch, self.elsewhere.branch), (self.branch, self.other))
+
+    def listed(self, **params):
+        self.client.force_login(self.cashier)
+        return sorted(order['id'] for order in self.client.get(self.URL, params).json())
+
+    def test_filter_by_status_stays_in_the_users_branch(self):
+        self.assertEqual(self.listed(), sorted([self.open.pk, self.closed.pk]))
+        self.assertEqual(self.listed(status='open'), [self.open.pk])
+
+
+class OrderBranchMigrationTest(TransactionTestCase):
+    before = [('features', '0010_delete_company_alter_ristacard_linked_customer_and_more')]
+
+    def setUp(self):
+        rng = random.Random(7)
+        _, (self.branch, self.other) = synthetic.make_business(rng, 1, branches=2)
+        self.customers = synthetic.make_customers(rng, self.branch, 1) + synthetic.make_customers(rng, self.other, 1)
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+        self.old_order = executor.loader.project_state(self.before).apps.get_model('features', 'Order')
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_existing_orders_take_their_customers_branch(self):
+        ids = [self.old_order.objects.create(customer_id=customer.pk, status='closed').pk for customer in self.customers]
+        self.migrate_to_latest()
+        branches = dict(Order.objects.values_list('pk', 'branch_id'))
+        self.assertEqual(branches, {ids[0]: self.branch.pk, ids[1]: self.other.pk})
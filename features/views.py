@@ -3,20 +3,31 @@ from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
 from rest_framework import filters
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.db import transaction
 from django.http import HttpResponse
 from .models import *
 from .serializers import *
-import razorpay
-from django.conf import settings
+from .idempotency import idempotent
+from .offline_sync import BundleError, apply_bundle
+from .pricebook import price_map
+from .tax import apply_order_tax
+from cashflow.gateways import GatewayError, SignatureError, get_gateway
+from cashflow.models import Session, SessionClosed
+from cashflow.settlement import SettlementError, TenderAlreadyRecorded, outstanding_balance, settle
 
 import csv
+import json
 import logging
+import zlib
 from django.utils import timezone
 from decimal import Decimal
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on a decompressed offline order bundle.
+MAX_SYNC_BUNDLE_BYTES = 32 * 1024 * 1024
+
 
 #item management
 class ItemViewSet(viewsets.ModelViewSet):
@@ -157,17 +168,51 @@ class OrderInteractionViewSet(viewsets.ModelViewSet):
             return HoldOrderSerializer
         return super().get_serializer_class()
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(session=Session.open_for(self.request.user))
+
+    @action(detail=False, methods=['post'], url_path='sync', permission_classes=[IsAuthenticated])
+    def sync_offline(self, request):
+        """
+        Upload orders captured while offline (see ``features.offline_sync``).
+        The body may be sent gzip-compressed with ``Content-Encoding: gzip``.
+        """
+        if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                raw = inflater.decompress(request.body, MAX_SYNC_BUNDLE_BYTES)
+                if inflater.unconsumed_tail:
+                    return Response({'error': 'Bundle is too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                bundle = json.loads(raw)
+            except (zlib.error, ValueError):
+                return Response({'error': 'Bundle is not valid gzip-compressed JSON'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            bundle = request.data
+
+        try:
+            ack = apply_bundle(request.user, bundle)
+        except BundleError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({**ack, 'serverTime': timezone.now().isoformat()})
+
     @action(detail=False, methods=['get'], url_path='filter-by-status')
     def filter_by_status(self, request):
         status_param = request.query_params.get('status')
+        orders = self.get_queryset()
+        branch = getattr(request.user, 'branch', None)
+        if branch:
+            orders = orders.filter(branch=branch)
         if status_param:
-            orders = self.get_queryset().filter(status=status_param)
-        else:
-            orders = self.get_queryset()
+            orders = orders.filter(status=status_param)
         serializer = self.get_serializer(orders, many=True)
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def add_items(self, request, pk=None):
         """Add items to an order"""
         items_data = request.data.get('items')
@@ -191,6 +236,7 @@ class OrderInteractionViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
 
         order = self.get_object()
+        prices = price_map(order.branch)
         added_items = []
 
         for item_data in serializer.validated_data:
@@ -207,9 +253,10 @@ class OrderInteractionViewSet(viewsets.ModelViewSet):
                     order=order,
                     item=item,
                     quantity=item_data.get('quantity', 1),
-                    price=item.selling_price
+                    price=prices.price(item, order.channel_id)
                 )
                 added_items.append(order_item)
+        apply_order_tax([order.id])
 
         output_serializer = OrderItemDisplaySerializer(added_items, many=True)
         return Response({'added_items': output_serializer.data}, status=status.HTTP_201_CREATED)
@@ -239,6 +286,18 @@ class OrderInteractionViewSet(viewsets.ModelViewSet):
     def close(self, request, pk=None):
         """Close an order"""
         order = self.get_object()
+        if order.status != 'closed':
+            apply_order_tax([order.id])
+            order.refresh_from_db(fields=['tax_added'])
+            # Orders rung up before a session was opened, or in one that has
+            # since been closed, count towards the session that closes them.
+            if order.session_id is None or order.session.ended_at is not None:
+                order.session = Session.open_for(request.user)
+            if order.session_id:
+                try:
+                    Session.add_sale(order.session_id, order.total_price())
+                except SessionClosed:
+                    return Response({'error': 'The till session was closed; try again'}, status=status.HTTP_409_CONFLICT)
         order.status = 'closed'
         order.save()
         return Response({'message': 'Order closed successfully'})
@@ -248,7 +307,8 @@ class OrderInteractionViewSet(viewsets.ModelViewSet):
         """Generate printable receipt"""
         order = self.get_object()
         items = order.items.all()
-        
+        subtotal = sum((item.quantity * item.price for item in items), Decimal('0'))
+
         receipt_data = {
             'order_id': order.id,
             'date': order.created_at.strftime("%Y-%m-%d %H:%M"),
@@ -259,7 +319,11 @@ class OrderInteractionViewSet(viewsets.ModelViewSet):
                 'price': float(item.price),
                 'subtotal': float(item.quantity * item.price)
             } for item in items],
-            'total': float(sum(item.quantity * item.price for item in items)),
+            'subtotal': float(subtotal),
+            'discount': float(order.discount),
+            'tax_added': float(order.tax_added),
+            # Order.total_price(), from the lines already fetched.
+            'total': float(subtotal - order.discount + order.tax_added),
             'thank_you_message': "THANK YOU! PLEASE VISIT AGAIN!"
         }
         
@@ -291,6 +355,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
             return ManualPaymentSerializer
         if self.action == "upi_payment":
             return UPIPaymentSerializer
+        if self.action == "split_payment":
+            return SplitPaymentSerializer
         if self.action == "apply_discount":
             return ApplyDiscountSerializer 
         if self.action == "add_note":
@@ -300,6 +366,21 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
         # default: parent implementation
         return super().get_serializer_class()
+
+    def settle(self, order_id, tenders, message):
+        """Apply tenders through the settlement engine and report the balance."""
+        try:
+            order, result = settle(order_id, tenders, user=self.request.user)
+        except TenderAlreadyRecorded as e:
+            return Response({'message': str(e), 'is_paid': e.order.is_paid})
+        except Order.DoesNotExist:
+            return Response({"error": "Order not found or already paid"}, status=status.HTTP_404_NOT_FOUND)
+        except SettlementError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not order.is_paid:
+            message = f"{message}; {result['outstanding']} outstanding"
+        return Response({'message': message, **result})
+
     @action(detail=True, methods=['get'])
     def summary(self, request, pk=None):
         """Get order summary for payment screen"""
@@ -318,6 +399,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
             order_item = OrderItem.objects.get(order=order, item__id=item_id)
             order_item.quantity = quantity
             order_item.save()
+            apply_order_tax([order.id])
             return Response({'status': 'Item updated'})
         except OrderItem.DoesNotExist:
             return Response({'error': 'Item not found in order'}, status=404)
@@ -343,108 +425,112 @@ class PaymentViewSet(viewsets.ModelViewSet):
         try:
             order_id = serializer.validated_data['order_id']
             order = Order.objects.get(id=order_id, is_paid=False)
-            amount = int(order.total_price() * 100)  # Razorpay expects amount in paise
-            
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-            razorpay_order = client.order.create({
-                "amount": amount,
-                "currency": "INR",
-                "payment_capture": "1"
-            })
+            amount = int(outstanding_balance(order) * 100)  # Razorpay expects amount in paise
+
+            gateway = get_gateway()
+            razorpay_order = gateway.create_order(amount, currency="INR", receipt=order.id)
+            # Remembered so the payment webhook can find the order.
+            Order.objects.filter(pk=order.pk).update(gateway_order_id=razorpay_order['id'])
 
             return Response({
                 "razorpay_order_id": razorpay_order['id'],
-                "razorpay_key": settings.RAZORPAY_KEY_ID,
+                "razorpay_key": gateway.key_id,
                 "amount": amount / 100,
                 "currency": "INR"
             })
+        except GatewayError as e:
+            return Response({"error": f"Payment gateway unavailable: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
         except Order.DoesNotExist:
             return Response({"error": "Order not found or already paid"}, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=False, methods=['post'], url_path='verify-razorpay')
+    @idempotent
     def verify_razorpay(self, request):
         serializer = RazorpayPaymentVerifySerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
         
         try:
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-            client.utility.verify_payment_signature({
-                'razorpay_order_id': data['razorpay_order_id'],
-                'razorpay_payment_id': data['razorpay_payment_id'],
-                'razorpay_signature': data['razorpay_signature']
-            })
-
-            order = Order.objects.get(id=data['order_id'])
-            order.is_paid = True
-            order.payment_mode = 'razorpay'
-            order.payment_reference = data['razorpay_payment_id']
-            order.payment_date = timezone.now()
-            order.amount_paid = order.total_price()
-            order.save()
-            
-            return Response({'message': 'Razorpay payment successful'})
-        except razorpay.errors.SignatureVerificationError:
+            get_gateway().verify_payment(
+                data['razorpay_order_id'], data['razorpay_payment_id'], data['razorpay_signature']
+            )
+        except SignatureError:
             return Response({'error': 'Signature verification failed'}, status=status.HTTP_400_BAD_REQUEST)
-        except Order.DoesNotExist:
-            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        # The gateway captured the balance quoted by initiate_razorpay. If the
+        # payment webhook recorded the capture first, settle says so.
+        return self.settle(data['order_id'], [{
+            'mode': 'razorpay',
+            'amount': None,
+            'reference': data['razorpay_payment_id'],
+        }], 'Razorpay payment successful')
 
     # Manual Payments (Cash/Card)
     @action(detail=False, methods=['post'], url_path='manual-payment')
+    @idempotent
     def manual_payment(self, request):
         serializer = ManualPaymentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        
-        try:
-            order = Order.objects.get(id=serializer.validated_data['order_id'], is_paid=False)
-            order.is_paid = True
-            order.payment_mode = serializer.validated_data['mode']
-            order.payment_reference = serializer.validated_data.get('reference', '')
-            order.payment_date = timezone.now()
-            order.amount_paid = serializer.validated_data['amount_received']
-            order.save()
-            
-            return Response({'message': f'{serializer.validated_data["mode"].capitalize()} payment successful'})
-        except Order.DoesNotExist:
-            return Response({"error": "Order not found or already paid"}, status=status.HTTP_404_NOT_FOUND)
+        data = serializer.validated_data
+        return self.settle(data['order_id'], [{
+            'mode': data['mode'],
+            'amount': data['amount_received'],
+            'reference': data.get('reference', ''),
+        }], f'{data["mode"].capitalize()} payment successful')
 
     # UPI Payment
     @action(detail=False, methods=['post'], url_path='upi-payment')
+    @idempotent
     def upi_payment(self, request):
         serializer = UPIPaymentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        
-        try:
-            order = Order.objects.get(id=serializer.validated_data['order_id'], is_paid=False)
-            
-            
-            order.is_paid = True
-            order.payment_mode = 'upi'
-            order.payment_reference = serializer.validated_data['upi_id']
-            order.payment_date = timezone.now()
-            order.amount_paid = serializer.validated_data['amount']
-            order.save()
-            
-            return Response({'message': 'UPI payment successful'})
-        except Order.DoesNotExist:
-            return Response({"error": "Order not found or already paid"}, status=status.HTTP_404_NOT_FOUND)
+        data = serializer.validated_data
+        return self.settle(data['order_id'], [{
+            'mode': 'upi',
+            'amount': data['amount'],
+            'reference': data['upi_id'],
+        }], 'UPI payment successful')
+
+    # Split Payments
+    @action(detail=False, methods=['post'], url_path='split-payment')
+    @idempotent
+    def split_payment(self, request):
+        """Apply several tenders (e.g. part cash, part card) in one call."""
+        serializer = SplitPaymentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return self.settle(data['order_id'], data['tenders'], 'Split payment successful')
 
     # Apply Discount
     @action(detail=True, methods=['post'], url_path='apply-discount')
     def apply_discount(self, request, pk=None):
+        """
+        Add a manual discount to the order. It adds to any coupon or
+        loyalty discount already on the order rather than replacing it.
+        """
         serializer = ApplyDiscountSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         discount = serializer.validated_data['discount']
 
         try:
-            order = Order.objects.get(pk=pk, is_paid=False)
-            if discount > order.total_price():
-                return Response({"error": "Discount cannot be more than total amount"}, 
-                                status=status.HTTP_400_BAD_REQUEST)
-            
-            order.discount = discount
-            order.save()
-            return Response({'message': f'Discount of {discount} applied successfully'})
+            with transaction.atomic():
+                # Locked like coupon and loyalty redemptions, which also add
+                # to the discount.
+                order = Order.objects.select_for_update().get(pk=pk, is_paid=False)
+                if discount > order.total_price() - order.tax_added:
+                    return Response({"error": "Discount cannot be more than total amount"}, 
+                                    status=status.HTTP_400_BAD_REQUEST)
+                if order.amount_paid and discount > order.total_price() - order.amount_paid:
+                    return Response({"error": "Discount cannot exceed the balance left after earlier tenders"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+
+                order.discount += discount
+                order.save(update_fields=['discount'])
+                apply_order_tax([order.id])
+            return Response({
+                'message': f'Discount of {discount} applied successfully',
+                'discount': str(order.discount),
+            })
         except Order.DoesNotExist:
             return Response({"error": "Order not found or already paid"}, status=status.HTTP_404_NOT_FOUND)
 
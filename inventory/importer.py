@@ -0,0 +1,188 @@
+"""
+Bulk import of inventory items from CSV or JSON Lines.
+
+Each record has the ``ItemSerializer`` field names. In CSV the list fields
+(``variants``, ``taxes``, ``optionSets``, ``menus``, ``tags``) hold ``|``
+separated values; in JSON Lines they are arrays. Variants, taxes and option
+sets are referenced by name, as in the item API.
+
+Records are applied in chunks. Each chunk resolves every name it references
+with one query per related model, upserts its items by ``skuCode`` with one
+``bulk_create`` and replaces their relations with one delete and one insert
+per through table. A record with a missing field, a value the model would
+not accept (too long, negative, too many digits) or an unknown name is
+rejected on its own; the rest of the import goes ahead.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .models import Item, ItemOptionSet, ItemVariant, Tax
+
+
+MAX_ROWS = 50000
+CHUNK_SIZE = 1000
+LIST_FIELDS = ['variants', 'taxes', 'optionSets', 'menus', 'tags']
+TEXT_FIELDS = ['shortName', 'longName', 'description', 'skuCode', 'barCode', 'groupSKUCode', 'measuringUnit', 'category']
+# Relation field -> model whose ``name`` the import refers to.
+RELATIONS = {'variants': ItemVariant, 'taxes': Tax, 'optionSets': ItemOptionSet}
+UPDATE_FIELDS = [
+    'shortName', 'longName', 'description', 'barCode', 'groupSKUCode', 'measuringUnit', 'category',
+    'menus', 'tags', 'priceIncludesTax', 'price', 'displayOrder', 'categoryDisplayOrder',
+    'version', 'updated_at',
+]
+
+
+class ImportFormatError(ValueError):
+    """The upload cannot be read at all; nothing was imported."""
+
+
+def read_records(data, content_type):
+    """Decode an upload into a list of dicts, by ``content_type``."""
+    try:
+        text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    except UnicodeDecodeError:
+        raise ImportFormatError("Upload must be UTF-8 encoded")
+    if 'csv' in content_type:
+        records = []
+        for record in csv.DictReader(io.StringIO(text)):
+            for field in LIST_FIELDS:
+                if field in record:
+                    record[field] = [value.strip() for value in (record[field] or '').split('|') if value.strip()]
+            records.append(record)
+    elif 'json' in content_type:
+        try:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError as e:
+            raise ImportFormatError(f"Invalid JSON line: {e}")
+        if not all(isinstance(record, dict) for record in records):
+            raise ImportFormatError("Every JSON line must be an object")
+    else:
+        raise ImportFormatError("Send text/csv or application/x-ndjson")
+    if len(records) > MAX_ROWS:
+        raise ImportFormatError(f"At most {MAX_ROWS} items per import")
+    return records
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in {'1', 'true', 'yes', 'y'}
+
+
+def _parse(record):
+    """Normalise one record; raises ValueError for unusable ones."""
+    item = {field: (str(record[field]).strip() or None) if record.get(field) is not None else None for field in TEXT_FIELDS}
+    if not item['shortName'] or not item['skuCode']:
+        raise ValueError("shortName and skuCode are required")
+    try:
+        item['price'] = Decimal(str(record.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid price {record.get('price')!r}")
+    item['priceIncludesTax'] = _flag(record.get('priceIncludesTax'))
+    for field in ('displayOrder', 'categoryDisplayOrder'):
+        item[field] = int(record.get(field) or 0)
+    for field in LIST_FIELDS:
+        values = record.get(field) or []
+        if not isinstance(values, list):
+            raise ValueError(f"{field} must be a list")
+        item[field] = [str(value) for value in values]
+    try:
+        Item(**{key: value for key, value in item.items() if key not in RELATIONS}).clean_fields(
+            exclude=['version', 'updated_at'],
+        )
+    except ValidationError as e:
+        raise ValueError('; '.join(f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items()))
+    return item
+
+
+def _resolve_names(items):
+    """``{relation: {name: id}}`` for every name used in ``items``, one query per model."""
+    resolved = {}
+    for field, model in RELATIONS.items():
+        names = {name for item in items for name in item[field]}
+        ids = {}
+        # Tax and variant names are not unique; the oldest row wins.
+        for pk, name in model.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            ids[name] = pk
+        resolved[field] = ids
+    return resolved
+
+
+def _replace_links(field, ids, pairs):
+    """
+    Replace the through rows of ``field`` for items ``ids`` with ``pairs``.
+    Inserting from arrays skips building a model instance per link, which
+    is most of the cost of ``bulk_create`` on a through table.
+    """
+    through = field.remote_field.through
+    source, target = field.m2m_column_name(), field.m2m_reverse_name()
+    through.objects.filter(**{f'{source}__in': ids}).delete()
+    if pairs:
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(through._meta.db_table)} ({quote(source)}, {quote(target)}) "
+                "SELECT * FROM unnest(%s::bigint[], %s::bigint[])",
+                [[pair[0] for pair in pairs], [pair[1] for pair in pairs]],
+            )
+
+
+def _apply_chunk(chunk, rejected):
+    resolved = _resolve_names([item for _, item in chunk])
+    valid = []
+    for line, item in chunk:
+        missing = [f"{field} {name!r}" for field in RELATIONS for name in item[field] if name not in resolved[field]]
+        if missing:
+            rejected.append([line, f"Unknown {', '.join(missing)}"])
+        else:
+            valid.append(item)
+    if not valid:
+        return 0, 0
+
+    existing = set(Item.objects.filter(skuCode__in=[item['skuCode'] for item in valid]).values_list('skuCode', flat=True))
+    objects = Item.objects.bulk_create(
+        [Item(**{key: value for key, value in item.items() if key not in RELATIONS}) for item in valid],
+        update_conflicts=True, unique_fields=['skuCode'], update_fields=UPDATE_FIELDS,
+    )
+    ids = [obj.pk for obj in objects]
+    for field in RELATIONS:
+        pairs = [
+            (obj.pk, resolved[field][name])
+            for obj, item in zip(objects, valid) for name in dict.fromkeys(item[field])
+        ]
+        _replace_links(Item._meta.get_field(field), ids, pairs)
+    updated = sum(1 for item in valid if item['skuCode'] in existing)
+    return len(valid) - updated, updated
+
+
+def import_items(records):
+    """
+    Create or update (by ``skuCode``) inventory items from parsed records.
+    Returns ``{"created": n, "updated": n, "rejected": [[line, reason], ...]}``
+    where ``line`` is the 1-based record number.
+    """
+    rejected = []
+    parsed = {}
+    for line, record in enumerate(records, start=1):
+        try:
+            item = _parse(record)
+        except (TypeError, ValueError) as e:
+            rejected.append([line, str(e)])
+            continue
+        # A repeated skuCode is applied once, last record wins.
+        parsed[item['skuCode']] = (line, item)
+
+    created = updated = 0
+    entries = sorted(parsed.values(), key=lambda entry: entry[0])
+    with transaction.atomic():
+        for start in range(0, len(entries), CHUNK_SIZE):
+            chunk_created, chunk_updated = _apply_chunk(entries[start:start + CHUNK_SIZE], rejected)
+            created += chunk_created
+            updated += chunk_updated
+    rejected.sort()
+    return {'created': created, 'updated': updated, 'rejected': rejected}
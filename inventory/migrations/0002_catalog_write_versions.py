@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:05
+
+import features.catalog
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        # Creates the catalog_write_version() function used below.
+        ('features', '0019_catalog_write_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='version',
+            field=models.BigIntegerField(db_default=features.catalog.CatalogWriteVersion(), db_index=True, editable=False),
+        ),
+    ]
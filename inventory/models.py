@@ -1,7 +1,9 @@
 from django.db import models
 
+from features.catalog import CatalogLookupModel, CatalogModel
 
-class Tax(models.Model):
+
+class Tax(CatalogLookupModel):
     name = models.CharField(max_length=100)
     percentage = models.DecimalField(max_digits=5, decimal_places=2)
 
@@ -9,7 +11,7 @@ class Tax(models.Model):
         return f"{self.name} ({self.percentage}%)"
 
 
-class ItemVariant(models.Model):
+class ItemVariant(CatalogLookupModel):
     name = models.CharField(max_length=100)
     value = models.CharField(max_length=100)
 
@@ -17,7 +19,7 @@ class ItemVariant(models.Model):
         return f"{self.name}: {self.value}"
 
 
-class ItemOptionSet(models.Model):
+class ItemOptionSet(CatalogLookupModel):
     name = models.CharField(max_length=100, unique=True)  # e.g., "Item Toppings"
     label = models.CharField(max_length=100, blank=True, null=True)
     min = models.PositiveIntegerField(default=0)
@@ -27,7 +29,7 @@ class ItemOptionSet(models.Model):
         return self.label or self.name
 
 
-class ItemOptionSetOption(models.Model):
+class ItemOptionSetOption(CatalogLookupModel):
     option_set = models.ForeignKey(ItemOptionSet, related_name='options', on_delete=models.CASCADE)
     option_id = models.CharField(max_length=100, unique=True)  # "id*" field
     name = models.CharField(max_length=100)  # e.g., "Cheese"
@@ -42,7 +44,7 @@ class ItemOptionSetOption(models.Model):
         return self.name
 
 
-class Item(models.Model):
+class Item(CatalogModel):
     shortName = models.CharField(max_length=100)
     longName = models.CharField(max_length=255, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
@@ -1,4 +1,7 @@
+from django.db import transaction
 from rest_framework import serializers
+
+from features.catalog import next_catalog_version
 from .models import (
     Item, ItemVariant, Tax,
     ItemOptionSet, ItemOptionSetOption
@@ -20,36 +23,95 @@ class ItemOptionSetOptionSerializer(serializers.ModelSerializer):
         model = ItemOptionSetOption
         exclude = ['option_set']  
 
+class NestedOptionSerializer(ItemOptionSetOptionSerializer):
+    """
+    Options inside an option set payload. ``option_id`` uniqueness is checked
+    once for the whole set in ``ItemOptionSetSerializer`` instead of one query
+    per option, and so that an update can resend the options it already has.
+    """
+    class Meta(ItemOptionSetOptionSerializer.Meta):
+        extra_kwargs = {'option_id': {'validators': []}}
+
+
 class ItemOptionSetSerializer(serializers.ModelSerializer):
-    options = ItemOptionSetOptionSerializer(many=True)
+    options = NestedOptionSerializer(many=True)
 
     class Meta:
         model = ItemOptionSet
         fields = ['id', 'name', 'label', 'min', 'max', 'options']
-        
 
+    def validate_options(self, options):
+        option_ids = [option['option_id'] for option in options]
+        duplicates = sorted({option_id for option_id in option_ids if option_ids.count(option_id) > 1})
+        if duplicates:
+            raise serializers.ValidationError(f"Duplicate option ids: {', '.join(duplicates)}")
+        taken = ItemOptionSetOption.objects.filter(option_id__in=option_ids)
+        if self.instance is not None:
+            taken = taken.exclude(option_set=self.instance)
+        taken = sorted(taken.values_list('option_id', flat=True))
+        if taken:
+            raise serializers.ValidationError(f"Option ids used by another option set: {', '.join(taken)}")
+        return options
+
+    @transaction.atomic
     def create(self, validated_data):
         options_data = validated_data.pop('options')
         option_set = ItemOptionSet.objects.create(**validated_data)
-        for option in options_data:
-            ItemOptionSetOption.objects.create(option_set=option_set, **option)
+        ItemOptionSetOption.objects.bulk_create(
+            [ItemOptionSetOption(option_set=option_set, **option) for option in options_data]
+        )
         return option_set
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         options_data = validated_data.pop('options', [])
-        
+
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
 
         if options_data:
-            # Clear and recreate options
-            instance.options.all().delete()
-            for option in options_data:
-                ItemOptionSetOption.objects.create(option_set=instance, **option)
+            self.merge_options(instance, options_data)
 
         return instance
-    
+
+    def merge_options(self, option_set, options_data):
+        """
+        Make ``option_set``'s options match ``options_data``, matched on
+        ``option_id``: changed rows are updated, new ones inserted and
+        missing ones deleted, one statement each. Unchanged rows keep their
+        primary keys and are not written.
+        """
+        existing = {option.option_id: option for option in option_set.options.all()}
+        incoming = {option['option_id']: option for option in options_data}
+
+        changed, fields = [], set()
+        for option_id, data in incoming.items():
+            option = existing.get(option_id)
+            if option is None:
+                continue
+            dirty = {attr for attr, value in data.items() if getattr(option, attr) != value}
+            if dirty:
+                for attr in dirty:
+                    setattr(option, attr, data[attr])
+                changed.append(option)
+                fields |= dirty
+        added = [
+            ItemOptionSetOption(option_set=option_set, **data)
+            for option_id, data in incoming.items() if option_id not in existing
+        ]
+        removed = [option.pk for option_id, option in existing.items() if option_id not in incoming]
+
+        if removed:
+            ItemOptionSetOption.objects.filter(pk__in=removed).delete()
+        if changed:
+            ItemOptionSetOption.objects.bulk_update(changed, sorted(fields))
+        if added:
+            ItemOptionSetOption.objects.bulk_create(added)
+        if removed or changed or added:
+            # Bulk writes skip the model's save(), which moves the catalog on.
+            next_catalog_version()
+
 class ItemSerializer(serializers.ModelSerializer):
     variants = serializers.SlugRelatedField(
         slug_field='name',
@@ -1,3 +1,207 @@
+import json
+import random
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from backend import synthetic
+from features.catalog import current_catalog_version
+from inventory.models import Item, ItemOptionSet, ItemOptionSetOption, ItemVariant, Tax
+
+
+class ItemListQueryBudgetTest(TestCase):
+    # Session + user lookups, catalog version, count + page and one
+    # prefetch per many-to-many.
+    QUERY_BUDGET = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(41)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.taxes = Tax.objects.bulk_create([Tax(name=f"GST {rate}", percentage=rate) for rate in (5, 12, 18)])
+        cls.variants = ItemVariant.objects.bulk_create([ItemVariant(name=size, value=size) for size in 'SML'])
+        cls.option_sets = ItemOptionSet.objects.bulk_create([ItemOptionSet(name=f"Options {n}") for n in range(3)])
+
+    def add_items(self, count):
+        start = Item.objects.count()
+        items = Item.objects.bulk_create([
+            Item(shortName=f"Item {n}", skuCode=f"SKU{n:05d}", price=Decimal('10.00'))
+            for n in range(start, start + count)
+        ])
+        for n, item in enumerate(items):
+            item.taxes.add(self.taxes[n % 3])
+            item.variants.add(*self.variants[:n % 3 + 1])
+            item.optionSets.add(self.option_sets[n % 3])
+        return items
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.cashier)
+
+    def list_items(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/inventory/items/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_query_count_does_not_grow_with_items(self):
+        self.add_items(5)
+        _, small = self.list_items()
+        self.add_items(95)
+        data, large = self.list_items()
+        self.assertEqual(len(data['results']), 100)
+        self.assertEqual(large, small)
+        self.assertLessEqual(large, self.QUERY_BUDGET)
+
+    def test_related_names_are_rendered(self):
+        self.add_items(3)
+        data, _ = self.list_items()
+        first = data['results'][0]
+        self.assertEqual(first['taxes'], ['GST 5'])
+        self.assertEqual(first['variants'], ['S'])
+        self.assertEqual(first['optionSets'], ['Options 0'])
+
+    def test_cached_list_is_invalidated_by_writes(self):
+        self.add_items(3)
+        data, _ = self.list_items()
+        etag = self.client.get('/api/inventory/items/')['ETag']
+        self.assertEqual(self.client.get('/api/inventory/items/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        item_id = data['results'][0]['id']
+        response = self.client.patch(f'/api/inventory/items/{item_id}/', {'price': '12.00'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/inventory/items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['price'], '12.00')
+
+
+class ItemImportTest(TestCase):
+    URL = '/api/inventory/items/import/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(43)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+        cls.taxes = Tax.objects.bulk_create([Tax(name=f"GST {rate}", percentage=rate) for rate in (5, 18)])
+        cls.variants = ItemVariant.objects.bulk_create([ItemVariant(name=size, value=size) for size in 'SM'])
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+
+    def upload_csv(self, text):
+        response = self.client.generic('POST', self.URL, text.encode(), content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def upload_jsonl(self, records):
+        body = '\n'.join(json.dumps(record) for record in records).encode()
+        response = self.client.generic('POST', self.URL, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_csv_creates_items_with_relations(self):
+        result = self.upload_csv(
+            "shortName,skuCode,price,taxes,variants,tags\n"
+            "Tea,SKU1,20,GST 5,S|M,hot|drink\n"
+            "Coffee,SKU2,35.5,GST 18,,\n"
+        )
+        self.assertEqual(result, {'created': 2, 'updated': 0, 'rejected': []})
+        tea = Item.objects.get(skuCode='SKU1')
+        self.assertEqual((tea.price, tea.tags), (Decimal('20.00'), ['hot', 'drink']))
+        self.assertEqual(sorted(tea.variants.values_list('name', flat=True)), ['M', 'S'])
+        self.assertEqual(list(tea.taxes.values_list('name', flat=True)), ['GST 5'])
+
+    def test_jsonl_upserts_and_replaces_relations(self):
+        self.upload_jsonl([{'shortName': 'Tea', 'skuCode': 'SKU1', 'price': '20', 'taxes': ['GST 5'], 'variants': ['S']}])
+        result = self.upload_jsonl([
+            {'shortName': 'Masala Tea', 'skuCode': 'SKU1', 'price': '25', 'taxes': ['GST 18'], 'variants': []},
+            {'shortName': 'Coffee', 'skuCode': 'SKU2', 'price': '35'},
+        ])
+        self.assertEqual(result, {'created': 1, 'updated': 1, 'rejected': []})
+        tea = Item.objects.get(skuCode='SKU1')
+        self.assertEqual((tea.shortName, tea.price), ('Masala Tea', Decimal('25.00')))
+        self.assertEqual(list(tea.taxes.values_list('name', flat=True)), ['GST 18'])
+        self.assertFalse(tea.variants.exists())
+
+    def test_invalid_records_are_rejected_on_their_own(self):
+        result = self.upload_jsonl([
+            {'shortName': 'Tea', 'skuCode': 'SKU1', 'price': '20'},
+            {'shortName': 'x' * 101, 'skuCode': 'SKU2', 'price': '20'},
+            {'shortName': 'Cake', 'skuCode': 'SKU3', 'price': '20', 'displayOrder': -1},
+            {'shortName': 'Gold', 'skuCode': 'SKU4', 'price': '123456789.00'},
+            {'shortName': 'Soup', 'skuCode': 'SKU5', 'price': 'free'},
+            {'shortName': 'Juice', 'skuCode': 'SKU6', 'price': '20', 'taxes': ['VAT']},
+            {'skuCode': 'SKU7', 'price': '20'},
+        ])
+        self.assertEqual(result['created'], 1)
+        self.assertEqual([line for line, _ in result['rejected']], [2, 3, 4, 5, 6, 7])
+        reasons = dict(result['rejected'])
+        self.assertIn('shortName', reasons[2])
+        self.assertIn('displayOrder', reasons[3])
+        self.assertIn('price', reasons[4])
+        self.assertEqual(reasons[6], "Unknown taxes 'VAT'")
+        self.assertEqual(list(Item.objects.values_list('skuCode', flat=True)), ['SKU1'])
+
+    def test_unreadable_upload_is_refused(self):
+        response = self.client.generic('POST', self.URL, b'{"shortName": ', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+
+class OptionSetMergeTest(TestCase):
+    URL = '/api/inventory/option-sets/'
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(43)
+        business, branches = synthetic.make_business(rng, 1)
+        cls.cashier = synthetic.make_cashier(rng, business, branches[0])
+
+    def setUp(self):
+        self.client.force_login(self.cashier)
+        response = self.client.post(self.URL, {
+            'name': 'Toppings', 'label': 'Toppings', 'min': 0, 'max': 2,
+            'options': [self.option('cheese', '20.00'), self.option('olives', '15.00'), self.option('onion', '10.00')],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.option_set = ItemOptionSet.objects.get(pk=response.json()['id'])
+        self.pks = dict(self.option_set.options.values_list('option_id', 'pk'))
+
+    @staticmethod
+    def option(option_id, price):
+        return {'option_id': option_id, 'name': option_id.title(), 'skuCode': option_id.upper(), 'price': price}
+
+    def update(self, options):
+        return self.client.patch(f'{self.URL}{self.option_set.pk}/', {'options': options}, content_type='application/json')
+
+    def test_options_are_merged_by_option_id(self):
+        version = current_catalog_version()
+        response = self.update([self.option('cheese', '25.00'), self.option('olives', '15.00'), self.option('jalapeno', '12.00')])
+        self.assertEqual(response.status_code, 200)
+
+        options = {option.option_id: option for option in self.option_set.options.all()}
+        self.assertEqual(sorted(options), ['cheese', 'jalapeno', 'olives'])
+        # Updated and unchanged rows keep their primary keys; the missing one is gone.
+        self.assertEqual((options['cheese'].pk, options['cheese'].price), (self.pks['cheese'], Decimal('25.00')))
+        self.assertEqual((options['olives'].pk, options['olives'].price), (self.pks['olives'], Decimal('15.00')))
+        self.assertFalse(ItemOptionSetOption.objects.filter(pk=self.pks['onion']).exists())
+        self.assertGreater(current_catalog_version(), version)
+
+    def test_unchanged_options_are_not_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.update([self.option('cheese', '20.00'), self.option('olives', '15.00'), self.option('onion', '10.00')])
+        self.assertEqual(response.status_code, 200)
+        writes = [q['sql'] for q in queries if 'inventory_itemoptionsetoption' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
 
-# Create your tests here.
+    def test_option_ids_of_other_sets_are_refused(self):
+        other = ItemOptionSet.objects.create(name='Sauces')
+        ItemOptionSetOption.objects.create(option_set=other, **self.option('mayo', '5.00'))
+        response = self.update([self.option('mayo', '5.00')])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('mayo', json.dumps(response.json()))
+        self.assertEqual(set(self.option_set.options.values_list('option_id', flat=True)), set(self.pks))
@@ -1,4 +1,18 @@
-from rest_framework import viewsets
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from features.catalog import current_catalog_version, touch_catalog
+
+from .importer import ImportFormatError, import_items, read_records
 from .models import (
     Item, ItemVariant, Tax,
     ItemOptionSet, ItemOptionSetOption
@@ -9,23 +23,111 @@ from .serializers import (
 )
 
 
-class ItemViewSet(viewsets.ModelViewSet):
-    queryset = Item.objects.all().order_by('id')
+class CachedCatalogViewSet(viewsets.ModelViewSet):
+    """
+    Catalog viewset whose list and detail responses are cached per catalog
+    version, so any catalog write invalidates them. Responses carry a weak
+    ETag of the version and the time it was first served as Last-Modified,
+    and conditional requests for an unchanged catalog get 304.
+    """
+    permission_classes = [IsAuthenticated]
+    cache_timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, view, *args, **kwargs):
+        version = current_catalog_version()
+        etag = f'W/"catalog-{version}"'
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f"inventory:{self.basename}:{version}:{path}"
+
+        cached = cache.get(key)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = (response.data, datetime.now(timezone.utc).timestamp())
+            cache.set(key, cached, self.cache_timeout)
+        data, modified = cached
+
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', '') or (
+                'HTTP_IF_NONE_MATCH' not in request.META and since is not None and int(modified) <= since):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        touch_catalog()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        touch_catalog()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        touch_catalog()
+
+
+class ItemPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class ItemViewSet(CachedCatalogViewSet):
+    # The serializer renders every many-to-many by name; prefetching them
+    # keeps a page at a fixed number of queries whatever its size.
+    queryset = Item.objects.prefetch_related('variants', 'taxes', 'optionSets').order_by('id')
     serializer_class = ItemSerializer
+    pagination_class = ItemPagination
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Create or update many items at once (see ``inventory.importer``).
+        Send the CSV or JSON Lines as the request body with a matching
+        Content-Type, or as a ``file`` upload.
+        """
+        upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+        if upload is not None:
+            data, content_type = upload.read(), upload.content_type or ''
+            if upload.name.lower().endswith('.csv'):
+                content_type = 'text/csv'
+            elif upload.name.lower().endswith(('.jsonl', '.ndjson')):
+                content_type = 'application/x-ndjson'
+        else:
+            data, content_type = request.body, request.content_type or ''
+        try:
+            records = read_records(data, content_type)
+        except ImportFormatError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        result = import_items(records)
+        touch_catalog()
+        return Response(result)
 
 
-class ItemVariantViewSet(viewsets.ModelViewSet):
+class ItemVariantViewSet(CachedCatalogViewSet):
     queryset = ItemVariant.objects.all().order_by('id')
     serializer_class = ItemVariantSerializer
 
 
-class TaxViewSet(viewsets.ModelViewSet):
+class TaxViewSet(CachedCatalogViewSet):
     queryset = Tax.objects.all().order_by('id')
     serializer_class = TaxSerializer
 
 
-class ItemOptionSetViewSet(viewsets.ModelViewSet):
-    queryset = ItemOptionSet.objects.all().order_by('id')
+class ItemOptionSetViewSet(CachedCatalogViewSet):
+    queryset = ItemOptionSet.objects.prefetch_related('options').order_by('id')
     serializer_class = ItemOptionSetSerializer
 
 
@@ -186,6 +186,12 @@ class UserIDTokenObtainPairSerializer(TokenObtainPairSerializer):
         required=True,
         help_text="User's unique ID (format: branchid_username)"
     )
+    device_key = serializers.CharField(
+        max_length=20,
+        write_only=True,
+        required=True,
+        help_text="Device registration key issued to the user"
+    )
     pin = serializers.CharField(
         max_length=10,
         write_only=True,
@@ -1,5 +1,8 @@
+import gzip
+import json
 import logging
 import random
+import re
 import string
 from rest_framework.views import APIView
 from rest_framework.decorators import action
@@ -7,10 +10,14 @@ from rest_framework.response import Response
 from rest_framework import mixins, status, viewsets
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from .email_utils import send_new_pin_email, send_request_registration_key_email
 
+from features.catalog import catalog_changes, committed_catalog_version
+from features.snapshot import latest_snapshot
 from .models import User
 from .serializers import AccountSerializer, ChangePinSerializer, DeviceVerificationSerializer, ForgotPinSerializer, GoOfflineSerializer, ResetDeviceSerializer, UserIDTokenObtainPairSerializer, UserCreateSerializer, UserSerializer, generate_key
 from .permissions import IsFirstUserOrAdmin
@@ -19,6 +26,46 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from django.db import transaction
 logger = logging.getLogger(__name__)
 
+CATALOG_SYNC_LIMIT = 5000
+CATALOG_SYNC_MAX_LIMIT = 20000
+
+
+def _ranged_file_response(request, path, etag):
+    """
+    Serve ``path`` whole, or the single byte range asked for with ``Range``
+    as long as ``If-Range`` (when sent) still matches ``etag``.
+    """
+    size = path.stat().st_size
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', request.META.get('HTTP_RANGE', '').strip())
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not match or not any(match.groups()) or (if_range and if_range != etag):
+        return FileResponse(path.open('rb'), content_type='application/gzip')
+
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(0, size - int(last)), size - 1
+    if start >= size or start > end:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    def chunks(length=end - start + 1, block=64 * 1024):
+        with path.open('rb') as snapshot:
+            snapshot.seek(start)
+            while length > 0:
+                data = snapshot.read(min(block, length))
+                if not data:
+                    break
+                length -= len(data)
+                yield data
+
+    response = StreamingHttpResponse(chunks(), status=status.HTTP_206_PARTIAL_CONTENT, content_type='application/gzip')
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
 
 def generate_pin(length=4):
     return ''.join(random.choices(string.digits, k=length))
@@ -266,10 +313,71 @@ class UserViewSet(
         logger.info(f"Test notification sent to user {request.user}.")
         return Response({"message": "Test notification sent successfully."}, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=['get'], url_path='sync-catalog')
+    @action(detail=False, methods=['get'], url_path='sync-catalog', permission_classes=[IsAuthenticated])
     def synchronize_catalog(self, request):
-        logger.info(f"Catalog synchronization requested by user {request.user}.")
-        return Response({"message": "Catalog synchronization initiated."}, status=status.HTTP_200_OK)
+        """
+        Catalog changes since the device's last sync.
+
+        Query params: ``since`` (the ``version`` from the previous response,
+        0 for a full download) and ``limit`` (rows per table, default 5000).
+        While ``more`` is true the device calls again with the new
+        ``version``. Only committed changes are sent (see
+        ``features.catalog``). Responses carry a weak ETag of the latest
+        committed version, so an unchanged catalog answers ``If-None-Match``
+        with 304.
+        """
+        try:
+            since = max(0, int(request.query_params.get('since', 0)))
+            limit = min(max(1, int(request.query_params.get('limit', CATALOG_SYNC_LIMIT))), CATALOG_SYNC_MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "since and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        upto = committed_catalog_version()
+        etag = f'W/"catalog-{since}-{limit}-{upto}"'
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            payload = catalog_changes(since, limit, upto)
+            body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+            response = HttpResponse(content_type='application/json')
+            if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+                body = gzip.compress(body, compresslevel=6)
+                response['Content-Encoding'] = 'gzip'
+            response.content = body
+            logger.info(f"Catalog sync for user {request.user} from version {since} to {payload['version']}.")
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='sync-catalog/snapshot', permission_classes=[IsAuthenticated])
+    def catalog_snapshot(self, request):
+        """
+        Full catalog as a prebuilt gzip NDJSON file (see ``features.snapshot``).
+        Supports ``Range``/``If-Range`` so an interrupted download can resume;
+        the ``Catalog-Version`` header is the ``since`` for the next delta sync.
+        The latest snapshot built by ``build_catalog_snapshot`` is served.
+        """
+        snapshot = latest_snapshot()
+        if snapshot is None:
+            response = Response(
+                {"error": "Catalog snapshot is not available yet."}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = '60'
+            return response
+        version, path = snapshot
+        # Named by version and change counter, so it changes with the file.
+        etag = f'"{path.name}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = _ranged_file_response(request, path, etag)
+            response['Content-Disposition'] = f'attachment; filename="{path.name}"'
+        response['ETag'] = etag
+        response['Catalog-Version'] = str(version)
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     
     #Go offline functionality in UserControls
     @action(detail=False, methods=['post'], url_path='go-offline', permission_classes=[AllowAny], serializer_class=GoOfflineSerializer)